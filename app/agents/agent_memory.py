@@ -0,0 +1,121 @@
+import re
+import logging
+from typing import Optional
+from uuid import UUID
+
+from app import models
+from app.core.config import settings
+from app.llm.llm_manager import get_llm
+
+logger = logging.getLogger(__name__)
+
+# key of a state update that replaces the message window instead of appending to it
+WINDOW_KEY = "__window__"
+
+
+def window_messages(existing: list[dict], update) -> list[dict]:
+    """
+    Reducer of AgentState.messages: lists are appended (like operator.add),
+    {WINDOW_KEY: [...]} replaces the window after older messages were moved out of the state.
+    """
+    if isinstance(update, dict) and WINDOW_KEY in update:
+        return list(update[WINDOW_KEY])
+    return (existing or []) + list(update or [])
+
+
+def _message_text(message) -> tuple[str, str]:
+    if isinstance(message, dict):
+        return message.get("role", ""), message.get("content", "") or ""
+    return getattr(message, "type", ""), getattr(message, "content", "") or ""
+
+
+def summarize_locally(summary: str, evicted: list[dict], max_chars: Optional[int] = None) -> str:
+    """Rolling summary without LLM: first sentence of every evicted message, oldest lines drop out at max_chars"""
+    max_chars = max_chars or settings.MEMORY_SUMMARY_CHARS
+    lines = summary.splitlines() if summary else []
+    for message in evicted:
+        role, content = _message_text(message)
+        first = re.split(r"(?<=[.!?])\s|\n", content.strip(), maxsplit=1)[0]
+        if first:
+            lines.append(f"{role}: {first[:160]}")
+
+    while lines and sum(len(line) + 1 for line in lines) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+def render_context(summary: str, messages: list[dict], max_chars: Optional[int] = None) -> str:
+    """Conversation context for the prompts: summary of older turns plus the recent messages (at most max_chars)"""
+    max_chars = max_chars or settings.MEMORY_CONTEXT_CHARS
+    recent = "\n".join("{}: {}".format(*_message_text(message)) for message in messages)
+    if len(recent) > max_chars:
+        recent = recent[-max_chars:]  # keep the conversation short
+    if not summary:
+        return recent
+    return f"Summary of the earlier conversation:\n{summary}\n\nRecent messages:\n{recent}"
+
+
+class ConversationMemory:
+    """
+    Bounded conversation memory of a chat session.
+    The agent state keeps the last MEMORY_WINDOW_MESSAGES messages and a rolling summary;
+    older messages are moved to the messages table and don't end up in every checkpoint.
+    """
+
+    def __init__(self, db, session_id, commit: bool = True):
+        self.db = db
+        self.session_id = session_id if isinstance(session_id, UUID) else UUID(str(session_id).strip())
+        self.commit = commit # False: the caller commits (see ChatContext.finish)
+
+    async def compact(self, messages: list[dict], summary: str, model: str) -> Optional[dict]:
+        """
+        Move messages beyond the window out of the state.
+        Returns the state update (new window + summary) or None if the window isn't full yet.
+        """
+        window = settings.MEMORY_WINDOW_MESSAGES
+        if len(messages) <= window:
+            return None
+
+        evicted, kept = messages[:-window], messages[-window:]
+        self.archive(evicted)
+        summary = await self.summarize(summary, evicted, model)
+        logger.info(f"ConversationMemory: archived {len(evicted)} messages, summary {len(summary)} chars")
+        return {"messages": {WINDOW_KEY: kept}, "summary": summary}
+
+    def archive(self, messages: list[dict]):
+        """Store messages in the messages table"""
+        rows = []
+        for message in messages:
+            role, content = _message_text(message)
+            rows.append(models.Message(session_id=self.session_id, role=role or "assistant", content=content))
+        self.db.add_all(rows)
+        if self.commit:
+            self.db.commit()
+
+    async def summarize(self, summary: str, evicted: list[dict], model: str) -> str:
+        """Fold evicted messages into the summary (MEMORY_SUMMARY_MODE=llm asks the model, else local)"""
+        if settings.MEMORY_SUMMARY_MODE == "llm":
+            try:
+                conversation = "\n".join("{}: {}".format(*_message_text(message)) for message in evicted)
+                prompt = {
+                    "system_prompt": f"""Update the summary of a conversation about tactical puzzles with the new messages.
+                    Keep names, numbers and decisions. Return ONLY the summary, at most {settings.MEMORY_SUMMARY_CHARS} characters.
+
+                    ### SUMMARY SO FAR ###
+                    {summary or "-"}""",
+                    "user_prompt": conversation,
+                }
+                new_summary = await get_llm(model).chat(prompt)
+                if new_summary:
+                    return new_summary[-settings.MEMORY_SUMMARY_CHARS:]
+            except Exception as e:
+                logger.warning(f"ConversationMemory: LLM summary failed, summarizing locally: {e}")
+        return summarize_locally(summary, evicted)
+
+    def archived(self) -> list[dict]:
+        """Messages that were moved out of the state, oldest first"""
+        rows = (self.db.query(models.Message.role, models.Message.content)
+                .filter(models.Message.session_id == self.session_id)
+                .order_by(models.Message.id)
+                .all())
+        return [{"role": role, "content": content} for role, content in rows]
@@ -0,0 +1,101 @@
+import re
+import logging
+from typing import Optional, Union
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def needs_llm(hop: str) -> bool:
+    """
+    True if an agent hop should call a model.
+    With AGENT_EXECUTION_MODE=llm every hop does, with "templated" only the hops flagged in AGENT_LLM_HOPS.
+    """
+    if settings.AGENT_EXECUTION_MODE != "templated":
+        return True
+    return settings.AGENT_LLM_HOPS.get(hop, True)
+
+
+# ---------- templated tool results ----------
+
+MISSING_INFO_LABELS = {
+    "name": "a name",
+    "game_mode": "the game mode (skirmish or safe travel)",
+    "node_count": "the number of nodes",
+    "edge_count": "the number of edges",
+    "turns": "the number of turns",
+    "units": "the units (type, faction and count)",
+    "player unit": "at least one player unit",
+    "enemy unit": "at least one enemy unit",
+}
+
+
+def _missing_info(match: re.Match) -> str:
+    missing = [MISSING_INFO_LABELS.get(key.strip(), key.strip()) for key in match["missing"].split(",") if key.strip()]
+    return "I need a few more details before I can create the puzzle:\n" + "\n".join(f"- {item}" for item in missing)
+
+
+def _generated(match: re.Match) -> str:
+    name = (match["name"] or "").strip()
+    return f"Your puzzle {name} is ready and open in the editor." if name else "Your puzzle is ready and open in the editor."
+
+
+# (pattern, template) of the results and known errors of the tools, first match wins
+TOOL_RESULT_TEMPLATES = [
+    (r"following infos are still missing: (?P<missing>.+?)\. Ask user", _missing_info),
+    (r"Puzzle(?P<name> .*?)? generated successfully", _generated),
+    (r"Could not apply the change: (?P<error>.+)",
+     "I couldn't apply that change: {error}. Nothing was saved, try to describe it differently."),
+    (r"No puzzle ID found",
+     "There is no puzzle selected yet. Select a puzzle in the sidebar or ask me to create a new one."),
+    (r"No messages found", "I didn't get a message to work with. What should I change?"),
+    (r"Error fetching puzzle", "I couldn't load the current puzzle. It may have been deleted."),
+    (r"Could not (?:generate|create) (?:a )?[Pp]uzzle\. Error: (?P<error>.+)",
+     "The puzzle could not be generated ({error}). Please try again or change your request."),
+    (r"Could not load LLM chat response: (?P<error>.+)",
+     "The model didn't answer ({error}). Please try again."),
+    (r"Error(?: while [\w ]+)?: (?P<error>.+)", "Something went wrong: {error}"),
+]
+_TEMPLATES = [(re.compile(pattern, re.DOTALL), template) for pattern, template in TOOL_RESULT_TEMPLATES]
+
+# tool prefixes like "Chat_agent.collect_info: " or "update_puzzle: "
+_TOOL_PREFIX = re.compile(r"^(?:\s*[A-Za-z]+[_.][\w.]*:\s*|\s*:\s*)+")
+
+
+def render_tool_result(result: str) -> str:
+    """One tool result as user facing message (no LLM)"""
+    for pattern, template in _TEMPLATES:
+        match = pattern.search(result)
+        if match:
+            return template(match) if callable(template) else template.format(**match.groupdict())
+    return _TOOL_PREFIX.sub("", result).strip()
+
+
+def render_tool_results(tool_result: Union[list[str], str]) -> str:
+    """All tool results of a turn as one message"""
+    results = [tool_result] if isinstance(tool_result, str) else tool_result
+    return "\n\n".join(render_tool_result(result) for result in results if result)
+
+
+# ---------- rule based intent ----------
+
+INTENT_HINTS = {
+    "modify": r"\b(add|remove|delete|move|change|connect|disconnect|update|fix|replace|swap|increase|decrease|"
+              r"reduce|shift|set|put|rename|extend|shorten)\b",
+    "create": r"\b(create|build|design|make)\b.*\b(puzzle|map|level)\b|\b\d+\s+(nodes?|edges?|turns?|units?)\b",
+    "generate": r"\b(generate|random|surprise)\b",
+    "chat": r"^\s*(what|why|how|who|when|where|which|is|are|does|do|explain|describe|tell|hi|hello|hey|thanks?)\b",
+}
+_INTENT_HINTS = {intent: re.compile(pattern, re.IGNORECASE) for intent, pattern in INTENT_HINTS.items()}
+
+
+def classify_intent_locally(message: str, options: list[str]) -> Optional[str]:
+    """
+    Intent from keyword hints, limited to the options the current state allows.
+    Returns None if no or more than one option matches, the caller then asks the LLM.
+    """
+    matches = [intent for intent in options if _INTENT_HINTS[intent].search(message or "")]
+    if len(matches) == 1:
+        return matches[0]
+    return None
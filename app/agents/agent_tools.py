@@ -1,136 +1,160 @@
+import asyncio
 import json
 from langgraph.types import Command
 from langgraph.graph import END
-from deepdiff import DeepDiff
 from app.prompts.prompt_game_rules import BASIC_RULES
-from app.schemas import PuzzleGenerate, PuzzleCreate
+from app.prompts.prompt_manager import puzzle_context_format
+from app.prompts.puzzle_encoding import encode_puzzle, use_compact_format, request_puzzle
+from app.schemas import PuzzleGenerate, PuzzleCreate, PuzzleEditResponse
+from app.core.config import settings
 
 from app.llm.llm_manager import get_llm
 from uuid import UUID
 from typing import Any, Union
 from app.models import Puzzle
+from app.core.puzzle_graph import PuzzleGraph
+from app.core.tracing import span
+from app.core.puzzle_diff import PuzzleChange, diff_puzzles, summarize_changes
+from app.services.puzzle_edits import PuzzleEditError
+from app.agents.agent_responses import needs_llm
 import logging
+from utils.logger_config import payload, sampled
 logger = logging.getLogger(__name__)
 
 
+EDIT_OPS_INSTRUCTIONS = """
+        Do NOT return the whole puzzle. Return ONLY the edit operations (PuzzleEditResponse) that turn the
+        current puzzle into the requested one, applied in order:
+        - {"op": "add_node", "node": <new node index>, "x": <x>, "y": <y>}
+        - {"op": "remove_node", "node": <node index>} (also removes its edges; change unit paths that use the node first)
+        - {"op": "move_node", "node": <node index>, "x": <new x>, "y": <new y>}
+        - {"op": "add_edge", "start": <node index>, "end": <node index>}
+        - {"op": "remove_edge", "edge": <edge index>} or {"op": "remove_edge", "start": <node index>, "end": <node index>}
+        - {"op": "set_unit_path", "unit": <position of the unit in the unit list, starting at 0>, "path": [<node indexes>]}
+        Set "coins" or "description" only if they change. Return an empty ops list if the map doesn't change.
+        """
+
+
 class AgentTools:
 
     def __init__(self, db):
-        self.db = db
+        self.db = db # sync session: queries and writes run in a worker thread, not on the event loop
 
     async def generate_puzzle(self, puzzle_config: PuzzleGenerate) -> UUID:
         """ Generate a new puzzle"""
         from app.services import PuzzleServices
+        from app.services.puzzle_services import generate_puzzle_from_examples
         services = PuzzleServices(self.db)
-        puzzle_generated = await services.generate_puzzle(puzzle_config)
+        examples = await asyncio.to_thread(services.get_serialized_examples, puzzle_config.game_mode)
+        puzzle_generated, _ = await generate_puzzle_from_examples(puzzle_config, examples)
 
         if puzzle_generated is None:
             raise Exception("agent_tool.generate_puzzle: Failed to generate puzzle data from LLM.")
 
-        new_puzzle = services.create_puzzle(puzzle_generated)
-        return new_puzzle.id
-
-
-    async def _get_node_index(self, node_id, puzzle) -> Union[int, dict]:
-        """Take in node ID and Puzzle Object and return index of node with node_id"""
-
-        current_tool = "agent_tools.generate_puzzle:"
-        logger.debug(f"Start/End node ID: {node_id}")
-        for node in puzzle.nodes:
-            if str(node.id) == str(node_id):
-                logger.debug(f"{current_tool} Node ID: {node.id} matches with node ID: {node_id}")
-                return node.node_index
-        logger.warning(f"{current_tool} No index found for node {node_id}")
-        return {"tool_result": "can not find index"}
+        return await asyncio.to_thread(lambda: services.create_puzzle(puzzle_generated).id)
 
 
-    async def serialize_puzzle_obj_for_llm(self, puzzle: Puzzle, model) -> json:
-        """Serialize a Puzzle object to LLM readable json"""
+    async def serialize_puzzle_obj_for_llm(self, puzzle: Union[Puzzle, PuzzleGraph], model) -> json:
+        """Serialize a Puzzle object or PuzzleGraph to LLM readable json (compact text with PUZZLE_PROMPT_FORMAT=compact)"""
         current_tool = "agent_tools.serialize_puzzle_obj_for_llm:"
 
-        current_puzzle = Puzzle
         logger.debug(f"{current_tool} serialise puzzle...")
         try:
-            current_puzzle = {
-                "name": puzzle.name,
-                "model": model,
-                "game_mode": puzzle.game_mode,
-                "coins": puzzle.coins,
-                "nodes": [
-                    {
-                        "index": node.node_index,
-                        "x": node.x_position,
-                        "y": node.y_position,
-                    }
-                    for node in sorted(puzzle.nodes, key=lambda n: n.node_index)
-                ],
-                "edges": [
-                    {
-                        "index": edge.edge_index,
-                        # go through node UUIDs of the current puzzle and compare with start_node_id/ end_node_id
-                        # to get the index of the node
-                        "start": await self._get_node_index(str(edge.start_node_id), puzzle),
-                        "end": await self._get_node_index(str(edge.end_node_id), puzzle),
-                    }
-                    for edge in sorted(puzzle.edges, key=lambda e: e.edge_index)
-                ],
-                "units": [
-                    {
-                        "type": unit.unit_type,
-                        "faction": unit.faction,
-                        "path": (
-                            [
-                                # get node index for nodes of the path
-                                # and sort them to keep it in the right order
-                                path_node.node_index for path_node in
-                                sorted(unit.path.path_node, key=lambda pn: pn.order_index)
-                            ]),
-                    }
-                    for unit in puzzle.units
-                ],
-                "description": puzzle.description,
-            }
-            #print(f"{current_tool} puzzle serialised")
+            with span("serialize", "puzzle_context"):
+                graph = puzzle if isinstance(puzzle, PuzzleGraph) else PuzzleGraph.from_orm(puzzle)
+                if use_compact_format():
+                    return encode_puzzle(graph.to_llm_dict(model))
+                logger.info(f"{current_tool} convert to JSON...")
+                return json.dumps(graph.to_llm_dict(model))
 
         except Exception as e:
             logger.error(f"{current_tool} Error serialising puzzle: {e}")
 
 
-        # convert puzzle in to JSON
-        try:
-            logger.info(f"{current_tool} convert to JSON...")
-            current_puzzle_json = json.dumps(current_puzzle)
-            return current_puzzle_json
+    async def extract_puzzle_diff(self, puzzle_a: Union[PuzzleGraph, dict], puzzle_b: Union[PuzzleGraph, dict]) -> list[PuzzleChange]:
+        """Extract typed differences from puzzle a to puzzle b"""
+        return diff_puzzles(puzzle_a, puzzle_b)
 
-        except Exception as e:
-            logger.error(f"{current_tool} Error converting puzzle: {e}")
 
+    def _modify_prompt(self, puzzle_json: str, output_instructions: str) -> str:
+        return f"""
+        You are an assistant who extracts puzzle modification parameters from this message.
+        
+        ### CURRENT PUZZLE CONTEXT ###
+            {puzzle_json}
+        ##############################
+        {puzzle_context_format()}
+        
+        ### PUZZLE RULES ###
+            {BASIC_RULES}
+        ####################
+        
+        Analyse the existing puzzle context data above.
+        Use the existing puzzle data to understand what kind of data have do added, deleted, changed or modified.
+        
+        Use the puzzle rules to understand how the puzzle works and what and how it has to be modified.
+        Mind the rules above while adding modifications to the existing puzzle data.
+        
+        If the user asks to generate a description.
+        Analyse the given puzzle data and rules to generate a detailed description of the current puzzle what happens turn by turn .
+        Add the description to 'description' field of the current puzzle.
+        
+        {output_instructions}
+        """
+
+
+    async def _modify_with_full_puzzle(self, llm, puzzle: PuzzleGraph, puzzle_json: str, message: str, model: str, puzzle_services):
+        """ LLM returns the complete modified puzzle, which replaces the stored one"""
+        current_tool = "update_puzzle: "
+        output_instructions = ("Return ONLY the complete modified puzzle in the compact puzzle format." if use_compact_format()
+                               else f"Return ONLY a valid JSON object conforming to this Pydantic schema: {PuzzleCreate}")
+        prompt = {"system_prompt": self._modify_prompt(puzzle_json, output_instructions), "user_prompt": message}
+
+        logger.info(f"{current_tool} Extracting data from user message and modifying existing puzzle data...")
+        try:
+            updated_puzzle_data = await request_puzzle(
+                llm, prompt, PuzzleCreate, name=puzzle.name, model=model, game_mode=puzzle.game_mode)
+            if not updated_puzzle_data:
+                logger.error(f"{current_tool} Failed to generate modified puzzle data")
+                raise Exception("Failed to generate modified puzzle data")
 
-    async def extract_puzzle_diff(self, puzzle_a: dict, puzzle_b: dict) -> list:
-        """Extract differences from puzzle a to puzzle b"""
+            logger.info(f"{current_tool} Updating current puzzle data...")
+            await asyncio.to_thread(puzzle_services.update_puzzle, puzzle_id=puzzle.id, puzzle_data=updated_puzzle_data)
+            logger.info(f"{current_tool} Successfully updated puzzle data")
 
-        # Compare
-        diff = DeepDiff(puzzle_a, puzzle_b, ignore_order=True)
+        except Exception as e:
+            logger.error(f"{current_tool} Failed to update puzzle data: {e}")
+            return {"tool_result": [f"{current_tool} Error: {e}"]}
 
-        # Convert to a flat list of messages
-        diff_list = []
+        return await asyncio.to_thread(puzzle_services.get_puzzle_graph, puzzle.id)
 
-        # value_changed is for keys that exist in both but have different values
-        if 'values_changed' in diff:
-            for path, change in diff['values_changed'].items():
-                diff_list.append(f"Updated {path}: {change['old_value']} -> {change['new_value']}")
 
-        # dictionary_item_added is for new keys
-        if 'dictionary_item_added' in diff:
-            for path in diff['dictionary_item_added']:
-                diff_list.append(f"Added field: {path}")
+    async def _modify_with_edits(self, llm, puzzle: PuzzleGraph, puzzle_json: str, message: str, puzzle_services):
+        """ LLM returns a small list of typed edit operations, which are validated and applied locally"""
+        current_tool = "update_puzzle: "
+        prompt = {"system_prompt": self._modify_prompt(puzzle_json, EDIT_OPS_INSTRUCTIONS), "user_prompt": message}
+
+        logger.info(f"{current_tool} Extracting edit operations from user message...")
+        try:
+            edit = await llm.structured(prompt=prompt, schema=PuzzleEditResponse)
+            if not edit:
+                raise Exception("Failed to generate edit operations")
+            logger.info(f"{current_tool} Applying {len(edit.ops)} edit operations...")
+            puzzle_updated, applied = await asyncio.to_thread(puzzle_services.apply_edits, puzzle.id, edit)
+
+        except PuzzleEditError as e:
+            logger.warning(f"{current_tool} Invalid edit operation: {e}")
+            return {"tool_result": [f"{current_tool} Could not apply the change: {e}"]}
+        except Exception as e:
+            logger.error(f"{current_tool} Failed to update puzzle data: {e}")
+            return {"tool_result": [f"{current_tool} Error: {e}"]}
 
-        # iterable_item_added is for new items in lists
-        if 'iterable_item_added' in diff:
-            for path in diff['iterable_item_added']:
-                 diff_list.append(f"Added to list: {path}")
+        if not applied:
+            message = [{"role": "assistant", "content": "The puzzle already matches your request, nothing was changed."}]
+            return Command(update={"messages": message}, goto=END)
 
-        return diff_list
+        logger.info(f"{current_tool} Applied: {applied}")
+        return puzzle_updated
 
 
     async def update_puzzle(
@@ -152,7 +176,7 @@ class AgentTools:
         logger.debug(f"{current_tool} Get puzzle by ID")
         try:
             # get puzzle by id
-            puzzle = puzzle_services.get_puzzle_by_id(puzzle_id)
+            puzzle = await asyncio.to_thread(puzzle_services.get_puzzle_graph, puzzle_id)
         except Exception as e:
             logger.error(f"{current_tool} Error fetching puzzle: {e}")
             return {f"tool_result": [f"{current_tool} Error fetching puzzle: {e}"]}
@@ -162,86 +186,32 @@ class AgentTools:
 
         # update existing puzzle
         llm = get_llm(model)
-        system_prompt = f"""
-        You are an assistant who extracts puzzle modification parameters from this message.
-        
-        ### CURRENT PUZZLE CONTEXT ###
-            {puzzle_json}
-        ##############################
-        
-        ### PUZZLE RULES ###
-            {BASIC_RULES}
-        ####################
-        
-        Analyse the existing puzzle context data above.
-        Use the existing puzzle data to understand what kind of data have do added, deleted, changed or modified.
-        
-        Use the puzzle rules to understand how the puzzle works and what and how it has to be modified.
-        Mind the rules above while adding modifications to the existing puzzle data.
-        
-        If the user asks to generate a description.
-        Analyse the given puzzle data and rules to generate a detailed description of the current puzzle what happens turn by turn .
-        Add the description to 'description' field of the current puzzle.
-        
-        Return ONLY a valid JSON object conforming to this Pydantic schema: {PuzzleCreate}
-        """
-        prompt = {"system_prompt": system_prompt, "user_prompt": message}
-
-        logger.info(f"{current_tool} Extracting data from user message and modifying existing puzzle data...")
-        try:
-            updated_puzzle_data = await llm.structured(prompt=prompt, schema=PuzzleCreate)
-            if not updated_puzzle_data:
-                logger.error(f"{current_tool} Failed to generate modified puzzle data")
-                raise Exception("Failed to generate modified puzzle data")
-
-            puzzle_updated = None
-            if updated_puzzle_data:
-                logger.info(f"{current_tool} Updating current puzzle data...")
-                puzzle_updated = puzzle_services.update_puzzle(
-                    puzzle_id=puzzle_id,
-                    puzzle_data=updated_puzzle_data)
-                if not puzzle_updated:
-                    raise Exception(f"{current_tool} Failed to update existing puzzle data.")
-
-            logger.info(f"{current_tool} Successfully updated puzzle data")
-
-        except Exception as e:
-            logger.error(f"{current_tool} Failed to update puzzle data: {e}")
-            return {"tool_result": [f"{current_tool} Error: {e}"]}
-
-        # generate tool result message
-        logger.info(f"Generate tool result:")
-        puzzle_updated_json = await self.serialize_puzzle_obj_for_llm(puzzle_updated, model)
-        if not puzzle_updated_json:
-            logger.error(f"{current_tool} convert to json failed")
-            return {"tool_result": [f"{current_tool}: Error: {e}"]}
+        if settings.PUZZLE_MODIFY_MODE == "patch":
+            result = await self._modify_with_edits(llm, puzzle, puzzle_json, message, puzzle_services)
+        else:
+            result = await self._modify_with_full_puzzle(llm, puzzle, puzzle_json, message, model, puzzle_services)
+        if not isinstance(result, PuzzleGraph):
+            return result  # error or nothing to change
+        puzzle_updated = result
 
         ## compare puzzles and extract changes
         try:
             logger.info(f"{current_tool} extract changes...")
 
-            # convert old puzzle from json to dict
-            puzzle_dict = json.loads(puzzle_json)
-            if not puzzle_dict:
-                raise Exception("Failed to convert 'puzzle_json' to puzzle_dic")
-
-            # convert updated puzzle json to dict
-            puzzle_updated_dict = json.loads(puzzle_updated_json)
-            if not puzzle_updated_dict:
-                raise Exception("Failed to convert 'puzzle_json' to puzzle_dic")
-
             # extract differences from old and new puzzle
-            puzzle_changes = await self.extract_puzzle_diff(puzzle_dict, puzzle_updated_dict) # extract differences
-            puzzle_changes = "\n".join(puzzle_changes) # join differences (list) to string
-            if not puzzle_changes:
-                raise Exception("Failed to extract differences from puzzle_dict and puzzle_updated_dict")
-
-            logger.info(f"{current_tool} Extracted changes: {puzzle_changes}")
+            changes = await self.extract_puzzle_diff(puzzle, puzzle_updated)
+            puzzle_changes = "\n".join(change.describe() for change in changes) # join differences (list) to string
+            logger.info("%s Extracted changes: %s", current_tool, payload(puzzle_changes), extra=sampled("puzzle"))
 
         except Exception as e:
             logger.error(f"{current_tool} Failed to extract changes: {e}")
             return {"tool_result": [f"{current_tool} Failed to extract changes: {e}"]}
 
+        # summary rendered locally, no second LLM call
+        if settings.PUZZLE_CHANGE_SUMMARY == "local" or not needs_llm("modify_summary") or not changes:
+            message = [{"role": "assistant", "content": summarize_changes(changes, puzzle_updated)}]
+            return Command(update={"messages": message}, goto=END)
+
         logger.info(f"{current_tool} Generating tool response...")
         try:
             system_prompt_summary = f"""
@@ -261,7 +231,7 @@ class AgentTools:
             if not tool_summary:
                 raise Exception(f"{current_tool} Failed to generate summary data: ")
 
-            logger.info(f"{current_tool} Generated tool response: \n{tool_summary}")
+            logger.info("%s Generated tool response: \n%s", current_tool, payload(tool_summary), extra=sampled("llm_response"))
             message = [{"role": "assistant", "content": tool_summary}]
             return Command(
                 update={"messages":  message},
@@ -280,9 +250,11 @@ class AgentTools:
             return UUID(val.strip())
         return val
 
-    def validate_puzzle(self):
-        """ Validate an existing puzzle"""
-        pass
+    def validate_puzzle(self, puzzle_id: Union[UUID, str]) -> list[str]:
+        """ Validate an existing puzzle. Returns a list of rule violations (empty if valid)"""
+        from app.services import PuzzleServices
+        graph = PuzzleServices(self.db).get_puzzle_graph(self.ensure_uuid(puzzle_id))
+        return graph.validate()
 
     def delete_puzzle(self):
         """ Delete an existing puzzle"""
@@ -1,15 +1,17 @@
-import operator
 from typing import Annotated, List, TypedDict, Optional, Any
 from uuid import UUID
 from langgraph.graph import END, START, StateGraph
 from langgraph.types import Command
 from pydantic import BaseModel
 
+import asyncio
+import functools
 import json
 import logging
+import time
 
 from app import models
-from utils.logger_config import configure_logging
+from utils.logger_config import configure_logging, payload, sampled
 
 # MemorySave works only for sync environment
 # therefor I use AsyncSqliteSaver to async store checkpoints
@@ -29,11 +31,20 @@ from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
 
 from app.models import Session
 from app.agents.agent_tools import AgentTools
+from app.agents.agent_responses import needs_llm, render_tool_results, classify_intent_locally
+from app.agents.agent_memory import ConversationMemory, WINDOW_KEY, window_messages, render_context
+from app.agents.puzzle_reference import PuzzleContextResolver, puzzle_reference
 from app.llm.llm_manager import get_llm
+from app.llm.cassette import current_cassette, record_turn
 from app.services import PuzzleServices, SessionService
 from app.schemas import PuzzleCreate, PuzzleLLMResponse, PuzzleGenerate
 from app.prompts.prompt_game_rules import BASIC_RULES
+from app.prompts.prompt_manager import puzzle_output_format, puzzle_context_format, format_example_puzzles
+from app.prompts.puzzle_encoding import request_puzzle
 from app.core.config import settings
+from app.core.tracing import current_node, trace_methods
+from app.core.metrics import agent_node_duration
+from app.core.usage_ledger import usage_scope
 
 
 # get logger
@@ -48,7 +59,9 @@ TOOL_DESCRIPTION = """
 
 
 class AgentState(TypedDict):
-    messages: Annotated[List[dict[str, str]], operator.add]
+    messages: Annotated[List[dict[str, str]], window_messages] # recent messages, older ones are archived (see agent_memory.py)
+    summary: Optional[str] # rolling summary of the archived messages
+    conversation: Optional[str] # summary + recent messages, prepared once per turn for the prompts
     user_intent: Optional[str] # "generate", "create", "modify", "chat"
     collected_info: dict[str, Any] # "game_mode", "node_count", "enemy_unit_count", "enemy_type", "player_unit_count", "description"
     current_puzzle_id: Optional[UUID] # if puzzle generated and stored get id
@@ -56,19 +69,23 @@ class AgentState(TypedDict):
     final_response: Optional[str] # final response for user
     session_id: UUID
     model: str # model used... pass llm_manager.py
-    puzzle: Optional[str] # serialized puzzle
+    puzzle_ref: Optional[dict] # {"id"} of the current puzzle, serialized only when a node needs it
 
 class ChatAgent:
     """ LangGraph Chat Agent to handel puzzle related content"""
     print("Initialize chat agent")
-    def __init__(self, db: Session, session_id: str, model: str) -> None:
+    def __init__(self, db: Session, session_id: str, model: str, context=None) -> None:
         self.db = db
         self.session_id = session_id
         self.model = model
+        self.context = context # ChatContext of the current request (see app/services/chat_context.py)
         self.tools = AgentTools(db)
+        self.node_timings: list[tuple[str, float]] = [] # (node, seconds) of the latest turn
         self.workflow = self.build_graph()
         self.session_services = SessionService(self.db)
         self.puzzle_services = PuzzleServices(self.db)
+        self.memory = ConversationMemory(self.db, self.session_id, commit=context is None)
+        self.puzzles = PuzzleContextResolver(self.db, preloaded=context.puzzle_graph if context is not None else None)
 
 
     async def get_history(self):
@@ -91,7 +108,8 @@ class ChatAgent:
 
                 logger.info("get_history: return messages to router")
                 if state.values and "messages" in state.values:
-                    return state.values["messages"]
+                    # archived messages first, then the window of the state
+                    return await asyncio.to_thread(self.memory.archived) + state.values["messages"]
                 else:
                     return None
 
@@ -109,16 +127,18 @@ class ChatAgent:
         builder = StateGraph(AgentState)
 
         # Nodes
-        builder.add_node("intent", self._classify_intent)
-        builder.add_node("chat", self._chat)
-        builder.add_node("collect_info", self._collect_info)
-        builder.add_node("collect_and_create", self._collect_and_creates_puzzle)
-        builder.add_node("generate", self.tools.generate_puzzle)
-        builder.add_node("format_response", self.format_response)
-        builder.add_node("modify_puzzle", self._modify_puzzle)
+        builder.add_node("memory", self._timed("memory", self._memory))
+        builder.add_node("intent", self._timed("intent", self._classify_intent))
+        builder.add_node("chat", self._timed("chat", self._chat))
+        builder.add_node("collect_info", self._timed("collect_info", self._collect_info))
+        builder.add_node("collect_and_create", self._timed("collect_and_create", self._collect_and_creates_puzzle))
+        builder.add_node("generate", self._timed("generate", self.tools.generate_puzzle))
+        builder.add_node("format_response", self._timed("format_response", self.format_response))
+        builder.add_node("modify_puzzle", self._timed("modify_puzzle", self._modify_puzzle))
 
         # Edges
-        builder.add_edge(START, "intent")
+        builder.add_edge(START, "memory")
+        builder.add_edge("memory", "intent")
         builder.add_conditional_edges("intent", self._intent,
                                       {
                                           "generate" : "collect_and_create",
@@ -135,26 +155,67 @@ class ChatAgent:
         return builder
 
 
+    def _timed(self, name: str, node):
+        """ Node wrapper that appends its run time to self.node_timings and tags LLM calls with the node (tracing)"""
+        @functools.wraps(node)
+        async def run(state):
+            started = time.perf_counter()
+            token = current_node.set(name)
+            try:
+                return await node(state)
+            finally:
+                current_node.reset(token)
+                seconds = time.perf_counter() - started
+                self.node_timings.append((name, seconds))
+                agent_node_duration.observe(seconds, node=name)
+        return run
+
+
+    async def _memory(self, state: AgentState) -> AgentState:
+        """ Keep the message window bounded and prepare the conversation context of the turn"""
+        messages = state.get("messages") or []
+        summary = state.get("summary") or ""
+
+        update = await self.memory.compact(messages, summary, state["model"]) or {}
+        if update:
+            messages, summary = update["messages"][WINDOW_KEY], update["summary"]
+
+        update["conversation"] = render_context(summary, messages)
+        return update
+
+
+    def _load_example_graphs(self) -> list:
+        """Graphs of the working puzzles (few shot examples), runs in a worker thread"""
+        example_ids = self.db.query(models.Puzzle.id).filter(models.Puzzle.is_working == True).all()
+        return self.puzzle_services.get_puzzle_graphs([example_id for (example_id,) in example_ids])
+
+
+    def _create_puzzle(self, puzzle_config: PuzzleCreate) -> tuple[UUID, str]:
+        """Store a new puzzle, runs in a worker thread (id and name are read before the session expires them)"""
+        puzzle = self.puzzle_services.create_puzzle(puzzle_config)
+        return puzzle.id, puzzle.name
+
+
+    def _link_puzzle(self, puzzle_id: UUID):
+        """Link a new puzzle to the session. With a request context it's written with the turn's commit"""
+        if self.context is not None:
+            self.context.link_puzzle(puzzle_id)
+        else:
+            self.session_services.add_puzzle_id(puzzle_id, UUID(str(self.session_id).strip()))
+
+
     async def _classify_intent(self, state: AgentState)-> AgentState:
         """ Classify user intent from conversation"""
 
         logger.info("\n\nClassify intent...")
         logger.info("\nCurrent State: \n"
-              f"Current Puzzle ID: {state.get('current_puzzle_id')}\n"
-              f"Collected Infos: {state.get('collected_info')}\n"
-              f"Tool result: {state.get('tool_result')}\n"
-              f"Puzzle: {bool(state.get('puzzle'))}\n")
-
-        # Get llm
-        llm = get_llm(state["model"])
+                    "Current Puzzle ID: %s\nCollected Infos: %s\nTool result: %s\nPuzzle: %s\n",
+                    state.get('current_puzzle_id'), payload(state.get('collected_info')),
+                    payload(state.get('tool_result')), payload(state.get('puzzle_ref')),
+                    extra=sampled("agent_state"))
 
         last_message = state["messages"][-1] if state["messages"] else ""
 
-        # Get chat history
-        conversation = "\n".join([f"{message['role']}: {message['content']}" for message in state["messages"]])
-        if len(conversation) > 3000:
-            conversation = conversation[-3000]  # keep the conversation short
-
         logger.info(f"\nClassify intent from conversation.")
         intent_create = (" - create: The user wants to create a new puzzle "
                          "(mentions creating, new puzzle, nodes is..., edges should be...). ")
@@ -166,22 +227,32 @@ class ChatAgent:
 
         # If there is already a puzzle make sure to modify the existing puzzle
         if state.get("current_puzzle_id"):
+            options = ["modify", "chat"]
             intention = ("'modify', 'chat'\n\n"
                          f"{intent_modify}\n"
                          f"{intent_chat}\n")
         # When there are already collected puzzle data but no puzzle id make sure to go on with puzzle creation
         elif state.get("collected_info") and not state.get("current_puzzle_id"):
+            options = ["create", "chat"]
             intention = ("'create', 'chat'\n\n"
                          f"{intent_create}\n"
                          f"{intent_chat}\n")
         # When there is no puzzle and no collected data try to figur out what user wants.
         else:
+            options = ["create", "generate", "chat"]
             intention = ("'create', 'generate' and 'chat'\n\n"
                          f"{intent_generate}\n"
                          f"{intent_chat}\n"
                          f"{intent_create}")
 
 
+        # templated mode: clear cases are classified by keywords, the LLM only gets the ambiguous ones
+        if settings.AGENT_EXECUTION_MODE == "templated":
+            intent = classify_intent_locally(last_message.get("content", ""), options)
+            if intent or not needs_llm("intent"):
+                logger.info(f"\nIntent classified without LLM: {intent or 'chat'}")
+                return {"user_intent": intent or "chat", "tool_result": []}
+
         system_prompt = f"""You are an intent classifier. Analyse user's massage and classify his intent.
         Return ONLY one word: {intention}
         If something is unclear, return 'chat' to clarify."""
@@ -194,11 +265,12 @@ class ChatAgent:
 
         # Simple async call
         logger.info("Analyse user's massage and classify his intent...")
+        llm = get_llm(state["model"])
         intent = await llm.chat(prompt)
         logger.info(f"\nLLM has classifies user intention: {intent}")
 
         return {
-            "user_intent": intent.lower(),
+            "user_intent": (intent or "chat").lower(), # no answer from the model: ask the user again
             "tool_result": [], # make sure tool result is reseted
                 }
 
@@ -215,8 +287,8 @@ class ChatAgent:
         llm = get_llm(state["model"])
 
         # get puzzle state
-        puzzle_context = state.get("puzzle")
-        if not puzzle_context or puzzle_context == {}:
+        puzzle_context = await self.puzzles.resolve(state.get("puzzle_ref"), state["model"])
+        if not puzzle_context:
             puzzle_context = "No puzzle data loaded. Ask the user to create or select a puzzle."
 
         collected_data = state.get("collected_info")
@@ -225,11 +297,9 @@ class ChatAgent:
 
         # Get user message
         last_message = state["messages"][-1]["content"] if state["messages"] else ""
-        logger.info(f"\nLast message sent to llm: {last_message}")
+        logger.info("\nLast message sent to llm: %s", payload(last_message), extra=sampled("agent_message"))
 
-        conversation = "\n".join([f"{message['role']}: {message['content']}" for message in state["messages"]])
-        if len(conversation) > 3000:
-            conversation = conversation[-3000:]  # keep the conversation short
+        conversation = state.get("conversation") or ""
         logger.info(f"\n conversation length: {len(conversation)}")
 
         # Create prompt
@@ -240,6 +310,7 @@ class ChatAgent:
             ### CURRENT PUZZLE CONTEXT ###
             {puzzle_context}
             ##############################
+            {puzzle_context_format()}
             
             ### Collected puzzle Data ###
             {collected_data}
@@ -278,7 +349,7 @@ class ChatAgent:
                 final_response = f"Ups! Something went wrong 😅 <br> Could not load the AI response from {state.get('model')}"
 
             # store response in state
-            logger.info(f"Llm response: {final_response}")
+            logger.info("Llm response: %s", payload(final_response), extra=sampled("llm_response"))
             messages = [{"role": "assistant", "content": final_response}]
 
             # for some reason Command seams to have a conflict with static graph
@@ -303,24 +374,20 @@ class ChatAgent:
         last_message = state["messages"][-1] if state["messages"] else ""
 
         # get conversation
-        conversation = "\n".join([f"{message['role']}: {message['content']}" for message in state["messages"]])
-        if len(conversation) > 2000:
-            conversation = conversation[-2000:]  # keep the conversation short
+        conversation = state.get("conversation") or ""
         logger.info(f"\n{current_tool} Collect and create a new puzzle...")
 
-        # get example puzzles from database
-        example_puzzles = self.db.query(models.Puzzle).filter(models.Puzzle.is_working == True).all()
+        # get example puzzles from database (in a worker thread, the session is sync)
+        example_graphs = await asyncio.to_thread(self._load_example_graphs)
 
-        if not example_puzzles:
+        if not example_graphs:
             logger.error(f"Could not get example puzzles.")
 
         # Serialize each puzzle to JSON format to use it as examples in few shot prompt
-        puzzle_services = PuzzleServices(self.db)
-
         serialized_examples = []
 
-        for puzzle in example_puzzles:
-            puzzle_json = self.tools.serialize_puzzle_obj_for_llm(puzzle, self.model)
+        for graph in example_graphs:
+            puzzle_json = await self.tools.serialize_puzzle_obj_for_llm(graph, self.model)
             # # Add metadata for context
             # serialized['name'] = puzzle.name
             # serialized['description'] = puzzle.description
@@ -354,51 +421,12 @@ class ChatAgent:
             You will create all nodes, edges, and paths for enemy units and player units.
             Since the paths of the player units are also the solution of each puzzle, you must provide the puzzle with the solution (how to place and move player units).            
             
-            ### Formating
-            You must always output valid JSON matching the PuzzleLLMResponse schema exactly.
-            
-            ### JSON Schema Definitions (TypeScript)
-            
-            interface PuzzleLLMResponse {{
-              name: string; // make up a name for the puzzle
-              nodes: NodeGenerate[];
-              edges: EdgeGenerate[];
-              units: UnitGenerate[];
-              coins: number;
-              description: string; // Describe moves in detail turn by turn. Use \\n for new paragraphs.
-            }}
-            
-            interface NodeGenerate {{
-              index: number;
-              x: number;
-              y: number;
-            }}
-            
-            interface EdgeGenerate {{
-              index: number; // Must be an integer
-              start: number; // Index of the start node
-              end: number;   // Index of the end node
-              // STRICTLY FORBIDDEN: Do NOT include 'x' or 'y' in edges.
-            }}
-            
-            interface UnitGenerate {{
-              type: string;
-              faction: string;
-              path: number[]; // List of node indices
-            }}
-            
-            ### Constraints
-            1. Return ONLY a valid JSON object conforming to the schema above.
-            2. Return no explanations, only raw JSON.
-            3. For Edges: strictly use keys 'index', 'start', 'end'. 
-            4. Do NOT use aliases like 'from', 'to', 'source', 'target'.
-            5. Do NOT include coordinates (x, y) in Edges.
-            6. Ensure each list is a JSON array ([...]), not an object with keys.
+            {puzzle_output_format()}
             
             ### Examples
-            {serialized_examples}
+            {format_example_puzzles(serialized_examples)}
             
-            These are example puzzles in JSON format. 
+            These are example puzzles. 
             Use these examples as reference for structure and puzzle design patterns."""
 
         prompt = {
@@ -409,13 +437,13 @@ class ChatAgent:
         # Simple async call
         puzzle_generated = None
         try:
-            logger.info(f"\n{current_tool} Calling LLM.structured() with PuzzleLLMResponse schema...")
-            puzzle_generated = await llm.structured(prompt=prompt, schema=PuzzleLLMResponse)
+            logger.info(f"\n{current_tool} Requesting puzzle with PuzzleLLMResponse schema...")
+            puzzle_generated = await request_puzzle(llm, prompt, PuzzleLLMResponse)
 
             if puzzle_generated is None:
                 raise Exception("LLM raise None for structured data")
 
-            logger.info(f"\n{current_tool} generated data: {puzzle_generated}")
+            logger.info("\n%s generated data: %s", current_tool, payload(puzzle_generated), extra=sampled("puzzle"))
 
 
             puzzle_config = PuzzleCreate(
@@ -431,22 +459,22 @@ class ChatAgent:
             if puzzle_config:
                 # Create new puzzle and store to database
                 logger.info(f"\n{current_tool} Create new puzzle...")
-                puzzle = self.puzzle_services.create_puzzle(puzzle_config)
+                puzzle_id, puzzle_name = await asyncio.to_thread(self._create_puzzle, puzzle_config)
                 logger.info(f"\n{current_tool} New Puzzle created successfully (collect and create node)")
 
                 # Add puzzle.id to current session
-                session_id = UUID(self.session_id.strip())
-                self.session_services.add_puzzle_id(puzzle.id, session_id)
+                self._link_puzzle(puzzle_id)
 
                 # Update state
-                logger.info(f"\nNew Puzzle created successfully (collect and create node). Puzzle ID: {puzzle.id}")
+                logger.info(f"\nNew Puzzle created successfully (collect and create node). Puzzle ID: {puzzle_id}")
 
                 # Add to tool result
-                tool_results.append(f"{current_tool} Puzzle {puzzle.name} generated successfully")
+                tool_results.append(f"{current_tool} Puzzle {puzzle_name} generated successfully")
 
                 return {
                     "tool_result": tool_results,
-                    "current_puzzle_id": str(puzzle_id) if puzzle_id else None
+                    "current_puzzle_id": str(puzzle_id),
+                    "puzzle_ref": puzzle_reference(puzzle_id),
                         }
 
         except Exception as e:
@@ -464,10 +492,8 @@ class ChatAgent:
 
         # TODO: add list for tool response
 
-        # get last message
-        conversation = "\n".join([f"{message['role']}: {message['content']}" for message in state["messages"]])
-        if len(conversation) > 3000:
-            conversation = conversation[-3000:]  # keep the conversation short
+        # get conversation
+        conversation = state.get("conversation") or ""
        
 
 
@@ -586,10 +612,11 @@ class ChatAgent:
                 return {"tool_result": f"{current_tool} Could not generate Puzzle. Error: {e}"}
 
             # Add puzzle.id to current session
-            self.session_services.add_puzzle_id(puzzle_id, UUID(self.session_id))
+            self._link_puzzle(puzzle_id)
 
             return {
                 "current_puzzle_id": puzzle_id,
+                "puzzle_ref": puzzle_reference(puzzle_id),
                 "tool_result": tool_response
             }
 
@@ -646,33 +673,40 @@ class ChatAgent:
         except Exception as e:
             return {"tool_result": [f"{current_tool} Error while loading agent tool: {e}"]}
 
+        finally:
+            # the puzzle may have been written, don't serve the context loaded before
+            self.puzzles.forget(puzzle_id)
 
-    async def process(self, user_message: str, puzzle_json: str, puzzle_id: UUID) -> tuple[str, UUID | None]:
+
+    async def process(self, user_message: str, puzzle_id: UUID | None = None) -> tuple[str, UUID | None]:
         """ Process user message and return response """
         current_tool = "ChatAgent.process:"
         logger.info(f"\n{current_tool} Process user message: {user_message}")
+        self.node_timings.clear()
+        # LLM calls of this turn are recorded to the session's cassette (LLM_CASSETTE_MODE=record)
+        cassette_token = current_cassette.set(str(self.session_id))
+        preloaded = self.context.puzzle_graph if self.context is not None else None
+        try:
+            with usage_scope("chat", session_id=self.session_id, puzzle_id=puzzle_id,
+                             puzzle_nodes=preloaded.node_count if preloaded is not None else None) as scope:
+                message, current_puzzle_id = await self._process(user_message, puzzle_id)
+                if current_puzzle_id and str(current_puzzle_id) != str(puzzle_id):
+                    scope.puzzle_created(current_puzzle_id)
+                return message, current_puzzle_id
+        finally:
+            current_cassette.reset(cassette_token)
+
 
+    async def _process(self, user_message: str, puzzle_id: UUID | None) -> tuple[str, UUID | None]:
+        current_tool = "ChatAgent.process:"
 
         # Process with graph
         async with AsyncSqliteSaver.from_conn_string(settings.CHECKPOINTS_URL) as checkpointer:
+            trace_methods(checkpointer, "checkpointer", ("aget_tuple", "aput", "aput_writes"))
             graph = self.workflow.compile(checkpointer=checkpointer)
             logger.info("Invoke agent graph")
             config = {"configurable": {"thread_id": str(self.session_id)}}
 
-            # get latest state SnapShot
-            logger.info("get puzzle current state")
-            current_puzzle = ""
-
-            state = await graph.aget_state(config)
-            logger.info("state_history loaded")
-
-            if state.values and "puzzle" in state.values:
-                if puzzle_json and puzzle_json != state.values["puzzle"]:
-                    current_puzzle = state.values["puzzle"]
-                else:
-                    logger.info(f"puzzle state updated.")
-                    current_puzzle = puzzle_json
-
 
             try:
                 # merging new user message into LangGraph state history
@@ -682,7 +716,7 @@ class ChatAgent:
                     "model": self.model,
                     "session_id": str(self.session_id),
                     "tool_result": [],
-                    "puzzle": [current_puzzle] if current_puzzle else [],
+                    "puzzle_ref": puzzle_reference(puzzle_id), # reference only, checkpoints don't carry the puzzle
                     "current_puzzle_id": str(puzzle_id) if puzzle_id else None,
                      },
                     config = config
@@ -696,6 +730,7 @@ class ChatAgent:
                     message = last_message.get("content") if isinstance(last_message, dict) else last_message.content
                 current_puzzle_id = result.get("current_puzzle_id")
                 logger.info(f"{current_tool} Return puzzle id to chat router: {current_puzzle_id}")
+                record_turn(self.session_id, user_message, puzzle_id, current_puzzle_id, self.model)
                 return message, current_puzzle_id
 
             except Exception as e:
@@ -711,21 +746,26 @@ class ChatAgent:
 
         current_tool = "format_response:"
         logger.info(f"\n\n{current_tool} Format final response from tool_result... ")
-        logger.info(f"Tool result: {state['tool_result']}")
+        logger.info("Tool result: %s", payload(state['tool_result']), extra=sampled("agent_state"))
         # if state.get("user_intent") == "chat" or state.get("user_intent") == "modify":
         #     logger.info(f"{current_tool} Chat intent - skipping format_response, using existing message")
         #     return
 
         # get tool result
         tool_result = state.get("tool_result")
-        logger.info(f"format_response: tool_result: {tool_result}")
+        logger.info("format_response: tool_result: %s", payload(tool_result), extra=sampled("agent_state"))
         if not tool_result:
             logger.info(f"{current_tool} tool_result is empty!")
             return {"message": "Tool result is empty!"}
 
         # convert tool result to string
         combined_results = "".join(tool_result)
-        logger.info(f"\n{current_tool} Join all tool results: {combined_results}")
+        logger.info("\n%s Join all tool results: %s", current_tool, payload(combined_results), extra=sampled("agent_state"))
+
+        # templated mode: known results and errors don't need a model to be explained
+        if not needs_llm("format_response"):
+            messages = [{"role": "assistant", "content": render_tool_results(tool_result)}]
+            return {"messages": messages, "tool_result": []}
 
         llm = get_llm(state["model"])
         system_prompt = f"""
@@ -762,7 +802,7 @@ class ChatAgent:
             final_response = await llm.chat(prompt)
 
             if final_response:
-                logger.info(f"Return final tool result: {final_response}")
+                logger.info("Return final tool result: %s", payload(final_response), extra=sampled("llm_response"))
 
                 messages = [{"role": "assistant", "content": final_response}]
                 return {
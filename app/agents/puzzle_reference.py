@@ -0,0 +1,63 @@
+import asyncio
+from typing import Optional, Union
+from uuid import UUID
+import logging
+
+from app.core.puzzle_graph import PuzzleGraph
+
+logger = logging.getLogger(__name__)
+
+
+def puzzle_reference(puzzle_id: Union[UUID, str, None]) -> Optional[dict]:
+    """What the agent state stores about the current puzzle: only its id, the puzzle itself is loaded when needed"""
+    if not puzzle_id:
+        return None
+    return {"id": str(puzzle_id)}
+
+
+class PuzzleContextResolver:
+    """
+    Materializes the LLM puzzle context of a puzzle reference when a node needs it.
+    Keeps the serialized text per (id, model) for the lifetime of the agent (one request),
+    a graph loaded by the request context is reused. Nodes that write a puzzle call forget().
+    """
+
+    def __init__(self, db, preloaded: Optional[PuzzleGraph] = None):
+        self.db = db
+        self.preloaded = preloaded
+        self._texts: dict[tuple[str, str], str] = {}
+
+    async def resolve(self, reference: Optional[dict], model: str) -> Optional[str]:
+        """Serialized puzzle of the reference (compact text or JSON) or None"""
+        if not reference or not reference.get("id"):
+            return None
+
+        puzzle_id = reference["id"]
+        key = (puzzle_id, model)
+        if key in self._texts:
+            return self._texts[key]
+
+        try:
+            graph = await asyncio.to_thread(self.graph, puzzle_id) # sync session, off the event loop
+            from app.agents.agent_tools import AgentTools
+            text = await AgentTools(self.db).serialize_puzzle_obj_for_llm(graph, model)
+        except Exception as e:
+            logger.error(f"PuzzleContextResolver: could not load puzzle {puzzle_id}: {e}")
+            return None
+
+        self._texts[key] = text
+        return text
+
+    def forget(self, puzzle_id: Union[UUID, str]) -> None:
+        """Drops what's held for a puzzle after it was written, the next resolve loads it again"""
+        puzzle_id = str(puzzle_id)
+        self._texts = {key: text for key, text in self._texts.items() if key[0] != puzzle_id}
+        if self.preloaded is not None and str(self.preloaded.id) == puzzle_id:
+            self.preloaded = None
+
+    def graph(self, puzzle_id: str) -> PuzzleGraph:
+        """Preloaded graph of the request if it's that puzzle, else from the cache/database"""
+        if self.preloaded is not None and str(self.preloaded.id) == puzzle_id:
+            return self.preloaded
+        from app.services import PuzzleServices
+        return PuzzleServices(self.db).get_puzzle_graph(UUID(puzzle_id))
@@ -0,0 +1,260 @@
+"""
+Command line tools for offline work with the puzzle database.
+
+Usage:
+    python -m app.cli batch-generate configs.json [--models gpt-4o-mini gemini-2.5-flash] [--output results.ndjson]
+    python -m app.cli backfill-documents [--batch-size 100] [--force]
+    python -m app.cli encoding-report [--tokenizer-model gpt-4o] [--details]
+    python -m app.cli replay-session data/cassettes/<session_id>.jsonl [--latency original] [--repeat 3]
+"""
+import argparse
+import asyncio
+import json
+import sys
+import logging
+
+from utils.logger_config import configure_logging
+
+logger = logging.getLogger(__name__)
+
+
+def _load_configs(path: str) -> list:
+    """ Load a list of PuzzleGenerate configs (plain list or {"configs": [...]})"""
+    from app.schemas import PuzzleGenerate
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("configs", [])
+    return [PuzzleGenerate(**config) for config in data]
+
+
+async def batch_generate(args) -> int:
+    """ Generate puzzles from a config file and write NDJSON results"""
+    from app.services import BatchGenerationService
+
+    configs = _load_configs(args.configs)
+    service = BatchGenerationService(persist_chunk_size=args.chunk_size)
+    output = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+
+    summary = {}
+    try:
+        async for line in service.run(configs, models=args.models):
+            output.write(json.dumps(line) + "\n")
+            output.flush()
+            if line["type"] == "summary":
+                summary = line
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    print(
+        f"Generated {summary.get('succeeded', 0)}/{summary.get('total', 0)} puzzles "
+        f"in {summary.get('elapsed_seconds', 0)}s "
+        f"({summary.get('puzzles_per_minute', 0)} puzzles/min, "
+        f"{summary.get('failed', 0)} failed, {summary.get('total_tokens', 0)} tokens)",
+        file=sys.stderr,
+    )
+    return 0 if not summary.get("failed") else 1
+
+
+async def backfill_documents(args) -> int:
+    """ Write the graph_blob document of existing puzzles (document storage mode)"""
+    from app.core.config import settings
+    from app.core.database import SessionLocal
+    from app.services import PuzzleServices
+
+    if settings.PUZZLE_STORAGE_MODE != "document":
+        logger.warning("PUZZLE_STORAGE_MODE is not 'document': the app won't read the documents and clears them on the next write")
+
+    db = SessionLocal()
+    try:
+        written = PuzzleServices(db).backfill_documents(batch_size=args.batch_size, force=args.force)
+    finally:
+        db.close()
+    print(f"Backfilled {written} puzzle documents", file=sys.stderr)
+    return 0
+
+
+def _token_counter(model: str):
+    """ tiktoken if installed, otherwise ~4 characters per token"""
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoding = tiktoken.get_encoding("o200k_base")
+        return lambda text: len(encoding.encode(text)), f"tiktoken ({encoding.name})"
+    except ImportError:
+        return lambda text: (len(text) + 3) // 4, "estimate (4 chars/token, install tiktoken for exact counts)"
+
+
+async def encoding_report(args) -> int:
+    """ Token counts of all stored puzzles as JSON vs. the compact encoding (and a lossless round trip check)"""
+    from app import models
+    from app.core.database import SessionLocal
+    from app.prompts.puzzle_encoding import encode_puzzle, round_trips, self_check
+    from app.services import PuzzleServices
+
+    count_tokens, tokenizer = _token_counter(args.tokenizer_model)
+    totals = {"json": 0, "json_indent": 0, "compact": 0}
+    details, lossy = [], [f"sample: {name}" for name in self_check()]
+
+    db = SessionLocal()
+    try:
+        services = PuzzleServices(db)
+        for (puzzle_id,) in db.query(models.Puzzle.id).all():
+            puzzle = services.get_puzzle_graph(puzzle_id).to_llm_dict()
+            compact = encode_puzzle(puzzle)
+            tokens = {
+                "json": count_tokens(json.dumps(puzzle)),  # chat context / modify prompts
+                "json_indent": count_tokens(json.dumps(puzzle, indent=2)),  # few shot examples
+                "compact": count_tokens(compact),
+            }
+            for key, value in tokens.items():
+                totals[key] += value
+            if not round_trips(puzzle):
+                lossy.append(str(puzzle_id))
+            details.append({"puzzle_id": str(puzzle_id), "name": puzzle["name"], "nodes": len(puzzle["nodes"]), **tokens})
+    finally:
+        db.close()
+
+    def saving(baseline: int) -> float:
+        return round(100 * (1 - totals["compact"] / baseline), 1) if baseline else 0.0
+
+    report = {
+        "puzzles": len(details),
+        "tokenizer": tokenizer,
+        "tokens": totals,
+        "saving_vs_json_percent": saving(totals["json"]),
+        "saving_vs_json_indent_percent": saving(totals["json_indent"]),
+        "lossy_round_trips": lossy,
+    }
+    if args.details:
+        report["details"] = details
+    print(json.dumps(report, indent=2))
+    return 0 if not lossy else 1
+
+
+def _timing_summary(values: list[float]) -> dict:
+    ordered = sorted(values)
+    pick = lambda pct: ordered[min(len(ordered) - 1, int(pct / 100 * len(ordered)))]
+    return {"count": len(ordered), "total_ms": round(sum(ordered) * 1000, 2), "p50_ms": round(pick(50) * 1000, 2),
+            "p95_ms": round(pick(95) * 1000, 2), "max_ms": round(ordered[-1] * 1000, 2)}
+
+
+async def replay_session(args) -> int:
+    """ Replay the turns of a recorded session through ChatAgent.process, answers from the cassette"""
+    import time
+    from uuid import uuid4
+    from app import models
+    from app.agents import ChatAgent
+    from app.core.config import settings
+    from app.core.database import SessionLocal
+    from app.llm.cassette import load_replay
+
+    settings.LLM_CASSETTE_MODE = "replay"
+    settings.LLM_CASSETTE_LATENCY = args.latency
+    turns = load_replay(args.cassette).turns
+    if not turns:
+        print(f"No turns recorded in {args.cassette}", file=sys.stderr)
+        return 1
+
+    node_times: dict[str, list[float]] = {}
+    runs = []
+    db = SessionLocal()
+    try:
+        for run in range(args.repeat):
+            cassette = load_replay(args.cassette)  # every run serves the recorded answers from the start
+            session = models.Session(id=uuid4(), topic_name=f"Replay {args.cassette}")
+            db.add(session)
+            db.commit()
+            agent = ChatAgent(db, str(session.id), args.model or turns[0].get("model") or "gpt-4o-mini")
+
+            # puzzles created during the recording get new ids in the replay
+            replayed_ids = {}
+            results = []
+            for turn in turns:
+                puzzle_id = turn.get("puzzle_id")
+                puzzle_id = replayed_ids.get(puzzle_id, puzzle_id)
+                started = time.perf_counter()
+                message, result_puzzle_id = await agent.process(turn["message"], puzzle_id)
+                elapsed = time.perf_counter() - started
+                if turn.get("result_puzzle_id"):
+                    replayed_ids[turn["result_puzzle_id"]] = result_puzzle_id
+                for node, seconds in agent.node_timings:
+                    node_times.setdefault(node, []).append(seconds)
+                results.append({
+                    "message": turn["message"][:80],
+                    "total_ms": round(elapsed * 1000, 2),
+                    "nodes_ms": {node: round(seconds * 1000, 2) for node, seconds in agent.node_timings},
+                    "answer": str(message)[:80],
+                })
+            runs.append({"run": run + 1, "session_id": str(session.id), "turns": results,
+                         "llm": {"hits": cassette.hits, "fallbacks": cassette.fallbacks, "misses": cassette.misses}})
+    finally:
+        db.close()
+
+    report = {
+        "cassette": args.cassette,
+        "latency": args.latency,
+        "nodes": {node: _timing_summary(values) for node, values in sorted(node_times.items())},
+        "runs": runs,
+    }
+    print(json.dumps(report, indent=2))
+    return 0 if not any(run["llm"]["misses"] for run in runs) else 1
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Puzzle Generator command line tools")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    batch = commands.add_parser("batch-generate", help="Generate many puzzles from a JSON list of PuzzleGenerate configs")
+    batch.add_argument("configs", help="JSON file with a list of PuzzleGenerate configs")
+    batch.add_argument("--models", nargs="*", help="Spread the configs round-robin over these models")
+    batch.add_argument("--output", help="Write NDJSON results to this file instead of stdout")
+    batch.add_argument("--chunk-size", type=int, default=None, help="Finished puzzles per bulk insert")
+    batch.set_defaults(handler=batch_generate)
+
+    backfill = commands.add_parser("backfill-documents", help="Store existing puzzles as graph documents (PUZZLE_STORAGE_MODE=document)")
+    backfill.add_argument("--batch-size", type=int, default=100, help="Puzzles per commit")
+    backfill.add_argument("--force", action="store_true", help="Rewrite documents that already exist")
+    backfill.set_defaults(handler=backfill_documents)
+
+    report = commands.add_parser("encoding-report", help="Token savings of the compact puzzle encoding on all stored puzzles")
+    report.add_argument("--tokenizer-model", default="gpt-4o", help="Model whose tokenizer is used (needs tiktoken)")
+    report.add_argument("--details", action="store_true", help="Include per puzzle token counts")
+    report.set_defaults(handler=encoding_report)
+
+    replay = commands.add_parser("replay-session", help="Replay a recorded chat session (LLM_CASSETTE_MODE=record) and report per node timings")
+    replay.add_argument("cassette", help="Cassette file of the session (LLM_CASSETTE_DIR/<session_id>.jsonl)")
+    replay.add_argument("--latency", choices=["zero", "original"], default="zero", help="Sleep the recorded LLM latency or answer at once")
+    replay.add_argument("--model", help="Model name passed to the agent (default: the recorded one)")
+    replay.add_argument("--repeat", type=int, default=1, help="Replay the session this many times")
+    replay.set_defaults(handler=replay_session)
+
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    configure_logging()
+    args = build_parser().parse_args(argv)
+
+    # make sure all tables exist when the CLI runs before the web app ever did
+    from app.core.database import Base, engine, add_missing_columns
+    import app.models  # noqa: F401 register models
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine)
+
+    return asyncio.run(_run(args))
+
+
+async def _run(args) -> int:
+    from app.core.usage_ledger import usage_ledger
+    try:
+        return await args.handler(args)
+    finally:
+        await usage_ledger.stop() # write the buffered LLM call rows before the loop closes
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,34 @@
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def bulk_insert(db: Session, model, rows: list[dict]):
+    """
+    Insert many rows of one model in the current transaction.
+    PostgreSQL (psycopg 3) streams the rows with COPY, other databases use a single
+    executemany INSERT. Rows must contain every column value (no Python-side defaults on COPY).
+    """
+    if not rows:
+        return
+
+    connection = db.connection()
+    if connection.dialect.name == "postgresql" and connection.dialect.driver == "psycopg":
+        _copy_rows(connection, model.__table__, rows)
+    else:
+        db.execute(insert(model.__table__), rows)
+
+
+def _copy_rows(connection, table, rows: list[dict]):
+    """COPY rows into table on the raw psycopg connection of the current transaction"""
+    columns = list(rows[0].keys())
+    column_list = ", ".join(f'"{column}"' for column in columns)
+    raw_connection = connection.connection.driver_connection
+
+    with raw_connection.cursor() as cursor:
+        with cursor.copy(f'COPY "{table.name}" ({column_list}) FROM STDIN') as copy:
+            for row in rows:
+                copy.write_row(tuple(row[column] for column in columns))
+    logger.debug(f"COPY {len(rows)} rows into {table.name}")
@@ -1,15 +1,141 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text
 from sqlalchemy.orm import sessionmaker, declarative_base
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import QueuePool, AsyncAdaptedQueuePool, StaticPool, NullPool
 from app.core.config import settings
+import logging
 
-engine = create_engine(settings.DATABASE_URL) #, echo=True)
+logger = logging.getLogger(__name__)
+
+# SQLite storage profiles, applied as PRAGMAs on every new connection
+SQLITE_PROFILES = {
+    # SQLite defaults: rollback journal, synchronous=FULL, no mmap, small page cache
+    "default": {},
+    # WAL lets readers work during writes, NORMAL only fsyncs at checkpoints (safe in WAL mode)
+    "tuned": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,  # 256 MB
+        "cache_size": -65536,  # 64 MB (negative = KiB)
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,  # ms
+    },
+    # WAL for concurrency, but fsync on every commit
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -65536,
+        "busy_timeout": 5000,
+    },
+}
+
+
+def get_database_url(url: str) -> str:
+    """Normalize DATABASE_URL. PostgreSQL always uses psycopg 3 (sync, async and COPY support)"""
+    for prefix in ("postgres://", "postgresql://", "postgresql+psycopg2://"):
+        if url.startswith(prefix):
+            return url.replace(prefix, "postgresql+psycopg://", 1)
+    return url
+
+
+def get_async_database_url(url: str) -> str:
+    """Map a sync DATABASE_URL to its async driver (e.g. sqlite → sqlite+aiosqlite)"""
+    if settings.ASYNC_DATABASE_URL:
+        return settings.ASYNC_DATABASE_URL
+    if url.startswith("sqlite:///"):
+        return url.replace("sqlite:///", "sqlite+aiosqlite:///", 1)
+    return get_database_url(url)
+
+
+def get_sqlite_pragmas(profile: str) -> dict:
+    """PRAGMAs of a storage profile"""
+    if profile not in SQLITE_PROFILES:
+        raise ValueError(f"Unknown DATABASE_PROFILE '{profile}'. Use one of: {', '.join(SQLITE_PROFILES)}")
+    return SQLITE_PROFILES[profile]
+
+
+def get_engine_options(url: str, is_async: bool = False) -> dict:
+    """Pool configuration for create_engine/create_async_engine"""
+    if url.startswith("sqlite") and (":memory:" in url or url.rstrip("/").endswith("sqlite:")):
+        # in-memory database only exists on one connection
+        return {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+
+    if url.startswith("postgresql") and settings.DATABASE_POOL_MODE == "server":
+        # a server-side pooler (PgBouncer in transaction mode) owns the connections:
+        # open/close per checkout and don't use prepared statements
+        return {"poolclass": NullPool, "connect_args": {"prepare_threshold": None}}
+
+    options = {
+        "poolclass": AsyncAdaptedQueuePool if is_async else QueuePool,
+        "pool_size": settings.DATABASE_POOL_SIZE,
+        "max_overflow": settings.DATABASE_MAX_OVERFLOW,
+        "pool_timeout": settings.DATABASE_POOL_TIMEOUT,
+        "pool_recycle": settings.DATABASE_POOL_RECYCLE,
+        "pool_pre_ping": settings.DATABASE_POOL_PRE_PING,
+    }
+    if url.startswith("sqlite"):
+        # pooled connections are handed to FastAPI's threadpool
+        options["connect_args"] = {"check_same_thread": False}
+    return options
+
+
+def apply_storage_profile(target_engine, profile: str):
+    """Register a connect listener that sets the profile PRAGMAs (SQLite only)"""
+    if target_engine.dialect.name != "sqlite":
+        return
+    pragmas = get_sqlite_pragmas(profile)
+    if not pragmas:
+        return
+
+    @event.listens_for(target_engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+    logger.info(f"SQLite storage profile '{profile}' enabled: {pragmas}")
+
+
+DATABASE_URL = get_database_url(settings.DATABASE_URL)
+engine = create_engine(DATABASE_URL, **get_engine_options(DATABASE_URL)) #, echo=True)
+apply_storage_profile(engine, settings.DATABASE_PROFILE)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# async engine for routers that must not block the event loop
+ASYNC_DATABASE_URL = get_async_database_url(DATABASE_URL)
+async_engine = create_async_engine(ASYNC_DATABASE_URL, **get_engine_options(ASYNC_DATABASE_URL, is_async=True))
+apply_storage_profile(async_engine.sync_engine, settings.DATABASE_PROFILE)
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+def add_missing_columns(target_engine=None):
+    """create_all() doesn't alter existing tables. Add nullable columns that were added to the models later"""
+    target_engine = target_engine or engine
+    inspector = inspect(target_engine)
+    with target_engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing or not column.nullable:
+                    continue
+                column_type = column.type.compile(dialect=target_engine.dialect)
+                connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                logger.info(f"Added column {table.name}.{column.name} ({column_type})")
+
+
 # generator function for FastAPI Depends()
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+# async generator function for FastAPI Depends()
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
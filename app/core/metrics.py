@@ -0,0 +1,215 @@
+"""
+In-process metrics in the Prometheus text format (GET /metrics).
+
+Counters, gauges and histograms are plain dicts keyed by label values, guarded by one lock per
+metric; observing is a dict lookup and a bisect. Values that already live elsewhere (puzzle cache,
+generation queue) are read by collectors when /metrics is scraped.
+"""
+import bisect
+import threading
+from typing import Callable, Iterable
+
+# seconds
+HTTP_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30, 60, 120)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = labels
+        self._values: dict[tuple, object] = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.label_names, key)} {_number(value)}" for key, value in values]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...] = (), buckets: Iterable[float] = HTTP_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # per bucket (not cumulative) counts + the +Inf bucket, sum
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][position] += 1
+            state[1] += value
+
+    def render(self) -> list[str]:
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        lines = self.header()
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.label_names, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.label_names, key)} {_number(round(total, 6))}")
+            lines.append(f"{self.name}_count{_labels(self.label_names, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list[Metric] = []
+        self.collectors: list[Callable[[], list[str]]] = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], list[str]]):
+        """ Function that renders its own lines at scrape time (values owned by other objects)"""
+        self.collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            lines.extend(collector())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+http_request_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "HTTP request duration per route", ("method", "route", "status")))
+agent_node_duration = registry.register(Histogram(
+    "agent_node_duration_seconds", "Chat agent graph node duration", ("node",), buckets=LLM_BUCKETS))
+llm_request_duration = registry.register(Histogram(
+    "llm_request_duration_seconds", "LLM call duration per provider and model", ("provider", "model", "method"), buckets=LLM_BUCKETS))
+llm_requests = registry.register(Counter(
+    "llm_requests_total", "LLM calls per provider, model and outcome", ("provider", "model", "method", "outcome")))
+llm_tokens = registry.register(Counter(
+    "llm_tokens_total", "LLM tokens per provider, model and kind (input, output, cached)", ("provider", "model", "kind")))
+llm_in_flight = registry.register(Gauge(
+    "llm_requests_in_flight", "LLM calls waiting for an answer", ("provider",)))
+llm_policy_duration = registry.register(Histogram(
+    "llm_policy_duration_seconds", "End-to-end LLM call duration per request policy (retries and hedges included)",
+    ("policy", "outcome"), buckets=LLM_BUCKETS))
+llm_policy_attempts = registry.register(Counter(
+    "llm_policy_attempts_total", "Extra LLM requests (retry, hedge) and hedge winners (primary_won, hedge_won) per request policy",
+    ("policy", "kind")))
+db_statement_duration = registry.register(Histogram(
+    "db_statement_duration_seconds", "SQL statement duration per engine and statement kind", ("engine", "kind"), buckets=DB_BUCKETS))
+
+
+def provider_name(model_name: str) -> str:
+    """Provider label of a model name (same prefixes as get_llm)"""
+    for prefix, provider in (("gpt", "openai"), ("gemini", "gemini"), ("fake", "fake")):
+        if model_name.startswith(prefix):
+            return provider
+    return "other"
+
+
+def _collect_puzzle_cache() -> list[str]:
+    from app.core.puzzle_cache import puzzle_graph_cache
+    stats = puzzle_graph_cache.stats()
+    return [
+        "# HELP puzzle_cache_lookups_total Puzzle graph cache lookups by result",
+        "# TYPE puzzle_cache_lookups_total counter",
+        f'puzzle_cache_lookups_total{{result="hit"}} {stats["hits"]}',
+        f'puzzle_cache_lookups_total{{result="miss"}} {stats["misses"]}',
+        "# HELP puzzle_cache_evictions_total Puzzle graphs evicted from the cache",
+        "# TYPE puzzle_cache_evictions_total counter",
+        f"puzzle_cache_evictions_total {stats['evictions']}",
+        "# HELP puzzle_cache_hit_ratio Hits per lookup since start",
+        "# TYPE puzzle_cache_hit_ratio gauge",
+        f"puzzle_cache_hit_ratio {stats['hit_rate']}",
+        "# HELP puzzle_cache_entries Puzzle graphs in the cache",
+        "# TYPE puzzle_cache_entries gauge",
+        f"puzzle_cache_entries {stats['size']}",
+    ]
+
+
+def _collect_generation_queue() -> list[str]:
+    from app.services import generation_queue
+    counts = generation_queue.counts()
+    return [
+        "# HELP generation_jobs Puzzle generation jobs by status (queued and running are in flight)",
+        "# TYPE generation_jobs gauge",
+    ] + [f'generation_jobs{{status="{status}"}} {count}' for status, count in counts.items()] + [
+        "# HELP generation_workers Generation worker tasks",
+        "# TYPE generation_workers gauge",
+        f"generation_workers {generation_queue.workers}",
+    ]
+
+
+def _collect_llm_policies() -> list[str]:
+    from app.llm.request_policy import policy_latencies
+    lines = [
+        "# HELP llm_policy_latency_seconds Latency quantiles of the last successful calls per request policy",
+        "# TYPE llm_policy_latency_seconds gauge",
+    ]
+    for policy, window in list(policy_latencies.items()):
+        for quantile in (50, 95, 99):
+            value = window.percentile(quantile)
+            if value is not None:
+                lines.append(f'llm_policy_latency_seconds{{policy="{_escape(policy)}",quantile="{quantile / 100}"}} {_number(round(value, 6))}')
+    return lines
+
+
+registry.add_collector(_collect_puzzle_cache)
+registry.add_collector(_collect_llm_policies)
+registry.add_collector(_collect_generation_queue)
@@ -0,0 +1,124 @@
+from collections import OrderedDict
+from typing import Optional
+import itertools
+import threading
+import time
+import logging
+
+from app.core.config import settings
+from app.core.puzzle_graph import PuzzleGraph
+
+logger = logging.getLogger(__name__)
+
+
+class PuzzleGraphCache:
+    """
+    Process-wide, size-bounded LRU cache of loaded PuzzleGraphs keyed by (puzzle id, version).
+
+    Write paths call invalidate(), which gives the puzzle a new version and drops the cached
+    graph, so a graph loaded before a write can never be served afterwards. Versions come from
+    one counter; when too many ids are tracked the oldest are dropped and their version falls
+    back to a floor above every dropped one, which still rejects loads that started before.
+
+    Writes done by other processes are not seen: entries expire after ttl seconds, and with
+    several uvicorn workers (WEB_CONCURRENCY > 1) the cache is off.
+    """
+
+    def __init__(self, max_size: int, ttl: float = 0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_versions = max(4 * max_size, 1024)
+        self._entries: OrderedDict[tuple[str, int], tuple[PuzzleGraph, float]] = OrderedDict()
+        self._versions: OrderedDict[str, int] = OrderedDict()
+        self._counter = itertools.count(1)
+        self._floor = 0 # version of ids that aren't tracked
+        # sync services run in worker threads (run_sync, to_thread), so guard the dicts
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0 and settings.WEB_CONCURRENCY <= 1
+
+    def version(self, puzzle_id) -> int:
+        with self._lock:
+            return self._versions.get(str(puzzle_id), self._floor)
+
+    def get(self, puzzle_id) -> Optional[PuzzleGraph]:
+        """Cached graph of the current version or None"""
+        if not self.enabled:
+            return None
+        puzzle_id = str(puzzle_id)
+        with self._lock:
+            key = (puzzle_id, self._versions.get(puzzle_id, self._floor))
+            entry = self._entries.get(key)
+            if entry is not None and self.ttl and time.monotonic() - entry[1] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, puzzle_id, graph: PuzzleGraph, version: int):
+        """Store a graph loaded at 'version'. Ignored if the puzzle was written in the meantime"""
+        if not self.enabled:
+            return
+        puzzle_id = str(puzzle_id)
+        with self._lock:
+            if self._versions.get(puzzle_id, self._floor) != version:
+                return
+            self._entries[(puzzle_id, version)] = (graph, time.monotonic())
+            self._entries.move_to_end((puzzle_id, version))
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, puzzle_id):
+        """Called after a puzzle was created, updated or deleted (and committed)"""
+        puzzle_id = str(puzzle_id)
+        with self._lock:
+            version = self._versions.pop(puzzle_id, self._floor)
+            self._entries.pop((puzzle_id, version), None)
+            self._versions[puzzle_id] = next(self._counter)
+            if len(self._versions) > self.max_versions:
+                self._prune_versions()
+        logger.debug(f"Invalidated cached puzzle graph {puzzle_id}")
+
+    def _prune_versions(self):
+        """Forget the least recently written half of the versions (lock held)"""
+        while len(self._versions) > self.max_versions // 2:
+            puzzle_id, version = self._versions.popitem(last=False)
+            self._entries.pop((puzzle_id, version), None)
+            self._floor = max(self._floor, version)
+        # graphs cached at the old floor belong to ids whose version just changed
+        for key in [key for key in self._entries if key[0] not in self._versions]:
+            del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+            self._floor = next(self._counter) # loads that are still running can't put anymore
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+puzzle_graph_cache = PuzzleGraphCache(max_size=settings.PUZZLE_CACHE_SIZE, ttl=settings.PUZZLE_CACHE_TTL)
@@ -0,0 +1,142 @@
+from dataclasses import dataclass
+from typing import Any, Optional, Union
+import logging
+
+from app.core.puzzle_graph import PuzzleGraph
+
+logger = logging.getLogger(__name__)
+
+# change kinds
+NODE_ADDED = "node_added"
+NODE_REMOVED = "node_removed"
+NODE_MOVED = "node_moved"
+EDGE_ADDED = "edge_added"
+EDGE_REMOVED = "edge_removed"
+EDGE_CHANGED = "edge_changed"
+UNIT_ADDED = "unit_added"
+UNIT_REMOVED = "unit_removed"
+UNIT_PATH_CHANGED = "unit_path_changed"
+FIELD_CHANGED = "field_changed"
+
+_FIELDS = ("name", "game_mode", "coins", "description")
+
+
+@dataclass(frozen=True)
+class PuzzleChange:
+    """One structural change between two versions of a puzzle"""
+    kind: str
+    target: Any  # node/edge index, unit label or field name
+    old: Any = None
+    new: Any = None
+
+    def describe(self) -> str:
+        if self.kind == NODE_ADDED:
+            return f"Added node {self.target} at {self.new}"
+        if self.kind == NODE_REMOVED:
+            return f"Removed node {self.target} (was at {self.old})"
+        if self.kind == NODE_MOVED:
+            return f"Moved node {self.target} from {self.old} to {self.new}"
+        if self.kind == EDGE_ADDED:
+            return f"Added edge {self.target} connecting nodes {self.new[0]} and {self.new[1]}"
+        if self.kind == EDGE_REMOVED:
+            return f"Removed edge {self.target} between nodes {self.old[0]} and {self.old[1]}"
+        if self.kind == EDGE_CHANGED:
+            return f"Edge {self.target} now connects nodes {self.new[0]} and {self.new[1]} (was {self.old[0]} and {self.old[1]})"
+        if self.kind == UNIT_ADDED:
+            return f"Added {self.target} with path {self.new}"
+        if self.kind == UNIT_REMOVED:
+            return f"Removed {self.target} (path {self.old})"
+        if self.kind == UNIT_PATH_CHANGED:
+            return f"Changed path of {self.target} from {self.old} to {self.new}"
+        if self.target == "description":
+            return "Updated the description"
+        return f"Changed {self.target} from {self.old!r} to {self.new!r}"
+
+
+def _as_dict(puzzle: Union[PuzzleGraph, dict]) -> dict:
+    return puzzle.to_llm_dict() if isinstance(puzzle, PuzzleGraph) else puzzle
+
+
+def _match_units(units_a: list[dict], units_b: list[dict]) -> tuple[list[tuple[int, int]], list[int], list[int]]:
+    """Pair units of both versions: identical units first, then same faction and type in list order"""
+    pairs = []
+    left_a = list(range(len(units_a)))
+    left_b = list(range(len(units_b)))
+
+    for key in (lambda u: (u["faction"], u["type"], tuple(u["path"])), lambda u: (u["faction"], u["type"])):
+        waiting: dict[Any, list[int]] = {}
+        for b in left_b:
+            waiting.setdefault(key(units_b[b]), []).append(b)
+        unmatched_a = []
+        for a in left_a:
+            candidates = waiting.get(key(units_a[a]))
+            if candidates:
+                pairs.append((a, candidates.pop(0)))
+            else:
+                unmatched_a.append(a)
+        matched_b = {b for _, b in pairs}
+        left_a, left_b = unmatched_a, [b for b in left_b if b not in matched_b]
+
+    return sorted(pairs), left_a, left_b
+
+
+def diff_puzzles(puzzle_a: Union[PuzzleGraph, dict], puzzle_b: Union[PuzzleGraph, dict]) -> list[PuzzleChange]:
+    """
+    Typed changes from puzzle a to puzzle b (PuzzleGraphs or LLM puzzle dicts).
+    Nodes and edges are matched by index, units by faction/type/path, in linear time.
+    """
+    a, b = _as_dict(puzzle_a), _as_dict(puzzle_b)
+    changes = []
+
+    for field in _FIELDS:
+        if a.get(field) != b.get(field) and (a.get(field) or b.get(field)):
+            changes.append(PuzzleChange(FIELD_CHANGED, field, a.get(field), b.get(field)))
+
+    nodes_a = {n["index"]: (n["x"], n["y"]) for n in a.get("nodes", [])}
+    nodes_b = {n["index"]: (n["x"], n["y"]) for n in b.get("nodes", [])}
+    for index in sorted(nodes_a.keys() | nodes_b.keys()):
+        old, new = nodes_a.get(index), nodes_b.get(index)
+        if old is None:
+            changes.append(PuzzleChange(NODE_ADDED, index, new=new))
+        elif new is None:
+            changes.append(PuzzleChange(NODE_REMOVED, index, old=old))
+        elif old != new:
+            changes.append(PuzzleChange(NODE_MOVED, index, old, new))
+
+    edges_a = {e["index"]: (e["start"], e["end"]) for e in a.get("edges", [])}
+    edges_b = {e["index"]: (e["start"], e["end"]) for e in b.get("edges", [])}
+    for index in sorted(edges_a.keys() | edges_b.keys()):
+        old, new = edges_a.get(index), edges_b.get(index)
+        if old is None:
+            changes.append(PuzzleChange(EDGE_ADDED, index, new=new))
+        elif new is None:
+            changes.append(PuzzleChange(EDGE_REMOVED, index, old=old))
+        elif set(old) != set(new):
+            changes.append(PuzzleChange(EDGE_CHANGED, index, old, new))
+
+    units_a, units_b = a.get("units", []), b.get("units", [])
+    pairs, removed, added = _match_units(units_a, units_b)
+    label = lambda unit, position: f"{unit['faction']} {unit['type']} (unit {position})"
+    for position_a, position_b in pairs:
+        if list(units_a[position_a]["path"]) != list(units_b[position_b]["path"]):
+            changes.append(PuzzleChange(UNIT_PATH_CHANGED, label(units_b[position_b], position_b),
+                                        list(units_a[position_a]["path"]), list(units_b[position_b]["path"])))
+    for position in removed:
+        changes.append(PuzzleChange(UNIT_REMOVED, label(units_a[position], position), old=list(units_a[position]["path"])))
+    for position in added:
+        changes.append(PuzzleChange(UNIT_ADDED, label(units_b[position], position), new=list(units_b[position]["path"])))
+
+    return changes
+
+
+def summarize_changes(changes: list[PuzzleChange], puzzle_b: Optional[PuzzleGraph] = None) -> str:
+    """Markdown bullet list of the changes, plus rule problems of the new version if a graph is given"""
+    if not changes:
+        return "Nothing was changed."
+
+    lines = ["**Changes:**"] + [f"- {change.describe()}" for change in changes]
+    if puzzle_b is not None:
+        problems = puzzle_b.validate()
+        if problems:
+            lines += ["", "**Check these rules:**"] + [f"- {problem}" for problem in problems]
+    return "\n".join(lines)
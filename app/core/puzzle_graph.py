@@ -0,0 +1,379 @@
+from array import array
+from bisect import bisect_left
+from collections import deque
+from typing import Any, Iterable, Optional
+from uuid import UUID
+import json
+import struct
+import sys
+import zlib
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PuzzleGraph:
+    """
+    Immutable, array-backed in-memory representation of one puzzle.
+
+    Built once from the DB rows (or an ORM tree / PuzzleCreate) and shared by all
+    serializers, the validator and the simulator instead of walking SQLAlchemy objects.
+
+    Storage:
+        nodes   sorted by node index: node_index, node_x, node_y (array('i')), node_ids (tuple)
+        edges   sorted by edge index: edge_index, edge_start, edge_end (node indexes, -1 = unknown node)
+        adjacency  CSR over node positions: neighbours of position p are
+                   adj_targets[adj_offsets[p]:adj_offsets[p + 1]]
+        units   unit_ids, unit_types, unit_factions (tuples)
+        paths   flat node index array path_nodes, path of unit u is
+                path_nodes[path_offsets[u]:path_offsets[u + 1]]
+    """
+
+    __slots__ = (
+        "id", "name", "model", "game_mode", "coins", "description", "is_working",
+        "node_ids", "node_index", "node_x", "node_y",
+        "edge_index", "edge_start", "edge_end",
+        "adj_offsets", "adj_targets",
+        "unit_ids", "unit_types", "unit_factions", "path_offsets", "path_nodes",
+    )
+
+    def __init__(
+            self,
+            meta: dict[str, Any],
+            nodes: Iterable[tuple],  # (node_index, x, y, node_id)
+            edges: Iterable[tuple],  # (edge_index, start node index, end node index)
+            units: Iterable[tuple],  # (unit_id, unit_type, faction, [node indexes])
+    ):
+        init = object.__setattr__  # instance is frozen, see __setattr__
+
+        for key in ("id", "name", "model", "game_mode", "coins", "description", "is_working"):
+            init(self, key, meta.get(key))
+
+        nodes = sorted(nodes, key=lambda n: n[0])
+        init(self, "node_index", array("i", (n[0] for n in nodes)))
+        init(self, "node_x", array("i", (int(n[1]) for n in nodes)))
+        init(self, "node_y", array("i", (int(n[2]) for n in nodes)))
+        init(self, "node_ids", tuple(str(n[3]) if n[3] is not None else None for n in nodes))
+
+        edges = sorted(edges, key=lambda e: e[0])
+        init(self, "edge_index", array("i", (e[0] for e in edges)))
+        init(self, "edge_start", array("i", (e[1] if e[1] is not None else -1 for e in edges)))
+        init(self, "edge_end", array("i", (e[2] if e[2] is not None else -1 for e in edges)))
+
+        # CSR adjacency (undirected, over node positions)
+        neighbours: list[list[int]] = [[] for _ in nodes]
+        for start, end in zip(self.edge_start, self.edge_end):
+            a, b = self.position(start), self.position(end)
+            if a is not None and b is not None:
+                neighbours[a].append(b)
+                neighbours[b].append(a)
+        offsets = array("i", [0])
+        targets = array("i")
+        for position_list in neighbours:
+            targets.extend(sorted(position_list))
+            offsets.append(len(targets))
+        init(self, "adj_offsets", offsets)
+        init(self, "adj_targets", targets)
+
+        units = list(units)
+        init(self, "unit_ids", tuple(str(u[0]) if u[0] is not None else None for u in units))
+        init(self, "unit_types", tuple(u[1] for u in units))
+        init(self, "unit_factions", tuple(u[2] for u in units))
+        path_offsets = array("i", [0])
+        path_nodes = array("i")
+        for unit in units:
+            path_nodes.extend(unit[3])
+            path_offsets.append(len(path_nodes))
+        init(self, "path_offsets", path_offsets)
+        init(self, "path_nodes", path_nodes)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("PuzzleGraph is immutable")
+
+    def __repr__(self):
+        return (f"PuzzleGraph(id={self.id}, name={self.name!r}, nodes={self.node_count}, "
+                f"edges={self.edge_count}, units={self.unit_count})")
+
+    # ---------- constructors ----------
+
+    @classmethod
+    def from_rows(cls, puzzle_row, node_rows, edge_rows, unit_rows, path_rows) -> "PuzzleGraph":
+        """
+        Build from plain DB rows:
+            puzzle_row: mapping with the puzzle columns
+            node_rows:  (node_id, node_index, x_position, y_position)
+            edge_rows:  (edge_index, start_node_id, end_node_id)
+            unit_rows:  (unit_id, unit_type, faction)
+            path_rows:  (unit_id, node_index) ordered by unit and order_index
+        """
+        index_by_id = {str(node_id): index for node_id, index, _, _ in node_rows}
+        paths: dict[str, list[int]] = {}
+        for unit_id, node_index in path_rows:
+            if node_index is not None:
+                paths.setdefault(str(unit_id), []).append(node_index)
+
+        return cls(
+            meta=dict(puzzle_row),
+            nodes=[(index, x, y, node_id) for node_id, index, x, y in node_rows],
+            edges=[(index, index_by_id.get(str(start)), index_by_id.get(str(end))) for index, start, end in edge_rows],
+            units=[(unit_id, unit_type, faction, paths.get(str(unit_id), [])) for unit_id, unit_type, faction in unit_rows],
+        )
+
+    @classmethod
+    def from_orm(cls, puzzle) -> "PuzzleGraph":
+        """Build from a loaded Puzzle ORM object (nodes, edges, units with paths)"""
+        index_by_id = {str(node.id): node.node_index for node in puzzle.nodes}
+        units = []
+        for unit in puzzle.units:
+            path = []
+            if unit.path and unit.path.path_node:
+                path = [pn.node_index for pn in sorted(unit.path.path_node, key=lambda pn: pn.order_index)]
+            units.append((unit.id, unit.unit_type, unit.faction, path))
+
+        return cls(
+            meta={key: getattr(puzzle, key) for key in ("id", "name", "model", "game_mode", "coins", "description", "is_working")},
+            nodes=[(node.node_index, node.x_position, node.y_position, node.id) for node in puzzle.nodes],
+            edges=[(edge.edge_index, index_by_id.get(str(edge.start_node_id)), index_by_id.get(str(edge.end_node_id)))
+                   for edge in puzzle.edges],
+            units=units,
+        )
+
+    @classmethod
+    def from_create(cls, puzzle_data, puzzle_id=None) -> "PuzzleGraph":
+        """Build from a PuzzleCreate/PuzzleLLMResponse (no row ids yet)"""
+        return cls(
+            meta={
+                "id": puzzle_id,
+                "name": puzzle_data.name,
+                "model": getattr(puzzle_data, "model", None),
+                "game_mode": getattr(puzzle_data, "game_mode", None),
+                "coins": puzzle_data.coins,
+                "description": puzzle_data.description,
+                "is_working": getattr(puzzle_data, "is_working", False),
+            },
+            nodes=[(n.index, n.x, n.y, None) for n in puzzle_data.nodes],
+            edges=[(e.index, e.start, e.end) for e in puzzle_data.edges],
+            units=[(None, u.type, u.faction, list(u.path)) for u in puzzle_data.units],
+        )
+
+    # ---------- binary document (puzzles.graph_blob) ----------
+
+    _BLOB_MAGIC = b"PG1"
+    _BLOB_ARRAYS = ("node_index", "node_x", "node_y", "edge_index", "edge_start", "edge_end", "path_offsets", "path_nodes")
+    _NO_ID = bytes(16)
+
+    def to_bytes(self) -> bytes:
+        """
+        Compact, compressed document of the whole graph:
+            magic | zlib( header length | JSON header | node/unit UUIDs (16 bytes each) | int32 arrays )
+        The CSR adjacency is rebuilt from the edges on load.
+        """
+        header = json.dumps({
+            "meta": {key: getattr(self, key) for key in ("name", "model", "game_mode", "coins", "description", "is_working")},
+            "units": [self.unit_types, self.unit_factions],
+            "sizes": [len(getattr(self, name)) for name in self._BLOB_ARRAYS],
+        }, separators=(",", ":")).encode()
+
+        ids = b"".join(UUID(i).bytes if i else self._NO_ID for i in self.node_ids + self.unit_ids)
+        arrays = []
+        for name in self._BLOB_ARRAYS:
+            values = array("i", getattr(self, name))
+            if sys.byteorder == "big":
+                values.byteswap()  # stored little endian
+            arrays.append(values.tobytes())
+
+        body = struct.pack("<I", len(header)) + header + ids + b"".join(arrays)
+        return self._BLOB_MAGIC + zlib.compress(body, 6)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes, puzzle_id=None) -> "PuzzleGraph":
+        """Rebuild a graph from to_bytes()"""
+        if not blob.startswith(cls._BLOB_MAGIC):
+            raise ValueError("Not a puzzle graph document")
+        body = zlib.decompress(blob[len(cls._BLOB_MAGIC):])
+        (header_size,) = struct.unpack_from("<I", body)
+        offset = 4 + header_size
+        header = json.loads(body[4:offset])
+        unit_types, unit_factions = header["units"]
+        sizes = dict(zip(cls._BLOB_ARRAYS, header["sizes"]))
+
+        ids = []
+        for _ in range(sizes["node_index"] + len(unit_types)):
+            raw = body[offset:offset + 16]
+            ids.append(str(UUID(bytes=raw)) if raw != cls._NO_ID else None)
+            offset += 16
+
+        arrays = {}
+        for name in cls._BLOB_ARRAYS:
+            values = array("i")
+            values.frombytes(body[offset:offset + sizes[name] * values.itemsize])
+            if sys.byteorder == "big":
+                values.byteswap()
+            arrays[name] = values
+            offset += sizes[name] * values.itemsize
+
+        node_ids = ids[:sizes["node_index"]]
+        offsets, path_nodes = arrays["path_offsets"], arrays["path_nodes"]
+        return cls(
+            meta=dict(header["meta"], id=puzzle_id),
+            nodes=zip(arrays["node_index"], arrays["node_x"], arrays["node_y"], node_ids),
+            edges=zip(arrays["edge_index"], arrays["edge_start"], arrays["edge_end"]),
+            units=[(ids[sizes["node_index"] + u], unit_types[u], unit_factions[u], path_nodes[offsets[u]:offsets[u + 1]])
+                   for u in range(len(unit_types))],
+        )
+
+    # ---------- lookups ----------
+
+    @property
+    def node_count(self) -> int:
+        return len(self.node_index)
+
+    @property
+    def edge_count(self) -> int:
+        return len(self.edge_index)
+
+    @property
+    def unit_count(self) -> int:
+        return len(self.unit_types)
+
+    def position(self, node_index: int) -> Optional[int]:
+        """Array position of a node index (None if the node doesn't exist)"""
+        position = bisect_left(self.node_index, node_index)
+        if position < len(self.node_index) and self.node_index[position] == node_index:
+            return position
+        return None
+
+    def neighbours(self, node_index: int) -> list[int]:
+        """Node indexes connected to node_index"""
+        position = self.position(node_index)
+        if position is None:
+            return []
+        targets = self.adj_targets[self.adj_offsets[position]:self.adj_offsets[position + 1]]
+        return [self.node_index[p] for p in targets]
+
+    def unit_path(self, unit: int) -> array:
+        """Node indexes of the path of unit number 'unit'"""
+        return self.path_nodes[self.path_offsets[unit]:self.path_offsets[unit + 1]]
+
+    def node_id(self, node_index: int) -> Optional[str]:
+        position = self.position(node_index)
+        return self.node_ids[position] if position is not None else None
+
+    # ---------- serializers ----------
+
+    def to_editor_dict(self) -> dict:
+        """Editor JSON (/puzzles/{id}/data)"""
+        return {
+            "nodes": [
+                {"id": node_id, "node_index": index, "x_position": x, "y_position": y}
+                for node_id, index, x, y in zip(self.node_ids, self.node_index, self.node_x, self.node_y)
+            ],
+            "edges": [
+                {"edge_index": index, "start_node_id": self.node_id(start), "end_node_id": self.node_id(end)}
+                for index, start, end in zip(self.edge_index, self.edge_start, self.edge_end)
+            ],
+            "units": [
+                {
+                    "id": self.unit_ids[u],
+                    "unit_type": self.unit_types[u],
+                    "faction": self.unit_factions[u],
+                    "path": {
+                        "path_node": [
+                            {"node_id": self.node_id(node_index), "order_index": order, "node_index": node_index}
+                            for order, node_index in enumerate(self.unit_path(u))
+                        ]
+                    },
+                }
+                for u in range(self.unit_count)
+            ],
+        }
+
+    def to_llm_dict(self, model: Optional[str] = None) -> dict:
+        """LLM readable puzzle (PuzzleCreate shape)"""
+        return {
+            "name": self.name,
+            "model": model or self.model,
+            "game_mode": self.game_mode,
+            "coins": self.coins,
+            "nodes": [{"index": index, "x": x, "y": y} for index, x, y in zip(self.node_index, self.node_x, self.node_y)],
+            "edges": [{"index": index, "start": start, "end": end}
+                      for index, start, end in zip(self.edge_index, self.edge_start, self.edge_end)],
+            "units": [
+                {"type": self.unit_types[u], "faction": self.unit_factions[u], "path": self.unit_path(u).tolist()}
+                for u in range(self.unit_count)
+            ],
+            "description": self.description,
+        }
+
+    def to_example_dict(self) -> dict:
+        """Few shot example for the generation prompt (editor JSON with name, description and game mode)"""
+        example = self.to_editor_dict()
+        example["name"] = self.name
+        example["description"] = self.description
+        example["game_mode"] = self.game_mode
+        return example
+
+    # ---------- simulator & validator ----------
+
+    def simulate(self) -> list[list[Optional[int]]]:
+        """
+        Positions of all units turn by turn: turns[t][u] is the node index of unit u in turn t.
+        Units move one node per turn along their path and stay on their last node.
+        """
+        turns = max((self.path_offsets[u + 1] - self.path_offsets[u] for u in range(self.unit_count)), default=0)
+        result = []
+        for turn in range(turns):
+            positions = []
+            for u in range(self.unit_count):
+                path = self.unit_path(u)
+                positions.append(path[min(turn, len(path) - 1)] if path else None)
+            result.append(positions)
+        return result
+
+    def validate(self) -> list[str]:
+        """Check the puzzle against the structural game rules. Returns a list of problems (empty = valid)"""
+        problems = []
+
+        if len(set(self.node_index)) != self.node_count:
+            problems.append("Node indexes are not unique")
+
+        for index, start, end in zip(self.edge_index, self.edge_start, self.edge_end):
+            if self.position(start) is None or self.position(end) is None:
+                problems.append(f"Edge {index} connects unknown nodes ({start} → {end})")
+            elif start == end:
+                problems.append(f"Edge {index} connects node {start} with itself")
+
+        for position in range(self.node_count):
+            if self.adj_offsets[position] == self.adj_offsets[position + 1]:
+                problems.append(f"Node {self.node_index[position]} has no edge")
+
+        # all nodes must be reachable from the first node
+        if self.node_count:
+            seen = {0}
+            queue = deque([0])
+            while queue:
+                position = queue.popleft()
+                for neighbour in self.adj_targets[self.adj_offsets[position]:self.adj_offsets[position + 1]]:
+                    if neighbour not in seen:
+                        seen.add(neighbour)
+                        queue.append(neighbour)
+            if len(seen) != self.node_count:
+                problems.append(f"Graph is not connected ({self.node_count - len(seen)} nodes unreachable)")
+
+        for u in range(self.unit_count):
+            path = self.unit_path(u)
+            label = f"Unit {u} ({self.unit_factions[u]} {self.unit_types[u]})"
+            for step, node_index in enumerate(path):
+                if self.position(node_index) is None:
+                    problems.append(f"{label} path uses unknown node {node_index}")
+                elif step and node_index != path[step - 1] and node_index not in self.neighbours(path[step - 1]):
+                    problems.append(f"{label} moves from node {path[step - 1]} to {node_index} without an edge")
+
+        # no two units may share their start node
+        turns = self.simulate()
+        if turns:
+            starts = [p for p in turns[0] if p is not None]
+            if len(starts) != len(set(starts)):
+                problems.append("More than one unit starts on the same node")
+
+        return problems
@@ -0,0 +1,197 @@
+"""
+SQL statement counting and query budgets (N+1 detection).
+
+instrument_queries(engine) counts every statement of an engine into the QueryCounters that are active
+in the current context. Counters are opened with count_queries() (a block of code) or by
+TracingMiddleware (one per HTTP request). Statements are grouped by shape: literals and bound
+parameters become '?' and IN lists collapse, so the 40 selects of an N+1 loop show up as one shape
+executed 40 times.
+
+    with query_budget(3, "examples"):      # QueryBudgetExceeded if the block sent more than 3 statements
+        services.get_serialized_examples("skirmish")
+
+    @query_budget(5)                       # sync and async functions
+    async def load(...): ...
+
+Per endpoint (route template) the statement counts and the most frequent shapes are collected in
+endpoint_query_stats (GET /debug/queries). QUERY_BUDGETS sets a budget per route, requests above it are
+logged as warnings and counted as over_budget in the report.
+"""
+import functools
+import inspect
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Optional
+import logging
+
+from sqlalchemy import event
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_SHAPES = 50 # shapes kept per endpoint, the rarest ones are dropped
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PARAM = re.compile(r"%\(\w+\)s|%s|:\w+|\$\d+|\?")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_SPACES = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """ SQL with literals and parameters replaced: "SELECT ... WHERE sessions.puzzle_id = ?" """
+    shape = _STRING.sub("?", statement)
+    shape = _PARAM.sub("?", shape)
+    shape = _NUMBER.sub("?", shape)
+    shape = _IN_LIST.sub("IN (...)", shape)
+    return _SPACES.sub(" ", shape).strip()[:300]
+
+
+class QueryBudgetExceeded(AssertionError):
+    """More statements than the budget allows"""
+
+
+class QueryCounter:
+    """Statements (and their shapes) sent while the counter is active"""
+
+    def __init__(self, name: Optional[str] = None):
+        self.name = name
+        self.count = 0
+        self.shapes: Counter[str] = Counter()
+
+    def add(self, statement: str):
+        self.count += 1
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, min_count: int = 2) -> list[tuple[str, int]]:
+        """ Shapes executed at least min_count times, most frequent first (N+1 candidates)"""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= min_count]
+
+    def describe(self, limit: int = 5) -> str:
+        top = "\n".join(f"  {count}x {shape}" for shape, count in self.shapes.most_common(limit))
+        return f"{self.count} statements{f' in {self.name}' if self.name else ''}:\n{top}"
+
+
+# counters of the current request/block, nested ones all count
+current_counters: ContextVar[tuple[QueryCounter, ...]] = ContextVar("query_counters", default=())
+
+
+@contextmanager
+def count_queries(name: Optional[str] = None):
+    """ Count the statements of a block: with count_queries() as counter: ...; counter.count"""
+    counter = QueryCounter(name)
+    token = current_counters.set(current_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        current_counters.reset(token)
+
+
+class query_budget:
+    """
+    Fail if a block or function sends more than max_statements statements.
+    Context manager (with query_budget(3): ...) or decorator for sync and async functions.
+    """
+
+    def __init__(self, max_statements: int, name: Optional[str] = None):
+        self.max_statements = max_statements
+        self.name = name
+        self.counter: Optional[QueryCounter] = None
+        self._scope = None
+
+    def __enter__(self) -> QueryCounter:
+        self._scope = count_queries(self.name)
+        self.counter = self._scope.__enter__()
+        return self.counter
+
+    def __exit__(self, exc_type, exc, tb):
+        self._scope.__exit__(exc_type, exc, tb)
+        if exc_type is None:
+            check_budget(self.counter, self.max_statements)
+        return False
+
+    def __call__(self, func):
+        name = self.name or func.__qualname__
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def run_async(*args, **kwargs):
+                with query_budget(self.max_statements, name):
+                    return await func(*args, **kwargs)
+            return run_async
+
+        @functools.wraps(func)
+        def run(*args, **kwargs):
+            with query_budget(self.max_statements, name):
+                return func(*args, **kwargs)
+        return run
+
+
+def check_budget(counter: QueryCounter, max_statements: int):
+    if counter.count > max_statements:
+        raise QueryBudgetExceeded(f"Query budget of {max_statements} exceeded, {counter.describe()}")
+
+
+def instrument_queries(target_engine):
+    """ Count the statements of a (sync) SQLAlchemy engine, for async engines pass engine.sync_engine"""
+
+    @event.listens_for(target_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        for counter in current_counters.get():
+            counter.add(statement)
+
+
+class EndpointQueryStats:
+    """Statement counts and most frequent shapes per route template (all requests since startup)"""
+
+    def __init__(self):
+        self._routes: dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route: str, counter: QueryCounter):
+        with self._lock:
+            stats = self._routes.setdefault(route, {"requests": 0, "statements": 0, "max": 0, "over_budget": 0,
+                                                    "shapes": Counter()})
+            stats["requests"] += 1
+            stats["statements"] += counter.count
+            stats["max"] = max(stats["max"], counter.count)
+            stats["shapes"].update(counter.shapes)
+            if len(stats["shapes"]) > MAX_SHAPES * 2:
+                stats["shapes"] = Counter(dict(stats["shapes"].most_common(MAX_SHAPES)))
+
+        budget = settings.QUERY_BUDGETS.get(route)
+        if budget is not None and counter.count > budget:
+            with self._lock:
+                stats["over_budget"] += 1
+            logger.warning(f"Query budget of {budget} exceeded by {route}: {counter.describe(3)}")
+
+    def report(self, limit: int = 5, route: Optional[str] = None) -> list[dict]:
+        """ Routes by statements per request, with their most frequent statement shapes per request"""
+        with self._lock:
+            items = [(name, dict(stats, shapes=Counter(stats["shapes"]))) for name, stats in self._routes.items()
+                     if route is None or name.startswith(route)]
+        report = []
+        for name, stats in items:
+            requests = stats["requests"]
+            report.append({
+                "route": name,
+                "requests": requests,
+                "statements_per_request": round(stats["statements"] / requests, 2),
+                "max_statements": stats["max"],
+                "budget": settings.QUERY_BUDGETS.get(name),
+                "over_budget": stats["over_budget"],
+                "top_shapes": [{"shape": shape, "per_request": round(count / requests, 2)}
+                               for shape, count in stats["shapes"].most_common(limit)],
+            })
+        return sorted(report, key=lambda item: item["statements_per_request"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+endpoint_query_stats = EndpointQueryStats()
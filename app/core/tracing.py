@@ -0,0 +1,238 @@
+"""
+Request-scoped timing (Server-Timing header and per-request traces).
+
+TracingMiddleware starts a RequestTrace per HTTP request and keeps it in a context variable.
+Instrumented code adds spans to the trace of the current request:
+  db            SQLAlchemy statements (instrument_engine)
+  llm           LLM calls, tagged with the graph node they ran in (current_node)
+  checkpointer  LangGraph checkpointer reads/writes (trace_methods)
+  serialize     puzzle serialization (JSON / compact text)
+  template      Jinja2 rendering (trace_templates)
+  markdown      chat answer rendering
+The totals per category come back as Server-Timing header, the last REQUEST_TRACES traces with
+all spans are listed by /debug/traces (slowest first). Request and statement durations also go to
+the /metrics histograms (app/core/metrics.py), statement counts per endpoint to /debug/queries
+(app/core/query_budget.py).
+"""
+import functools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from typing import Optional
+from uuid import uuid4
+import logging
+
+from sqlalchemy import event
+
+from app.core.config import settings
+from app.core.metrics import http_request_duration, db_statement_duration
+from app.core.query_budget import count_queries, endpoint_query_stats
+
+logger = logging.getLogger(__name__)
+
+MAX_SPANS = 500 # spans kept per trace, the totals keep counting
+
+current_trace: ContextVar[Optional["RequestTrace"]] = ContextVar("current_trace", default=None)
+current_node: ContextVar[Optional[str]] = ContextVar("current_node", default=None) # agent graph node (set by ChatAgent)
+
+
+class RequestTrace:
+    """Spans and per-category totals of one request"""
+
+    def __init__(self, method: str, path: str):
+        self.id = uuid4().hex[:16]
+        self.method = method
+        self.path = path
+        self.status: Optional[int] = None
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.totals: dict[str, list] = {} # name → [seconds, count]
+        self.spans: list[dict] = []
+
+    def add(self, category: str, seconds: float, name: Optional[str] = None, started: Optional[float] = None):
+        keys = [category] + ([f"{category}.{current_node.get()}"] if category == "llm" and current_node.get() else [])
+        for key in keys:
+            total = self.totals.setdefault(key, [0.0, 0])
+            total[0] += seconds
+            total[1] += 1
+        if settings.REQUEST_TRACES and len(self.spans) < MAX_SPANS:
+            start = (started if started is not None else time.perf_counter() - seconds) - self._started
+            self.spans.append({"category": category, "name": name, "node": current_node.get(),
+                               "start_ms": round(start * 1000, 2), "duration_ms": round(seconds * 1000, 2)})
+
+    def finish(self, status: int):
+        self.status = status
+        self.duration = time.perf_counter() - self._started
+
+    def server_timing(self) -> str:
+        """Server-Timing header value, e.g. 'db;dur=12.1;desc="7x", llm.chat;dur=812.4;desc="1x", total;dur=840.2'"""
+        elapsed = self.duration if self.duration is not None else time.perf_counter() - self._started
+        entries = [f'{name};dur={seconds * 1000:.1f};desc="{count}x"' for name, (seconds, count) in self.totals.items()]
+        entries.append(f"total;dur={elapsed * 1000:.1f}")
+        return ", ".join(entries)
+
+    def to_dict(self, spans: bool = True) -> dict:
+        data = {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "started_at": self.started_at,
+            "duration_ms": round((self.duration or 0) * 1000, 2),
+            "totals": {name: {"ms": round(seconds * 1000, 2), "count": count} for name, (seconds, count) in self.totals.items()},
+        }
+        if spans:
+            data["spans"] = self.spans
+        return data
+
+
+class TraceStore:
+    """Last finished traces (ring buffer of REQUEST_TRACES)"""
+
+    def __init__(self):
+        self._traces: deque[RequestTrace] = deque(maxlen=max(1, settings.REQUEST_TRACES))
+        self._lock = threading.Lock()
+
+    def add(self, trace: RequestTrace):
+        with self._lock:
+            self._traces.append(trace)
+
+    def slowest(self, limit: int = 20, path: Optional[str] = None) -> list[RequestTrace]:
+        with self._lock:
+            traces = [trace for trace in self._traces if path is None or trace.path.startswith(path)]
+        return sorted(traces, key=lambda trace: trace.duration or 0, reverse=True)[:limit]
+
+    def get(self, trace_id: str) -> Optional[RequestTrace]:
+        with self._lock:
+            return next((trace for trace in self._traces if trace.id == trace_id), None)
+
+
+trace_store = TraceStore()
+
+
+def record(category: str, seconds: float, name: Optional[str] = None, started: Optional[float] = None):
+    """ Add a timing to the current request (no-op outside of requests)"""
+    trace = current_trace.get()
+    if trace is not None:
+        trace.add(category, seconds, name, started)
+
+
+@contextmanager
+def span(category: str, name: Optional[str] = None):
+    """ Time a block for the current request: with span("serialize", "puzzle_data"): ..."""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(category, time.perf_counter() - started, name, started)
+
+
+def trace_methods(obj, category: str, names: tuple[str, ...]):
+    """ Time these async methods of one object (e.g. the checkpointer of a chat turn)"""
+    for name in names:
+        method = getattr(obj, name, None)
+        if method is None:
+            continue
+
+        def traced(method, name):
+            @functools.wraps(method)
+            async def run(*args, **kwargs):
+                with span(category, name):
+                    return await method(*args, **kwargs)
+            return run
+        setattr(obj, name, traced(method, name))
+    return obj
+
+
+def trace_templates(templates):
+    """ Time the rendering of a Jinja2Templates instance (TemplateResponse renders right away)"""
+    template_response = templates.TemplateResponse
+
+    @functools.wraps(template_response)
+    def traced(name, *args, **kwargs):
+        with span("template", name):
+            return template_response(name, *args, **kwargs)
+    templates.TemplateResponse = traced
+    return templates
+
+
+def instrument_engine(target_engine, name: str = "sync"):
+    """ Time every statement of a (sync) SQLAlchemy engine, for async engines pass engine.sync_engine"""
+
+    @event.listens_for(target_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("trace_started", []).append(time.perf_counter())
+
+    @event.listens_for(target_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["trace_started"].pop()
+        seconds = time.perf_counter() - started
+        kind = statement.split(None, 1)[0].upper()
+        db_statement_duration.observe(seconds, engine=name, kind=kind)
+        record("db", seconds, kind, started)
+
+
+_route_templates: dict = {}
+
+
+def route_template(scope) -> str:
+    """Path template of the matched route ("/puzzles/{puzzle_id}/data"), keeps the metric labels bounded"""
+    route = scope.get("route")
+    if route is not None and hasattr(route, "path"):
+        return route.path
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    if endpoint not in _route_templates:
+        routes = getattr(scope.get("app"), "routes", [])
+        _route_templates[endpoint] = next((r.path for r in routes if getattr(r, "endpoint", None) is endpoint), "unmatched")
+    return _route_templates[endpoint]
+
+
+class TracingMiddleware:
+    """ASGI middleware: one RequestTrace per HTTP request, Server-Timing and X-Trace-Id response headers"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"].startswith(("/static", "/debug", "/metrics")):
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        trace = RequestTrace(scope["method"], scope["path"])
+        token = current_trace.set(trace)
+        queries = count_queries() if settings.QUERY_STATS else nullcontext()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                trace.finish(message["status"])
+                headers = list(message.get("headers", []))
+                if settings.SERVER_TIMING:
+                    headers.append((b"server-timing", trace.server_timing().encode()))
+                headers.append((b"x-trace-id", trace.id.encode()))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            with queries as counter:
+                await self.app(scope, receive, send_with_timing)
+        finally:
+            current_trace.reset(token)
+            if trace.status is None:
+                trace.finish(500)
+            if settings.REQUEST_TRACES:
+                trace_store.add(trace)
+            route = route_template(scope)
+            http_request_duration.observe(time.perf_counter() - started, method=scope["method"],
+                                          route=route, status=trace.status)
+            if counter is not None:
+                endpoint_query_stats.observe(f"{scope['method']} {route}", counter)
@@ -0,0 +1,183 @@
+"""
+Ledger of all LLM calls (llm_calls table).
+
+InstrumentedClient records every call with tokens, latency and success. Session, puzzle and operation
+come from the UsageScope of the current task (usage_scope(), set per chat turn and generation job),
+the graph node from the tracing context. Rows are buffered in memory and inserted in batches by a
+background task (every LLM_LEDGER_FLUSH_SECONDS or LLM_LEDGER_BATCH_SIZE rows), so recording a call
+is an append to a list and never waits for the database.
+"""
+import asyncio
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Optional
+from uuid import UUID, uuid4
+import logging
+
+from app.core.config import settings
+from app.core.tracing import current_node
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class UsageScope:
+    """ Unit of work the LLM calls belong to (one chat turn, one generation job)"""
+    operation: str
+    session_id: Optional[UUID] = None
+    puzzle_id: Optional[UUID] = None
+    puzzle_nodes: Optional[int] = None
+    group_id: str = field(default_factory=lambda: uuid4().hex)
+
+    def puzzle_created(self, puzzle_id):
+        """ The work stored a puzzle: its calls count as the cost of that puzzle"""
+        usage_ledger.puzzle_created(self.group_id, puzzle_id)
+
+
+current_scope: contextvars.ContextVar[Optional[UsageScope]] = contextvars.ContextVar("usage_scope", default=None)
+
+
+@contextmanager
+def usage_scope(operation: str, **fields):
+    scope = UsageScope(operation, **fields)
+    token = current_scope.set(scope)
+    try:
+        yield scope
+    finally:
+        current_scope.reset(token)
+
+
+def _uuid(value) -> Optional[UUID]:
+    if value is None or isinstance(value, UUID):
+        return value
+    try:
+        return UUID(str(value).strip())
+    except ValueError:
+        return None
+
+
+class UsageLedger:
+    def __init__(self):
+        self._rows: list[dict] = []
+        self._created: list[dict] = [] # {"group_id", "puzzle_id"} updates
+        self._task: Optional[asyncio.Task] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self.dropped = 0
+
+    def record(self, provider: str, model: str, method: str, schema_name: Optional[str], usage: Optional[dict],
+               latency: float, success: bool, error: Optional[str] = None):
+        """ Buffer one call (no I/O)"""
+        if not settings.LLM_LEDGER_ENABLED:
+            return
+        scope = current_scope.get()
+        usage = usage or {}
+        self._rows.append({
+            "created_at": datetime.now(timezone.utc).replace(tzinfo=None),
+            "group_id": scope.group_id if scope else None,
+            "operation": scope.operation if scope else None,
+            "session_id": _uuid(scope.session_id) if scope else None,
+            "puzzle_id": _uuid(scope.puzzle_id) if scope else None,
+            "puzzle_nodes": scope.puzzle_nodes if scope else None,
+            "node": current_node.get(),
+            "provider": provider,
+            "model": model,
+            "method": method,
+            "schema_name": schema_name,
+            "input_tokens": usage.get("input_tokens") or 0,
+            "output_tokens": usage.get("output_tokens") or 0,
+            "cached_tokens": usage.get("cached_tokens") or 0,
+            "total_tokens": usage.get("total_tokens") or 0,
+            "latency_ms": round(latency * 1000, 2),
+            "success": success,
+            "error": error[:500] if error else None,
+        })
+        self._trim()
+        self._ensure_flusher()
+        if len(self._rows) >= settings.LLM_LEDGER_BATCH_SIZE and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _trim(self):
+        """ Database is gone or too slow: keep the newest LLM_LEDGER_MAX_BUFFER rows (and puzzle links)"""
+        overflow = len(self._rows) - settings.LLM_LEDGER_MAX_BUFFER
+        if overflow > 0:
+            del self._rows[:overflow]
+            self.dropped += overflow
+            logger.warning(f"UsageLedger: buffer full, dropped {overflow} rows")
+        overflow = len(self._created) - settings.LLM_LEDGER_MAX_BUFFER
+        if overflow > 0:
+            del self._created[:overflow]
+
+    def puzzle_created(self, group_id: str, puzzle_id):
+        if settings.LLM_LEDGER_ENABLED and _uuid(puzzle_id):
+            self._created.append({"group_id": group_id, "puzzle_id": _uuid(puzzle_id)})
+            self._ensure_flusher()
+
+    def _ensure_flusher(self):
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return # no event loop (sync code), the next async call or stop() writes the rows
+        if self._task is not None and not self._task.done() and self._task.get_loop() is loop:
+            return
+        self._wakeup = asyncio.Event()
+        # own context: the flusher must not inherit the request trace/usage scope of the first caller
+        self._task = loop.create_task(self._flush_loop(), context=contextvars.Context())
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=settings.LLM_LEDGER_FLUSH_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """ Insert the buffered rows (and puzzle links) in one transaction"""
+        if not self._rows and not self._created:
+            return 0
+        rows, self._rows = self._rows, []
+        created, self._created = self._created, []
+
+        from sqlalchemy import insert, update
+        from sqlalchemy.exc import DataError, IntegrityError
+        from app import models
+        from app.core.database import AsyncSessionLocal
+        try:
+            async with AsyncSessionLocal() as db:
+                if rows:
+                    await db.execute(insert(models.LLMCall), rows)
+                for link in created:
+                    await db.execute(
+                        update(models.LLMCall)
+                        .where(models.LLMCall.group_id == link["group_id"])
+                        .values(created_puzzle_id=link["puzzle_id"])
+                    )
+                await db.commit()
+        except (DataError, IntegrityError) as e:
+            # the rows themselves are bad, writing them again won't help
+            self.dropped += len(rows)
+            logger.error(f"UsageLedger: dropped {len(rows)} rows that can't be written: {e}")
+            return 0
+        except Exception as e:
+            # back to the front of the buffers for the next flush, the cap decides what is kept
+            self._rows = rows + self._rows
+            self._created = created + self._created
+            self._trim()
+            logger.error(f"UsageLedger: could not write {len(rows)} rows, retrying with the next flush: {e}")
+            return 0
+        logger.debug(f"UsageLedger: wrote {len(rows)} rows, {len(created)} puzzle links")
+        return len(rows)
+
+    async def stop(self):
+        """ Stop the flusher and write what's left"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+
+usage_ledger = UsageLedger()
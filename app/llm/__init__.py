@@ -1,4 +1,8 @@
 
 from app.llm.llm_manager import get_llm
 from app.llm.openai_client import OpenAIClient
-from app.llm.gemini_client import GeminiClient
\ No newline at end of file
+from app.llm.gemini_client import GeminiClient
+from app.llm.fake_client import FakeLLMClient
+from app.llm.cassette import CassetteClient, CassetteMissError, load_replay
+from app.llm.instrumented_client import InstrumentedClient
+from app.llm.request_policy import PolicyClient, RequestPolicy, LLMRequestError, request_gate
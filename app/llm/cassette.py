@@ -0,0 +1,188 @@
+"""
+Record and replay of LLM interactions (cassettes).
+
+LLM_CASSETTE_MODE="record": every chat/structured call of the real clients is appended to a
+cassette file (JSON lines) with prompt, response, token usage and measured latency. ChatAgent.process
+names the cassette after the chat session and adds a "turn" line per user message, so a recorded
+session can be replayed with `python -m app.cli replay-session <cassette>`.
+
+LLM_CASSETTE_MODE="replay": answers come from the cassettes by prompt hash, the provider is never
+called. LLM_CASSETTE_LATENCY="original" sleeps the recorded latency, "zero" answers at once.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel
+import logging
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# cassette the calls of the current task are recorded to (set per chat turn by ChatAgent.process)
+current_cassette: ContextVar[Optional[str]] = ContextVar("current_cassette", default=None)
+
+DEFAULT_CASSETTE = "default"
+
+_write_lock = threading.Lock()
+_replay: Optional["Cassette"] = None
+
+
+class CassetteMissError(LookupError):
+    """ Replay mode got a prompt that isn't on the cassette"""
+
+
+def prompt_key(method: str, prompt: dict, schema: Optional[type[BaseModel]] = None) -> str:
+    """Hash of what the model sees (model name excluded, so a cassette replays under any model name)"""
+    text = json.dumps([method, schema.__name__ if schema else None, prompt.get("system_prompt"), prompt.get("user_prompt")])
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def cassette_path(name: Optional[str] = None) -> Path:
+    name = re.sub(r"[^\w\-]", "_", str(name or current_cassette.get() or DEFAULT_CASSETTE))
+    return Path(settings.LLM_CASSETTE_DIR) / f"{name}.jsonl"
+
+
+def _append(entry: dict, name: Optional[str] = None):
+    path = cassette_path(name)
+    line = json.dumps(entry, default=str)
+    with _write_lock:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+def record_turn(session_id, message: str, puzzle_id, result_puzzle_id, model: str):
+    """ Turn line: what the user sent, so the session can be replayed through the agent"""
+    if settings.LLM_CASSETTE_MODE != "record":
+        return
+    _append({"type": "turn", "message": message, "puzzle_id": puzzle_id, "result_puzzle_id": result_puzzle_id,
+             "model": model, "recorded_at": time.time()}, name=session_id)
+
+
+class Cassette:
+    """Loaded cassette entries; interactions are served by prompt hash, each recorded answer once"""
+
+    def __init__(self, entries: list[dict]):
+        self.turns = [entry for entry in entries if entry.get("type") == "turn"]
+        self.interactions = [entry for entry in entries if entry.get("type") == "llm"]
+        self._by_key: dict[str, list[int]] = defaultdict(list)
+        for position, entry in enumerate(self.interactions):
+            self._by_key[entry["key"]].append(position)
+        self._used: set[int] = set()
+        self.hits = 0
+        self.fallbacks = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, *paths: Path) -> "Cassette":
+        entries = []
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                entries.extend(json.loads(line) for line in f if line.strip())
+        return cls(entries)
+
+    def lookup(self, key: str, method: str, schema_name: Optional[str]) -> dict:
+        """
+        Recorded interaction for the prompt hash. Same prompt asked more often than recorded → last answer again.
+        Unknown prompt → next unused interaction of the same kind (prompts with e.g. generated ids differ per run).
+        Errors and empty answers that were retried (a later entry of the prompt has an answer) are skipped:
+        replay has no request policy that would retry them.
+        """
+        positions = self._by_key.get(key)
+        if positions:
+            self.hits += 1
+            unused = [p for p in positions if p not in self._used]
+            answered = [p for p in unused if self._answered(p)]
+            if answered:
+                position = answered[0]
+                self._used.update(p for p in unused if p < position) # the failed attempts of this call
+            elif unused:
+                position = unused[0] # every attempt failed, so did the recorded call
+            else:
+                position = next((p for p in reversed(positions) if self._answered(p)), positions[-1])
+        else:
+            position = next((p for p, entry in enumerate(self.interactions)
+                             if p not in self._used and entry["method"] == method and entry.get("schema") == schema_name), None)
+            if position is None:
+                self.misses += 1
+                raise CassetteMissError(f"No recorded {method} answer for prompt {key[:12]}")
+            self.fallbacks += 1
+            logger.warning(f"Cassette: prompt {key[:12]} not recorded, serving the next {method} answer in order")
+        self._used.add(position)
+        return self.interactions[position]
+
+    def _answered(self, position: int) -> bool:
+        entry = self.interactions[position]
+        return not entry.get("error") and entry.get("response") is not None
+
+
+def load_replay(*paths) -> Cassette:
+    """ Serve replays from these cassette files (default: all cassettes in LLM_CASSETTE_DIR)"""
+    global _replay
+    _replay = Cassette.load(*[Path(path) for path in paths])
+    return _replay
+
+
+def replay_cassette() -> Cassette:
+    if _replay is None:
+        load_replay(*sorted(Path(settings.LLM_CASSETTE_DIR).glob("*.jsonl")))
+    return _replay
+
+
+class CassetteClient:
+    """
+    Wraps an LLM client (chat/structured, last_usage) for record or replay.
+    Replay needs no inner client, the provider isn't called.
+    """
+
+    def __init__(self, client, model_name: str, mode: Optional[str] = None):
+        self.client = client
+        self.model_name = model_name
+        self.mode = mode or settings.LLM_CASSETTE_MODE
+        self.last_usage = None
+
+    async def chat(self, prompt: dict):
+        return await self._call("chat", prompt)
+
+    async def structured(self, prompt: dict, schema: type[BaseModel]):
+        return await self._call("structured", prompt, schema)
+
+    async def _call(self, method: str, prompt: dict, schema: Optional[type[BaseModel]] = None):
+        key = prompt_key(method, prompt, schema)
+        if self.mode == "replay":
+            return await self._replay(key, method, schema)
+
+        args = (prompt, schema) if schema else (prompt,)
+        started = time.perf_counter()
+        entry = {"type": "llm", "key": key, "method": method, "schema": schema.__name__ if schema else None,
+                 "model": self.model_name, "prompt": prompt}
+        try:
+            result = await getattr(self.client, method)(*args)
+        except Exception as e:
+            _append(dict(entry, error=f"{type(e).__name__}: {e}", latency=time.perf_counter() - started))
+            raise
+        self.last_usage = self.client.last_usage
+        response = result.model_dump(mode="json") if isinstance(result, BaseModel) else result
+        _append(dict(entry, response=response, usage=self.last_usage, latency=time.perf_counter() - started))
+        return result
+
+    async def _replay(self, key: str, method: str, schema: Optional[type[BaseModel]]):
+        entry = replay_cassette().lookup(key, method, schema.__name__ if schema else None)
+        if settings.LLM_CASSETTE_LATENCY == "original" and entry.get("latency"):
+            await asyncio.sleep(entry["latency"])
+        self.last_usage = entry.get("usage")
+        if entry.get("error"):
+            raise RuntimeError(f"Recorded LLM error: {entry['error']}")
+        response = entry.get("response")
+        if schema is None or response is None:
+            return response
+        return schema.model_validate(response)
@@ -0,0 +1,233 @@
+"""
+Local LLM provider for offline load tests (model names starting with "fake").
+
+No network: answers are built from the prompt. Puzzles are valid PuzzleLLMResponse/PuzzleCreate
+payloads (connected map, unit paths along edges, distinct start nodes). Answers are seeded
+by FAKE_LLM_SEED + prompt, so the same prompt always gets the same answer. Latency is drawn
+from the distribution configured per model in FAKE_LLM_LATENCY. Rules in the FAKE_LLM_SCRIPT
+file (or added with add_rule) take precedence over the built-in answers.
+"""
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel
+import logging
+
+from app.core.config import settings
+from app.prompts.puzzle_encoding import encode_puzzle
+
+logger = logging.getLogger(__name__)
+
+# (compiled pattern, response) checked in order, see add_rule
+_rules: list[tuple[re.Pattern, Any]] = []
+_script_loaded = False
+_latency_rng = random.Random(settings.FAKE_LLM_SEED)
+
+INTENT_HINTS = {
+    "modify": r"\b(add|remove|delete|move|change|connect|update|fix|replace|set)\b",
+    "create": r"\b(create|build|design|make)\b",
+    "generate": r"\b(generate|random|surprise)\b",
+}
+
+
+def add_rule(pattern: str, response: Any):
+    """Script an answer: prompts (system + user) matching the regex get 'response' (text, or a dict for structured)"""
+    _rules.append((re.compile(pattern, re.IGNORECASE | re.DOTALL), response))
+
+
+def clear_rules():
+    global _script_loaded
+    _rules.clear()
+    _script_loaded = False
+
+
+def _load_script():
+    """Rules from FAKE_LLM_SCRIPT: a JSON list of {"match": regex, "response": text or object}"""
+    global _script_loaded
+    if _script_loaded:
+        return
+    _script_loaded = True
+    if settings.FAKE_LLM_SCRIPT:
+        for rule in json.loads(Path(settings.FAKE_LLM_SCRIPT).read_text(encoding="utf-8")):
+            add_rule(rule["match"], rule["response"])
+        logger.info(f"FakeLLMClient: loaded {len(_rules)} scripted rules from {settings.FAKE_LLM_SCRIPT}")
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    Latency distribution in seconds: "0.5" or "fixed:0.5", "uniform:min,max",
+    "normal:mean,sd", "lognormal:median,sigma", "exp:mean"
+    """
+    kind, _, params = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+    values = [float(value) for value in params.split(",") if value.strip()]
+    if kind == "fixed":
+        return lambda rng: values[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda rng: max(0.0, rng.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(math.log(values[0]), values[1]) if values[0] > 0 else 0.0
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1 / values[0]) if values[0] > 0 else 0.0
+    raise ValueError(f"Unknown latency distribution '{spec}'")
+
+
+def latency_spec(model_name: str) -> str:
+    """Distribution of the longest FAKE_LLM_LATENCY key the model name starts with"""
+    matches = [key for key in settings.FAKE_LLM_LATENCY if model_name.startswith(key)]
+    return settings.FAKE_LLM_LATENCY[max(matches, key=len)] if matches else "0"
+
+
+def fake_puzzle(rng: random.Random, node_count: int = 12, enemies: int = 2, players: int = 1, turns: int = 4,
+                name: Optional[str] = None) -> dict:
+    """Valid puzzle dict (PuzzleLLMResponse fields): grid map with a few diagonals, units walking along edges"""
+    node_count = max(4, min(node_count, 400))
+    columns = max(2, round(math.sqrt(node_count)))
+    nodes = [{"index": i, "x": (i % columns) * 200 + rng.randint(-40, 40), "y": (i // columns) * 200 + rng.randint(-40, 40)}
+             for i in range(node_count)]
+
+    pairs = []
+    for i in range(node_count):
+        if (i + 1) % columns and i + 1 < node_count:
+            pairs.append((i, i + 1))
+        if i + columns < node_count:
+            pairs.append((i, i + columns))
+        if (i + 1) % columns and i + columns + 1 < node_count and rng.random() < 0.2:
+            pairs.append((i, i + columns + 1))
+    edges = [{"index": index, "start": start, "end": end} for index, (start, end) in enumerate(pairs)]
+
+    neighbours: dict[int, list[int]] = {i: [] for i in range(node_count)}
+    for start, end in pairs:
+        neighbours[start].append(end)
+        neighbours[end].append(start)
+
+    starts = rng.sample(range(node_count), min(node_count, enemies + players))
+    units = []
+    for position, start in enumerate(starts):
+        path = [start]
+        for _ in range(max(0, turns - 1)):
+            path.append(rng.choice(neighbours[path[-1]]))
+        units.append({"type": rng.choice(["Grunt", "Swordsman"]),
+                      "faction": "enemy" if position < enemies else "player",
+                      "path": path})
+
+    return {
+        "name": name or f"Fake Puzzle {rng.randint(1, 9999)}",
+        "nodes": nodes,
+        "edges": edges,
+        "units": units,
+        "coins": rng.randint(3, 10),
+        "description": "Generated by the fake LLM provider.",
+    }
+
+
+class FakeLLMClient:
+    def __init__(self, model_name="fake"):
+        self.model_name = model_name
+        self.last_usage = None # token usage of the latest call (estimated, 4 chars per token)
+        self._latency = parse_latency(latency_spec(model_name))
+
+    def _rng(self, prompt: dict) -> random.Random:
+        digest = hashlib.sha256(f"{settings.FAKE_LLM_SEED}|{prompt.get('system_prompt')}|{prompt.get('user_prompt')}".encode())
+        return random.Random(digest.hexdigest())
+
+    async def _wait(self):
+        delay = self._latency(_latency_rng)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _track_usage(self, prompt: dict, output: str):
+        input_tokens = (len(str(prompt.get("system_prompt") or "")) + len(str(prompt.get("user_prompt") or ""))) // 4
+        output_tokens = len(output) // 4
+        self.last_usage = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                           "cached_tokens": 0, "total_tokens": input_tokens + output_tokens}
+
+    def _scripted(self, prompt: dict):
+        _load_script()
+        text = f"{prompt.get('system_prompt')}\n{prompt.get('user_prompt')}"
+        for pattern, response in _rules:
+            if pattern.search(text):
+                return response
+        return None
+
+    def _puzzle_request(self, prompt: dict, rng: random.Random) -> dict:
+        """Puzzle sized after the numbers in the prompt (node count, turns, units) or defaults"""
+        text = f"{prompt.get('system_prompt')}\n{prompt.get('user_prompt')}"
+        number = lambda pattern, default: int(m.group(1)) if (m := re.search(pattern, text, re.IGNORECASE)) else default
+        return fake_puzzle(
+            rng,
+            node_count=number(r"Number of Nodes:\s*(\d+)", number(r"(\d+)\s+nodes", 12)),
+            turns=number(r"Turns:\s*(\d+)", number(r"(\d+)\s+turns", 4)),
+            enemies=number(r"(\d+)\s+enem", 2),
+            players=number(r"(\d+)\s+player", 1),
+        )
+
+    # Chat Function
+    async def chat(self, prompt: dict):
+        await self._wait()
+        rng = self._rng(prompt)
+        system_prompt = prompt.get("system_prompt") or ""
+        user_prompt = prompt.get("user_prompt") or ""
+
+        scripted = self._scripted(prompt)
+        if scripted is not None:
+            response = scripted if isinstance(scripted, str) else json.dumps(scripted)
+        elif "intent classifier" in system_prompt:
+            response = self._intent(system_prompt, user_prompt, rng)
+        elif "Extract puzzle generation parameters" in system_prompt:
+            response = json.dumps({
+                "name": f"Fake Puzzle {rng.randint(1, 9999)}", "game_mode": "skirmish",
+                "node_count": rng.randint(8, 20), "edge_count": None, "turns": rng.randint(3, 6),
+                "units": [{"type": "Grunt", "faction": "enemy", "count": 2}, {"type": "Swordsman", "faction": "player", "count": 1}],
+                "description": None,
+            })
+        elif re.search(r"(output the puzzle|modified puzzle) in the compact puzzle format", system_prompt):
+            response = encode_puzzle(self._puzzle_request(prompt, rng))
+        elif "3 to 5 words" in system_prompt:
+            response = " ".join(rng.sample(["Noble", "Tactical", "Bridge", "Ambush", "Forest", "Siege", "Puzzle", "Quest"], 4))
+        else:
+            words = ["The", "enemy", "moves", "along", "the", "northern", "path", "while", "your", "units", "hold", "the", "bridge."]
+            response = " ".join(rng.choice(words) for _ in range(rng.randint(20, 80)))
+
+        self._track_usage(prompt, response)
+        return response
+
+    def _intent(self, system_prompt: str, user_prompt: str, rng: random.Random) -> str:
+        """One of the offered intents: keyword match on the message, else random"""
+        options = re.findall(r"'(\w+)'", system_prompt.split("Return ONLY one word:")[-1].split("\n\n")[0]) or ["chat"]
+        for option in options:
+            if option in INTENT_HINTS and re.search(INTENT_HINTS[option], user_prompt, re.IGNORECASE):
+                return option
+        return rng.choice(options)
+
+    # for structured output
+    async def structured(self, prompt: dict, schema: type[BaseModel]):
+        await self._wait()
+        rng = self._rng(prompt)
+        fields = schema.model_fields
+
+        scripted = self._scripted(prompt)
+        if scripted is not None:
+            data = json.loads(scripted) if isinstance(scripted, str) else scripted
+        elif "ops" in fields:
+            # PuzzleEditResponse: nudge node 0 (every puzzle has it)
+            data = {"ops": [{"op": "move_node", "node": 0, "x": rng.randint(0, 800), "y": rng.randint(0, 800)}]}
+        elif "nodes" in fields:
+            data = self._puzzle_request(prompt, rng)
+            # PuzzleCreate needs a few more fields than PuzzleLLMResponse
+            defaults = {"model": self.model_name, "game_mode": "skirmish", "is_working": False}
+            data.update({key: value for key, value in defaults.items() if key in fields})
+        else:
+            logger.warning(f"FakeLLMClient: no fake answer for schema {schema.__name__}")
+            return None
+
+        data = {key: value for key, value in data.items() if key in fields}
+        self._track_usage(prompt, json.dumps(data))
+        return schema.model_validate(data)
@@ -3,6 +3,8 @@ from app.core.config import settings
 from pydantic import BaseModel
 import logging
 
+from utils.logger_config import payload, sampled
+
 
 
 logger = logging.getLogger(__name__)
@@ -13,6 +15,7 @@ class GeminiClient:
     def __init__(self, model_name="gemini-2.5-flash"):
         self.client = genai.Client(api_key=API_KEY)
         self.model_name = model_name
+        self.last_usage = None # token usage of the latest call
 
     def _get_clean_schema(self, pydantic_model: type[BaseModel]) -> dict:
         """
@@ -38,6 +41,18 @@ class GeminiClient:
         clean_recursive(schema)
         return schema
 
+    def _track_usage(self, response):
+        """ Store token usage from response.usage_metadata"""
+        usage = getattr(response, "usage_metadata", None)
+        if not usage:
+            self.last_usage = None
+            return
+        self.last_usage = {
+            "input_tokens": usage.prompt_token_count or 0,
+            "output_tokens": usage.candidates_token_count or 0,
+            "cached_tokens": usage.cached_content_token_count or 0,
+            "total_tokens": usage.total_token_count or 0,
+        }
 
     async def structured(self, prompt: str, schema: type[BaseModel]):
         """
@@ -48,7 +63,7 @@ class GeminiClient:
         target_schema = self._get_clean_schema(schema)
 
         try:
-            response = self.client.models.generate_content(
+            response = await self.client.aio.models.generate_content(
                 model=self.model_name,
                 contents=prompt["user_prompt"],
                 config={
@@ -57,7 +72,8 @@ class GeminiClient:
                     "response_schema": target_schema,
                 },
             )
-            logger.info(response.text)
+            logger.info("GeminiClient structured response: %s", payload(response.text), extra=sampled("llm_response"))
+            self._track_usage(response)
 
             if response.parsed and isinstance(response.parsed, (dict, list)):
                 return schema.model_validate(response.parsed)
@@ -73,7 +89,7 @@ class GeminiClient:
     # Chat function
     async def chat(self, prompt: str):
         try:
-            response = self.client.models.generate_content(
+            response = await self.client.aio.models.generate_content(
                 model=self.model_name,
                 contents=prompt["user_prompt"],
                 config={
@@ -84,6 +100,7 @@ class GeminiClient:
             logger.error(e)
             return None
 
-        logger.info(response)
+        logger.info("GeminiClient chat response: %s", payload(response), extra=sampled("llm_response"))
+        self._track_usage(response)
 
         return response.text
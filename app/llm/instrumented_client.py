@@ -0,0 +1,75 @@
+import asyncio
+import time
+from typing import Optional
+
+from pydantic import BaseModel
+import logging
+
+from app.core.tracing import record
+from app.core.metrics import llm_request_duration, llm_requests, llm_tokens, llm_in_flight, provider_name
+from app.core.usage_ledger import usage_ledger
+from app.llm.request_policy import current_request_gate
+
+logger = logging.getLogger(__name__)
+
+
+class InstrumentedClient:
+    """
+    Wraps every client returned by get_llm: times chat/structured calls for the request trace
+    (tagged with the current graph node) and the /metrics histograms, counts the tokens of last_usage
+    and records the call to the usage ledger. Calls wait for the request gate of the context first
+    (see request_policy.request_gate). Everything else is passed through to the client.
+    """
+
+    def __init__(self, client, model_name: str):
+        self.client = client
+        self.model_name = model_name
+        self.provider = provider_name(model_name)
+
+    def __getattr__(self, name):
+        # last_usage, model_name, ... of the wrapped client
+        return getattr(self.client, name)
+
+    async def chat(self, prompt: dict):
+        return await self._call("chat", prompt)
+
+    async def structured(self, prompt: dict, schema: type[BaseModel]):
+        return await self._call("structured", prompt, schema)
+
+    async def _call(self, method: str, prompt: dict, schema: Optional[type[BaseModel]] = None):
+        gate = current_request_gate.get()
+        if gate is None:
+            return await self._send(method, prompt, schema)
+        async with gate(self.model_name): # waiting for the gate isn't part of the request latency
+            return await self._send(method, prompt, schema)
+
+    async def _send(self, method: str, prompt: dict, schema: Optional[type[BaseModel]] = None):
+        args = (prompt, schema) if schema else (prompt,)
+        labels = {"provider": self.provider, "model": self.model_name}
+        self.client.last_usage = None # the clients only set it on success
+        outcome, error = "error", None
+        llm_in_flight.inc(provider=self.provider)
+        started = time.perf_counter()
+        try:
+            result = await getattr(self.client, method)(*args)
+            outcome = "ok" if result is not None else "empty" # clients return None on (some) errors
+            return result
+        except asyncio.CancelledError:
+            outcome, error = "cancelled", "cancelled (hedge lost or deadline)"
+            raise
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            seconds = time.perf_counter() - started
+            llm_in_flight.dec(provider=self.provider)
+            llm_request_duration.observe(seconds, method=method, **labels)
+            llm_requests.inc(method=method, outcome=outcome, **labels)
+            for kind in ("input", "output", "cached"):
+                tokens = (self.client.last_usage or {}).get(f"{kind}_tokens")
+                if tokens:
+                    llm_tokens.inc(tokens, kind=kind, **labels)
+            record("llm", seconds, f"{self.model_name}.{method}", started)
+            usage_ledger.record(self.provider, self.model_name, method, schema.__name__ if schema else None,
+                                self.client.last_usage, seconds, success=outcome == "ok",
+                                error=error or (f"{self.model_name} returned no result" if outcome == "empty" else None))
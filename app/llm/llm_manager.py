@@ -2,13 +2,37 @@ import logging
 
 from app.llm.openai_client import OpenAIClient
 from app.llm.gemini_client import GeminiClient
+from app.llm.fake_client import FakeLLMClient
+from app.llm.cassette import CassetteClient
+from app.llm.instrumented_client import InstrumentedClient
+from app.llm.request_policy import PolicyClient
+from app.core.config import settings
 
 def get_llm(model_name: str):
-    """ Select model based on name"""
+    """ Select model based on name (wrapped for recording/replay if LLM_CASSETTE_MODE is set)"""
+    client = _instrumented_client(model_name)
+    if client is None or not settings.LLM_POLICY_ENABLED or settings.LLM_CASSETTE_MODE == "replay":
+        return client # replay answers in the recorded order, retries and hedges would skip entries
+    return PolicyClient(_instrumented_client, model_name)
+
+
+def _instrumented_client(model_name: str):
+    if settings.LLM_CASSETTE_MODE == "replay":
+        client = CassetteClient(None, model_name) # recorded answers only, no provider needed
+    else:
+        client = _provider_client(model_name)
+        if settings.LLM_CASSETTE_MODE == "record" and client is not None:
+            client = CassetteClient(client, model_name)
+    return InstrumentedClient(client, model_name) if client is not None else None
+
+
+def _provider_client(model_name: str):
     if model_name.startswith("gpt"):
         return OpenAIClient(model_name)
     elif model_name.startswith("gemini"):
         return GeminiClient(model_name)
+    elif model_name.startswith("fake"):
+        return FakeLLMClient(model_name) # local, for offline load tests
 
 
 # def get_lang_graph_llm(model_name: str):
@@ -12,8 +12,10 @@ API_KEY = settings.OPENAI_API_KEY
 
 class OpenAIClient:
     def __init__(self, model_name="gpt-4o-mini"):
-        self.client = AsyncOpenAI(api_key=API_KEY)
+        # retries and timeouts come from the request policy (app/llm/request_policy.py), not from the SDK
+        self.client = AsyncOpenAI(api_key=API_KEY, max_retries=0 if settings.LLM_POLICY_ENABLED else 2)
         self.model_name = model_name
+        self.last_usage = None # token usage of the latest call
 
     def _clean_data(self, data: Any, schema: Type[BaseModel]) -> Any:
         """
@@ -49,7 +51,13 @@ class OpenAIClient:
         logger.info(f"input tokens: {response.usage.input_tokens}")
         logger.info(f"output tokens: {response.usage.output_tokens}")
         logger.info(f"total tokens: {response.usage.total_tokens}")
-        usage = [response.usage.input_tokens,response.usage.output_tokens, response.usage.total_tokens]
+        cached = getattr(getattr(response.usage, "input_tokens_details", None), "cached_tokens", 0) or 0
+        self.last_usage = {
+            "input_tokens": response.usage.input_tokens,
+            "output_tokens": response.usage.output_tokens,
+            "cached_tokens": cached,
+            "total_tokens": response.usage.total_tokens,
+        }
 
         return response.output[0].content[0].text
 
@@ -100,5 +108,12 @@ class OpenAIClient:
                 f"\ncompletion: {usage.completion_tokens}, "
                 f"\ntotal: {usage.total_tokens}"
             )
+            cached = getattr(getattr(usage, "prompt_tokens_details", None), "cached_tokens", 0) or 0
+            self.last_usage = {
+                "input_tokens": usage.prompt_tokens,
+                "output_tokens": usage.completion_tokens,
+                "cached_tokens": cached,
+                "total_tokens": usage.total_tokens,
+            }
 
         return puzzle
\ No newline at end of file
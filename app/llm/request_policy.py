@@ -0,0 +1,263 @@
+"""
+Request policies for LLM calls: deadline, retries with jittered backoff and hedging.
+
+get_llm wraps every client in a PolicyClient. The policy of a call is picked by method ("chat",
+"structured") from LLM_POLICIES:
+  deadline          seconds for the whole call (all attempts, backoff and hedges)
+  attempt_timeout   seconds for one attempt
+  retries           extra attempts after an error, a timeout or an empty (None) result
+  backoff           base of the backoff: before retry n sleep uniform(0, min(max_backoff, backoff * 2**n))
+  hedge_percentile  if an attempt is still running after this latency percentile of the model
+                    (e.g. 95), a second request goes to LLM_HEDGE_MODELS[model] (default: the same model),
+                    the first answer wins and the other request is cancelled. None = no hedging
+  hedge_min_delay   never hedge earlier than this (seconds)
+
+Every attempt, retry and hedge is its own InstrumentedClient call (trace, /metrics, usage ledger) and
+passes the request gate of the context (request_gate(), e.g. the provider limits of a batch). The
+end-to-end latency per policy goes to llm_policy_duration_seconds and llm_policy_latency_seconds.
+Errors that won't go away with a retry (4xx except 408/409/429, invalid arguments, cassette misses)
+are raised right away. If all attempts fail, the last error is raised as LLMRequestError; if they
+only returned empty results, None is returned like the clients do.
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, fields
+from typing import Callable, Optional
+
+from pydantic import BaseModel
+import logging
+
+from app.core.config import settings
+from app.core.metrics import llm_policy_duration, llm_policy_attempts
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SIZE = 200 # recent latencies kept per model/method and per policy
+MIN_SAMPLES = 20 # latencies needed before hedging starts
+RETRYABLE_STATUS = (408, 409, 429)
+
+
+class LLMRequestError(RuntimeError):
+    """All attempts of an LLM call failed (or its deadline passed)"""
+
+
+@dataclass(frozen=True)
+class RequestPolicy:
+    name: str
+    deadline: float = 90.0
+    attempt_timeout: float = 45.0
+    retries: int = 2
+    backoff: float = 0.5
+    max_backoff: float = 8.0
+    hedge_percentile: Optional[float] = None
+    hedge_min_delay: float = 1.0
+
+    @classmethod
+    def from_settings(cls, name: str) -> "RequestPolicy":
+        known = {field.name for field in fields(cls)}
+        options = {key: value for key, value in settings.LLM_POLICIES.get(name, {}).items() if key in known}
+        return cls(name=name, **options)
+
+    def backoff_delay(self, retry: int) -> float:
+        """ Full jitter: spreads the retries of many calls that failed at the same time"""
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** retry))
+
+
+class LatencyWindow:
+    """Last WINDOW_SIZE latencies of one key (seconds) with nearest-rank percentiles"""
+
+    def __init__(self):
+        self._values: deque[float] = deque(maxlen=WINDOW_SIZE)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._values.append(seconds)
+
+    def __len__(self):
+        return len(self._values)
+
+    def percentile(self, pct: float) -> Optional[float]:
+        with self._lock:
+            ordered = sorted(self._values)
+        if not ordered:
+            return None
+        rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+        return ordered[rank]
+
+
+# successful attempts per (model, method): hedge thresholds
+model_latencies: dict[tuple[str, str], LatencyWindow] = {}
+# whole calls per policy: tail latency in /metrics
+policy_latencies: dict[str, LatencyWindow] = {}
+
+
+# hedge clients per model, shared by all calls (one connection pool per provider client)
+_hedge_clients: dict[str, object] = {}
+
+# admission of every single LLM request: gate(model_name) returns an async context manager that is
+# held while the request runs. None = no limit
+current_request_gate: ContextVar[Optional[Callable]] = ContextVar("llm_request_gate", default=None)
+
+
+@contextmanager
+def request_gate(gate: Callable):
+    """ Route every LLM request of the block (attempts, retries, hedges) through gate(model_name)"""
+    token = current_request_gate.set(gate)
+    try:
+        yield
+    finally:
+        current_request_gate.reset(token)
+
+
+def _window(windows: dict, key) -> LatencyWindow:
+    window = windows.get(key)
+    if window is None:
+        window = windows.setdefault(key, LatencyWindow())
+    return window
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, (LookupError, TypeError, ValueError)):
+        return False # cassette misses, wrong arguments, validation errors
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int) and 400 <= status < 500:
+        return status in RETRYABLE_STATUS
+    return True # 5xx, connection resets, provider hiccups
+
+
+class PolicyClient:
+    """
+    Applies the RequestPolicy of each call to the clients built by client_factory(model_name)
+    (instrumented provider clients). last_usage is the usage of the answer that was used.
+    """
+
+    def __init__(self, client_factory: Callable, model_name: str):
+        self.client_factory = client_factory
+        self.model_name = model_name
+        self.client = client_factory(model_name)
+        self.last_usage = None
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    async def chat(self, prompt: dict):
+        return await self._call("chat", prompt)
+
+    async def structured(self, prompt: dict, schema: type[BaseModel]):
+        return await self._call("structured", prompt, schema)
+
+    def _hedge_delay(self, policy: RequestPolicy, method: str) -> Optional[float]:
+        if policy.hedge_percentile is None or settings.LLM_CASSETTE_MODE == "record":
+            return None # a hedge would be recorded as an extra interaction
+        window = model_latencies.get((self.model_name, method))
+        if window is None or len(window) < MIN_SAMPLES:
+            return None
+        return max(policy.hedge_min_delay, window.percentile(policy.hedge_percentile))
+
+    def _hedge_client(self):
+        # not self.client: the primary request is still running on it
+        model = settings.LLM_HEDGE_MODELS.get(self.model_name, self.model_name)
+        client = _hedge_clients.get(model)
+        if client is None:
+            client = _hedge_clients.setdefault(model, self.client_factory(model))
+        return client
+
+    async def _call(self, method: str, prompt: dict, schema: Optional[type[BaseModel]] = None):
+        policy = RequestPolicy.from_settings(method)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + policy.deadline
+        started = time.perf_counter()
+        self.last_usage = None
+        outcome, error = "error", None
+        try:
+            for attempt in range(policy.retries + 1):
+                if attempt:
+                    llm_policy_attempts.inc(policy=policy.name, kind="retry")
+                    await asyncio.sleep(min(policy.backoff_delay(attempt - 1), max(0.0, deadline - loop.time())))
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    outcome = "deadline"
+                    break
+                try:
+                    result = await self._attempt(method, prompt, schema, policy, min(remaining, policy.attempt_timeout))
+                except asyncio.TimeoutError as e:
+                    error = e
+                    outcome = "deadline" if deadline - loop.time() <= 0 else "timeout"
+                    logger.warning(f"{self.model_name}.{method}: attempt {attempt + 1} timed out ({policy.name} policy)")
+                    continue
+                except Exception as e:
+                    error = e
+                    if not is_retryable(e):
+                        raise
+                    logger.warning(f"{self.model_name}.{method}: attempt {attempt + 1} failed: {e}")
+                    continue
+                if result is not None:
+                    outcome = "ok"
+                    return result
+                error, outcome = None, "empty"
+                logger.warning(f"{self.model_name}.{method}: attempt {attempt + 1} returned no result")
+
+            if error is None and outcome == "empty":
+                return None
+            raise LLMRequestError(f"{self.model_name}.{method} failed after {attempt + 1} attempt(s) "
+                                  f"({outcome}, {policy.name} policy): {error!r}") from error
+        finally:
+            seconds = time.perf_counter() - started
+            llm_policy_duration.observe(seconds, policy=policy.name, outcome=outcome)
+            if outcome == "ok":
+                _window(policy_latencies, policy.name).add(seconds)
+
+    async def _attempt(self, method: str, prompt: dict, schema, policy: RequestPolicy, timeout: float):
+        """ One attempt, hedged after the model's latency percentile. Raises the error of the last request that failed"""
+        loop = asyncio.get_running_loop()
+        expires = loop.time() + timeout
+        hedge_delay = self._hedge_delay(policy, method)
+        tasks = {asyncio.create_task(self._send(self.client, method, prompt, schema)): "primary"}
+        last_error: Optional[BaseException] = None
+        try:
+            if hedge_delay is not None and hedge_delay < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    llm_policy_attempts.inc(policy=policy.name, kind="hedge")
+                    tasks[asyncio.create_task(self._send(self._hedge_client(), method, prompt, schema))] = "hedge"
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, expires - loop.time()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    raise asyncio.TimeoutError()
+                last_error = next((task.exception() for task in done if task.exception()), last_error)
+                # answers first, an empty result only counts once nothing else is running
+                answers = sorted((task for task in done if not task.exception()), key=lambda t: t.result()[1] is None)
+                if answers and (answers[0].result()[1] is not None or not pending):
+                    _, result, usage = answers[0].result()
+                    if len(tasks) > 1:
+                        llm_policy_attempts.inc(policy=policy.name, kind=f"{tasks[answers[0]]}_won")
+                    self.last_usage = usage
+                    return result
+            raise last_error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _send(self, client, method: str, prompt: dict, schema):
+        started = time.perf_counter()
+        window = _window(model_latencies, (client.model_name, method))
+        try:
+            result = await (client.structured(prompt, schema) if schema else client.chat(prompt))
+        except asyncio.CancelledError:
+            # lost the hedge race: it took at least this long, keeps the slow tail in the window
+            window.add(time.perf_counter() - started)
+            raise
+        usage = client.last_usage # right away, hedge clients are shared by concurrent calls
+        if result is not None:
+            window.add(time.perf_counter() - started)
+        return client, result, usage
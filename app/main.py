@@ -1,9 +1,14 @@
 from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
-from app.routers import puzzle_routers, chat_routers
-from app.core.database import Base, engine, SessionLocal, get_db
-from app.services import SessionService
+from fastapi.responses import HTMLResponse, PlainTextResponse
+from app.routers import puzzle_routers, chat_routers, debug_routers, usage_routers
+from app.core.config import settings
+from app.core.database import Base, engine, async_engine, SessionLocal, get_db, add_missing_columns
+from app.core.tracing import TracingMiddleware, instrument_engine, trace_templates
+from app.core.query_budget import instrument_queries
+from app.core.metrics import registry
+from app.core.usage_ledger import usage_ledger
+from app.services import SessionService, generation_queue
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
@@ -23,6 +28,7 @@ async def lifespan(app: FastAPI):
 
     # Create DB tables
     Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine)
 
     # Run Cleanup Task: Ensure all puzzles have sessions
     logger.info("Running startup cleanup: Ensuring puzzles have sessions and checkpointers have real sessions...")
@@ -36,9 +42,14 @@ async def lifespan(app: FastAPI):
     finally:
         db.close()
 
+    # Start background workers for LLM puzzle generation
+    await generation_queue.start()
+
     yield
 
     logger.info("Application shutting down...")
+    await generation_queue.stop()
+    await usage_ledger.stop() # write the buffered LLM call rows
 
 
 # create FastAPI with lifespan
@@ -48,8 +59,15 @@ app = FastAPI(
     lifespan=lifespan  # <--- Register the lifespan handler here
 )
 
+# request timings: Server-Timing header and /debug/traces
+app.add_middleware(TracingMiddleware)
+instrument_engine(engine, "sync")
+instrument_engine(async_engine.sync_engine, "async")
+instrument_queries(engine)
+instrument_queries(async_engine.sync_engine)
+
 # create Jinja2 template engine/define templates directory
-templates = Jinja2Templates(directory=Path(__file__).parent / "templates")
+templates = trace_templates(Jinja2Templates(directory=Path(__file__).parent / "templates"))
 
 # mount static files
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
@@ -57,9 +75,19 @@ app.mount("/static", StaticFiles(directory="app/static"), name="static")
 # get routers
 app.include_router(chat_routers.router, prefix="/puzzles", tags=["Chat"])
 app.include_router(puzzle_routers.router, prefix="/puzzles", tags=["Puzzles"])
+app.include_router(usage_routers.router, prefix="/usage", tags=["Usage"])
+if settings.REQUEST_TRACES or settings.QUERY_STATS:
+    app.include_router(debug_routers.router, prefix="/debug", tags=["Debug"])
 
 
 # Landing page
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
\ No newline at end of file
+    return templates.TemplateResponse("index.html", {"request": request})
+
+
+# Prometheus metrics
+if settings.METRICS_ENABLED:
+    @app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+    async def metrics():
+        return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
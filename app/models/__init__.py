@@ -6,3 +6,4 @@ from app.models.path_model import Path
 from app.models.path_nodes import PathNode
 from app.models.session_model import Session
 from app.models.message_model import Message
+from app.models.llm_call_model import LLMCall
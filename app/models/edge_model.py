@@ -3,17 +3,17 @@ from sqlalchemy.orm import relationship
 
 from app.core.database import Base
 from uuid import uuid4
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Uuid
 
 
 class Edge(Base):
     __tablename__ = "edges"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid4)
     edge_index = Column(Integer, nullable=False)
-    start_node_id = Column(UUID(as_uuid=True), ForeignKey("nodes.id"), nullable=False)
-    end_node_id = Column(UUID(as_uuid=True), ForeignKey("nodes.id"), nullable=False)
-    puzzle_id = Column(UUID(as_uuid=True), ForeignKey("puzzles.id"), nullable=False)
+    start_node_id = Column(Uuid, ForeignKey("nodes.id"), nullable=False)
+    end_node_id = Column(Uuid, ForeignKey("nodes.id"), nullable=False)
+    puzzle_id = Column(Uuid, ForeignKey("puzzles.id"), nullable=False)
 
     # Relationships
     puzzle = relationship("Puzzle", back_populates="edges")
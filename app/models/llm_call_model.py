@@ -0,0 +1,31 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, Boolean, Index
+
+from app.core.database import Base
+from sqlalchemy import Uuid
+
+
+class LLMCall(Base):
+    """ Ledger of all LLM calls (written in batches by app/core/usage_ledger.py)"""
+    __tablename__ = "llm_calls"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    created_at = Column(DateTime, nullable=False, index=True) # UTC
+    group_id = Column(String(32), index=True) # one chat turn or generation job
+    operation = Column(String) # "chat", "generate", "batch", ... (None: outside of a usage scope)
+    session_id = Column(Uuid, index=True) # no foreign keys: the ledger outlives deleted sessions/puzzles
+    puzzle_id = Column(Uuid) # puzzle the call worked on
+    created_puzzle_id = Column(Uuid) # puzzle stored by the group of this call
+    puzzle_nodes = Column(Integer) # size of the puzzle (requested or loaded)
+    node = Column(String) # agent graph node
+    provider = Column(String, nullable=False)
+    model = Column(String, nullable=False)
+    method = Column(String, nullable=False) # chat or structured
+    schema_name = Column(String)
+    input_tokens = Column(Integer, nullable=False, default=0)
+    output_tokens = Column(Integer, nullable=False, default=0)
+    cached_tokens = Column(Integer, nullable=False, default=0)
+    total_tokens = Column(Integer, nullable=False, default=0)
+    latency_ms = Column(Float, nullable=False)
+    success = Column(Boolean, nullable=False)
+    error = Column(String)
+
+    __table_args__ = (Index("ix_llm_calls_model_created", "model", "created_at"),)
@@ -4,17 +4,17 @@ from sqlalchemy.orm import relationship
 
 from app.core.database import Base
 from uuid import uuid4
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Uuid
 
 
 class Node(Base):
     __tablename__ = "nodes"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid4)
     node_index = Column(Integer, nullable=False)
     x_position = Column(Integer, nullable=False)
     y_position = Column(Integer, nullable=False)
-    puzzle_id = Column(UUID(as_uuid=True), ForeignKey("puzzles.id"), nullable=False)
+    puzzle_id = Column(Uuid, ForeignKey("puzzles.id"), nullable=False)
 
     # Relationship
     puzzle = relationship("Puzzle", back_populates="nodes")
@@ -1,5 +1,5 @@
 from sqlalchemy import Column, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Uuid
 from sqlalchemy.orm import relationship
 from uuid import uuid4
 
@@ -8,8 +8,8 @@ from app.core.database import Base
 class Path(Base):
     __tablename__ = "paths"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
-    unit_id = Column(UUID(as_uuid=True), ForeignKey("units.id", ondelete="CASCADE"))
+    id = Column(Uuid, primary_key=True, default=uuid4)
+    unit_id = Column(Uuid, ForeignKey("units.id", ondelete="CASCADE"))
 
     # Relationships
     path_node = relationship("PathNode", back_populates="path", cascade="all, delete-orphan") # if parent is removed orphans will delete too
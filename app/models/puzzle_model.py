@@ -1,14 +1,14 @@
-from sqlalchemy import Column, Integer, String, func, DateTime, Boolean
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, func, DateTime, Boolean, LargeBinary
+from sqlalchemy.orm import relationship, deferred
 from app.core.database import Base
 from uuid import uuid4
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Uuid
 
 
 class Puzzle(Base):
     __tablename__ = "puzzles"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid4)
     name = Column(String, nullable=False)
     model = Column(String, nullable=False)
     enemy_count = Column(Integer)
@@ -21,6 +21,8 @@ class Puzzle(Base):
     is_working = Column(Boolean, nullable=False, default=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+    # compressed PuzzleGraph document (PUZZLE_STORAGE_MODE=document), only loaded on request
+    graph_blob = deferred(Column(LargeBinary, nullable=True))
 
 
 
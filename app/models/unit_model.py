@@ -4,16 +4,16 @@ from sqlalchemy.orm import relationship
 
 from app.core.database import Base
 from uuid import uuid4
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Uuid
 
 
 class Unit(Base):
     __tablename__ = "units"
 
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
+    id = Column(Uuid, primary_key=True, default=uuid4)
     unit_type = Column(String, nullable=False)  # Grunt, Brute, Archer
     faction = Column(String, nullable=False)  # 'enemy' or 'player'
-    puzzle_id = Column(UUID(as_uuid=True), ForeignKey("puzzles.id"), nullable=False)
+    puzzle_id = Column(Uuid, ForeignKey("puzzles.id"), nullable=False)
 
     # Relationships
     puzzle = relationship("Puzzle", back_populates="units")
@@ -1,13 +1,79 @@
 from app.prompts.prompt_game_rules import BASIC_RULES, GAME_MODE_SKIRMISH, GAME_MODE_SAFE_TRAVEL
+from app.prompts.puzzle_encoding import COMPACT_FORMAT_SPEC, use_compact_format
 import json
 from typing import Optional
 import logging
 
 logger = logging.getLogger(__name__)
 
+JSON_OUTPUT_FORMAT = """
+        ### Formating
+        You must always output valid JSON matching the PuzzleLLMResponse schema exactly.
+        
+        ### JSON Schema Definitions (TypeScript)
+        
+        interface PuzzleLLMResponse {
+          name: string; // make up a name for the puzzle
+          nodes: NodeGenerate[];
+          edges: EdgeGenerate[];
+          units: UnitGenerate[];
+          coins: number;
+          description: string; // Describe moves in detail turn by turn. Use \\n for new paragraphs.
+        }
+        
+        interface NodeGenerate {
+          index: number;
+          x: number;
+          y: number;
+        }
+        
+        interface EdgeGenerate {
+          index: number; // Must be an integer
+          start: number; // Index of the start node
+          end: number;   // Index of the end node
+          // STRICTLY FORBIDDEN: Do NOT include 'x' or 'y' in edges.
+        }
+        
+        interface UnitGenerate {
+          type: string;
+          faction: string;
+          path: number[]; // List of node indices
+        }
+        
+        ### Constraints
+        1. Return ONLY a valid JSON object conforming to the schema above.
+        2. Return no explanations, only raw JSON.
+        3. For Edges: strictly use keys 'index', 'start', 'end'. 
+        4. Do NOT use aliases like 'from', 'to', 'source', 'target'.
+        5. Do NOT include coordinates (x, y) in Edges.
+        6. Ensure each list is a JSON array ([...]), not an object with keys.
+"""
+
+COMPACT_OUTPUT_FORMAT = f"""
+        ### Formating
+        You must always output the puzzle in the compact puzzle format below, without JSON and without explanations.
+        {COMPACT_FORMAT_SPEC}
+"""
+
+
+def puzzle_output_format() -> str:
+    """Output format section of the puzzle generation prompts"""
+    return COMPACT_OUTPUT_FORMAT if use_compact_format() else JSON_OUTPUT_FORMAT
+
+
+def puzzle_context_format() -> str:
+    """Explains the compact format wherever a puzzle is embedded as context (empty for JSON)"""
+    return f"The puzzle is written in this compact format:\n{COMPACT_FORMAT_SPEC}" if use_compact_format() else ""
+
+
+def format_example_puzzles(example_puzzles: list) -> str:
+    """Few shot examples as compact text blocks or JSON"""
+    if example_puzzles and all(isinstance(example, str) for example in example_puzzles):
+        return "\n\n".join(example_puzzles)
+    return json.dumps(example_puzzles, indent=2)
+
 
 async def get_puzzle_generation_prompt(
-        db,
         example_puzzles,
         game_mode: str,
         node_count: int,
@@ -52,51 +118,12 @@ async def get_puzzle_generation_prompt(
         
         ### Examples
         
-        ### Formating
-        You must always output valid JSON matching the PuzzleLLMResponse schema exactly.
-        
-        ### JSON Schema Definitions (TypeScript)
-        
-        interface PuzzleLLMResponse {{
-          name: string; // make up a name for the puzzle
-          nodes: NodeGenerate[];
-          edges: EdgeGenerate[];
-          units: UnitGenerate[];
-          coins: number;
-          description: string; // Describe moves in detail turn by turn. Use \\n for new paragraphs.
-        }}
-        
-        interface NodeGenerate {{
-          index: number;
-          x: number;
-          y: number;
-        }}
-        
-        interface EdgeGenerate {{
-          index: number; // Must be an integer
-          start: number; // Index of the start node
-          end: number;   // Index of the end node
-          // STRICTLY FORBIDDEN: Do NOT include 'x' or 'y' in edges.
-        }}
-        
-        interface UnitGenerate {{
-          type: string;
-          faction: string;
-          path: number[]; // List of node indices
-        }}
-        
-        ### Constraints
-        1. Return ONLY a valid JSON object conforming to the schema above.
-        2. Return no explanations, only raw JSON.
-        3. For Edges: strictly use keys 'index', 'start', 'end'. 
-        4. Do NOT use aliases like 'from', 'to', 'source', 'target'.
-        5. Do NOT include coordinates (x, y) in Edges.
-        6. Ensure each list is a JSON array ([...]), not an object with keys.
+        {puzzle_output_format()}
         
         ### Examples
-        {json.dumps(example_puzzles, indent=2)}
+        {format_example_puzzles(example_puzzles)}
         
-        These are example puzzles in JSON format. 
+        These are example puzzles. 
         Use these examples as reference for structure and puzzle design patterns.
         """
         ),
@@ -119,7 +146,7 @@ async def get_puzzle_generation_prompt(
         Units:
         {json.dumps(units, indent=2)}
         
-        Return ONLY valid JSON for PuzzleLLMResponse.
+        {"Return ONLY the puzzle in the compact puzzle format." if use_compact_format() else "Return ONLY valid JSON for PuzzleLLMResponse."}
         """)
     }
     logger.info(f"Prompt built successfully (nodes={node_count}, edges={edge_count}, units={len(units)}")
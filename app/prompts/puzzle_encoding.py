@@ -0,0 +1,241 @@
+"""
+Compact, lossless text encoding of puzzles for LLM prompts (PUZZLE_PROMPT_FORMAT=compact).
+
+    PUZZLE mode=skirmish coins=5 model=gpt-4o-mini
+    name: The Ambush
+    desc: Turn 1: the Grunt moves ...\\nTurn 2: ...
+    NODES index x,y > edge targets
+    0 0,0 > 1 4
+    1 200,0 > 2
+    2 400,0
+    UNITS faction type: path
+    player Swordsman: 0 1 2
+    enemy Grunt: 4
+
+Header values are quoted like shell words when they contain spaces or quotes (mode='Safe travel').
+Every node line lists the end nodes of the edges starting at that node. Edges are numbered
+in the order they appear; a target written as '5#7' carries its own edge index 7.
+Edges whose start node doesn't exist are written as 'E start>end#index'.
+"""
+import re
+import shlex
+from typing import Optional, Type, Union
+
+from pydantic import BaseModel
+
+from app.core.config import settings
+from app.core.puzzle_graph import PuzzleGraph
+
+COMPACT_FORMAT_SPEC = """
+Puzzles are written in a compact text format, one item per line:
+
+PUZZLE mode="<game mode>" coins=<coins>
+name: <puzzle name>
+desc: <description in one line, write \\n for new paragraphs>
+NODES index x,y > edge targets
+<node index> <x>,<y> > <end node index of every edge that starts at this node>
+UNITS faction type: path
+<player|enemy> <unit type>: <node indexes of the path in order>
+
+Edges are numbered in the order they appear (0, 1, 2, ...). A node without outgoing edges has no '>' part.
+
+Example:
+PUZZLE mode=skirmish coins=4
+name: Narrow Bridge
+desc: The Grunt blocks the bridge.\\nMove the Swordsman around it.
+NODES index x,y > edge targets
+0 0,0 > 1 3
+1 200,0 > 2
+2 400,0
+3 0,200 > 2
+UNITS faction type: path
+player Swordsman: 0 3 2
+enemy Grunt: 1
+"""
+
+_NODE_LINE = re.compile(r"^(-?\d+)\s*[:(]?\s*(-?\d+)\s*[, ]\s*(-?\d+)\s*\)?\s*(?:(?:->|>|:)\s*(.*))?$")
+_EDGE_TARGET = re.compile(r"(-?\d+)(?:#(\d+))?")
+_ORPHAN_EDGE = re.compile(r"^E\s+(-?\d+)\s*(?:->|>)\s*(-?\d+)\s*#\s*(\d+)$")
+_UNIT_LINE = re.compile(r"^(\w+)\s+(.+?)\s*:\s*([-\d\s,\[\]]*)$")
+
+
+def use_compact_format() -> bool:
+    return settings.PUZZLE_PROMPT_FORMAT == "compact"
+
+
+def _escape(text: Optional[str]) -> str:
+    return (text or "").replace("\\", "\\\\").replace("\r", "").replace("\n", "\\n")
+
+
+def _unescape(text: str) -> str:
+    return re.sub(r"\\(.)", lambda m: "\n" if m.group(1) == "n" else m.group(1), text)
+
+
+def _header_values(line: str) -> dict:
+    """ key=value pairs of the PUZZLE line, values may be quoted ('Safe travel' or "Safe travel")"""
+    try:
+        words = shlex.split(line)
+    except ValueError: # unbalanced quotes in LLM output
+        words = [key + "=" + value.strip("'\"") for key, value in re.findall(r"(\w+)=(\"[^\"]*\"?|'[^']*'?|\S+)", line)]
+    return dict(word.split("=", 1) for word in words if "=" in word)
+
+
+def encode_puzzle(puzzle: Union[PuzzleGraph, dict]) -> str:
+    """Encode a PuzzleGraph or an LLM puzzle dict (PuzzleCreate shape) to the compact text format"""
+    data = puzzle.to_llm_dict() if isinstance(puzzle, PuzzleGraph) else puzzle
+
+    header = ["PUZZLE"]
+    if data.get("game_mode"):
+        header.append(f"mode={shlex.quote(data['game_mode'])}")
+    if data.get("coins") is not None:
+        header.append(f"coins={data['coins']}")
+    if data.get("model"):
+        header.append(f"model={shlex.quote(data['model'])}")
+    lines = [" ".join(header), f"name: {_escape(data.get('name'))}", f"desc: {_escape(data.get('description'))}"]
+
+    nodes = sorted(data.get("nodes", []), key=lambda n: n["index"])
+    outgoing = {node["index"]: [] for node in nodes}
+    orphans = []
+    for edge in sorted(data.get("edges", []), key=lambda e: e["index"]):
+        (outgoing[edge["start"]] if edge["start"] in outgoing else orphans).append(edge)
+
+    lines.append("NODES index x,y > edge targets")
+    counter = 0
+    for node in nodes:
+        targets = []
+        for edge in outgoing[node["index"]]:
+            targets.append(str(edge["end"]) if edge["index"] == counter else f"{edge['end']}#{edge['index']}")
+            counter += 1
+        line = f"{node['index']} {node['x']},{node['y']}"
+        lines.append(f"{line} > {' '.join(targets)}" if targets else line)
+    for edge in orphans:
+        lines.append(f"E {edge['start']}>{edge['end']}#{edge['index']}")
+
+    lines.append("UNITS faction type: path")
+    for unit in data.get("units", []):
+        lines.append(f"{unit['faction']} {unit['type']}: {' '.join(str(i) for i in unit['path'])}")
+
+    return "\n".join(lines)
+
+
+def decode_puzzle(text: str) -> dict:
+    """
+    Decode the compact text format to an LLM puzzle dict (PuzzleCreate shape).
+    Lenient enough for LLM output: code fences, blank lines, '->' arrows and '(x, y)' coordinates are accepted.
+    """
+    data = {"name": None, "model": None, "game_mode": None, "coins": None, "nodes": [], "edges": [], "units": [], "description": ""}
+    section = None
+    counter = 0
+    last_key = None
+
+    for raw_line in text.strip().strip("`").splitlines():
+        line = raw_line.strip()
+        if not line or line.startswith("```"):
+            continue
+        upper = line.upper()
+
+        if upper.startswith("PUZZLE"):
+            for key, value in _header_values(line).items():
+                if key == "mode":
+                    data["game_mode"] = value
+                elif key == "coins":
+                    data["coins"] = int(value) if value.lstrip("-").isdigit() else None
+                elif key == "model":
+                    data["model"] = value
+            last_key = None
+            continue
+        if upper.startswith("NAME:"):
+            data["name"] = _unescape(line[5:].strip())
+            last_key = None
+            continue
+        if upper.startswith(("DESC:", "DESCRIPTION:")):
+            data["description"] = _unescape(line.split(":", 1)[1].strip())
+            last_key = "description"
+            continue
+        if upper.startswith("NODES"):
+            section, last_key = "nodes", None
+            continue
+        if upper.startswith("UNITS"):
+            section, last_key = "units", None
+            continue
+
+        orphan = _ORPHAN_EDGE.match(line)
+        if orphan:
+            start, end, index = (int(g) for g in orphan.groups())
+            data["edges"].append({"index": index, "start": start, "end": end})
+            continue
+
+        if section == "nodes":
+            node = _NODE_LINE.match(line)
+            if node:
+                index, x, y, targets = node.groups()
+                data["nodes"].append({"index": int(index), "x": int(x), "y": int(y)})
+                for end, edge_index in _EDGE_TARGET.findall(targets or ""):
+                    data["edges"].append({
+                        "index": int(edge_index) if edge_index else counter,
+                        "start": int(index),
+                        "end": int(end),
+                    })
+                    counter += 1
+                continue
+        elif section == "units":
+            unit = _UNIT_LINE.match(line)
+            if unit:
+                faction, unit_type, path = unit.groups()
+                data["units"].append({"type": unit_type, "faction": faction.lower(), "path": [int(i) for i in re.findall(r"-?\d+", path)]})
+                continue
+
+        # descriptions that were written over several lines
+        if last_key == "description":
+            data["description"] += "\n" + line
+
+    data["edges"].sort(key=lambda e: e["index"])
+    return data
+
+
+def round_trips(puzzle: dict) -> bool:
+    """ True if an LLM puzzle dict decodes back to itself (edges in index order, no description = "")"""
+    expected = {**puzzle, "description": puzzle.get("description") or "", "edges": sorted(puzzle["edges"], key=lambda e: e["index"])}
+    return decode_puzzle(encode_puzzle(puzzle)) == expected
+
+
+# header and text values that need quoting or escaping
+_SAMPLE_GRAPH = {
+    "nodes": [{"index": 0, "x": 0, "y": 0}, {"index": 1, "x": 200, "y": -100}],
+    "edges": [{"index": 0, "start": 0, "end": 1}],
+    "units": [{"type": "Swordsman", "faction": "player", "path": [0, 1]}],
+}
+ROUND_TRIP_SAMPLES = [
+    {"name": "Safe travel", "model": "gpt-4o-mini", "game_mode": "Safe travel", "coins": 3, "description": "One word", **_SAMPLE_GRAPH},
+    {"name": "It's a \"trap\" = bad", "model": "meta/llama 3", "game_mode": "king's \"guard\"", "coins": 0,
+     "description": "Turn 1: move.\nTurn 2: wait \\n here", **_SAMPLE_GRAPH},
+    {"name": "desc: NODES", "model": "gpt-4o", "game_mode": "mode=skirmish coins=9", "coins": None, "description": None, **_SAMPLE_GRAPH},
+]
+
+
+def self_check() -> list[str]:
+    """ Names of the ROUND_TRIP_SAMPLES that don't survive encode/decode"""
+    return [sample["name"] for sample in ROUND_TRIP_SAMPLES if not round_trips(sample)]
+
+
+def parse_llm_puzzle(text: str, schema: Type[BaseModel], **defaults) -> BaseModel:
+    """Parse compact LLM output into the given schema (PuzzleLLMResponse/PuzzleCreate). Raises ValueError.
+    defaults fill header values the LLM left out (e.g. model, game_mode)"""
+    data = decode_puzzle(text)
+    if not data["nodes"]:
+        raise ValueError("LLM output contains no puzzle nodes")
+    for key, value in defaults.items():
+        if data.get(key) is None:
+            data[key] = value
+    return schema(**{key: value for key, value in data.items() if key in schema.model_fields})
+
+
+async def request_puzzle(llm, prompt: dict, schema: Type[BaseModel], **defaults):
+    """Ask the LLM for a puzzle: structured JSON output, or compact text parsed locally in compact mode"""
+    if not use_compact_format():
+        return await llm.structured(prompt=prompt, schema=schema)
+
+    response = await llm.chat(prompt)
+    if not response:
+        return None
+    return parse_llm_puzzle(response, schema, **defaults)
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, Request, Body, Response, Query
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from pathlib import Path
 from uuid import UUID
 import markdown
@@ -10,14 +11,16 @@ import logging
 import re # to convert LLM formated text
 
 from app import models
-from app.core.database import get_db
+from app.core.database import get_db, get_async_db
+from app.core.tracing import trace_templates, span
 from app.schemas import ChatFromRequest
-from app.services import SessionService, PuzzleServices
+from app.services import SessionService, PuzzleServices, AsyncSessionService, AsyncPuzzleServices, ChatContextLoader
 from app.agents import ChatAgent
+from utils.logger_config import payload, sampled
 
 logger = logging.getLogger(__name__)
 
-templates = Jinja2Templates(directory=Path(__file__).parent.parent / "templates")
+templates = trace_templates(Jinja2Templates(directory=Path(__file__).parent.parent / "templates"))
 
 router = APIRouter()
 
@@ -26,7 +29,7 @@ router = APIRouter()
 @router.get("/chat/editor", response_class=HTMLResponse)
 async def get_integrated_editor(
         session_id: Optional[str] = Query(default=None),
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         request: Request = None
 ):
     """Loads Puzzle Editor"""
@@ -53,8 +56,8 @@ async def get_integrated_editor(
             }
         )
 
-    session_services = SessionService(db)
-    puzzle_id = session_services.get_puzzle_id(session_uuid)
+    session_services = AsyncSessionService(db)
+    puzzle_id = await session_services.get_puzzle_id(session_uuid)
 
     if not puzzle_id:
         return templates.TemplateResponse(
@@ -65,8 +68,8 @@ async def get_integrated_editor(
             }
         )
 
-    puzzle_services = PuzzleServices(db)
-    puzzle = puzzle_services.get_puzzle_by_id(puzzle_id)
+    puzzle_services = AsyncPuzzleServices(db)
+    puzzle = await puzzle_services.get_puzzle_graph(puzzle_id)
 
     return templates.TemplateResponse(
         "partials/editor_partial.html",
@@ -78,18 +81,18 @@ async def get_integrated_editor(
 
 
 @router.get("/chat/puzzle/{puzzle_id}", response_class=HTMLResponse)
-async def get_chat(puzzle_id: UUID, db: Session = Depends(get_db), request: Request = None):
+async def get_chat(puzzle_id: UUID, db: AsyncSession = Depends(get_async_db), request: Request = None):
     """Loads Chat from Puzzle"""
     logger.info(f"Loading Chat from Puzzle list: {puzzle_id}")
+    services = AsyncSessionService(db)
 
     try:
-        session = db.query(models.Session).filter(models.Session.puzzle_id == puzzle_id).first()
+        session = await services.get_session_by_puzzle_id(puzzle_id)
     except Exception as e:
         logger.error(f"Error getting Chat from Puzzle: {e}")
         session = None
 
-    services = SessionService(db)
-    all_sessions = services.get_all_sessions()
+    all_sessions = await services.get_all_sessions()
     
     latest_session_id = None
     if session:
@@ -110,13 +113,13 @@ async def get_chat(puzzle_id: UUID, db: Session = Depends(get_db), request: Requ
 
 # load chat
 @router.get("/chat", response_class=HTMLResponse)
-async def show_chat(request: Request, db: Session = Depends(get_db)):
+async def show_chat(request: Request, db: AsyncSession = Depends(get_async_db)):
     """Get chat page and load all sessions."""
-    services = SessionService(db)
-    all_sessions = services.get_all_sessions()
+    services = AsyncSessionService(db)
+    all_sessions = await services.get_all_sessions()
 
     if all_sessions:
-        lastest_session = services.get_latest_session()
+        lastest_session = await services.get_latest_session()
     else:
         lastest_session = None
     return templates.TemplateResponse(
@@ -134,18 +137,19 @@ async def show_chat(request: Request, db: Session = Depends(get_db)):
 async def get_sidebar(#
         request: Request,
         session_id: Optional[str] = Query(None),
-        db: Session = Depends(get_db)):
+        db: AsyncSession = Depends(get_async_db)):
     """Get chat sidebar by session id, reload in separate html"""
 
     logger.info("reload all sessions...")
-    services = SessionService(db)
-    all_sessions = services.get_all_sessions()
+    services = AsyncSessionService(db)
+    all_sessions = await services.get_all_sessions()
 
     return templates.TemplateResponse(
         "partials/chat_sidebar_items.html", {
             "request": request,
             "all_sessions": all_sessions,
             "latest_session_id": session_id,
+            "titles_pending": SessionService.titles_pending(),
         }
     )
 
@@ -178,7 +182,8 @@ async def get_session(session_id: UUID, db: Session = Depends(get_db), response:
             message_html += f'<div class="user_message">{content}</div>'
         else:
             corrected_text = re.sub(r'^[ \t]{1,3}-', '    -', content, flags=re.MULTILINE)
-            message_content = markdown.markdown(corrected_text, extensions=['extra', 'sane_lists'])
+            with span("markdown", "history"):
+                message_content = markdown.markdown(corrected_text, extensions=['extra', 'sane_lists'])
             message_html += f'<div class="ai_response">{message_content}</div>'
 
     # Trigger refreshPuzzle to update editor when session is loaded
@@ -202,63 +207,43 @@ async def chat(
     triggers refresh of list of puzzles and visualization
     """
     TOOL = "chat_routers:"
-    logger.info(f"\n\nchat_data from chat.html: {chat_data}")
-    services = SessionService(db)
+    logger.info("\n\nchat_data from chat.html: %s", payload(chat_data), extra=sampled("chat_request"))
     triggers = [] # checks for new puzzle or session to update sidebar and visualization
 
-
-    # get or create new session (get id, create topic name, store in database)
-    session_id = await services.get_or_create_session(
+    # load session (or create a new one), puzzle and LLM puzzle context once for the whole turn
+    context = await ChatContextLoader(db).load(
         session_id=chat_data.session_id,
         user_message=chat_data.content,
         model=chat_data.model,
     )
-
-    # check if current session has a puzzle ID
-    puzzle_id = services.get_puzzle_id(session_id=session_id)
-    if not puzzle_id:
+    session_id = context.session_id
+    if not context.puzzle_id:
         logger.info(f"No puzzle found for session id '{session_id}'")
 
-    # get serialized puzzle as LLM readable JSON
-    puzzle_json = None
-    if session_id and puzzle_id:
-        puzzle_json = await services.get_serialized_puzzle_json(
-            session_id=session_id,
-            model=chat_data.model)
-
-        if puzzle_json:
-            logger.info(f"Puzzle JSON loaded ({len(str(puzzle_json))} chars)")
-        else:
-            logger.warning(f"Puzzle JSON is EMPTY for Session {session_id} / Puzzle {puzzle_id}")
-
      # Initialize agent
-    agent = ChatAgent(db, session_id=str(session_id), model=chat_data.model)
+    agent = ChatAgent(db, session_id=str(session_id), model=chat_data.model, context=context)
 
     # Process message through agent and get response message
     llm_response, current_puzzle_id = await agent.process(
         user_message=chat_data.content,
-        puzzle_json=puzzle_json,
-        puzzle_id=puzzle_id,
+        puzzle_id=context.puzzle_id,
     )
 
     if llm_response:
         logger.debug(f"{TOOL} Received response from agent graph and pass it to database")
 
     # check for puzzle updates and update visualization to trigger HTMX
-    topic_changed = False
     if current_puzzle_id:
         logger.debug(f"{TOOL} Current puzzle id: ", current_puzzle_id)
         triggers.append("refreshPuzzle")
         logger.debug(f"{TOOL} refresh puzzle editor")
-        topic_changed = await services.update_session_title(
-            puzzle_id=current_puzzle_id,
-            session_id=session_id,
-        )
+
+    # write session changes of the turn (new session, puzzle link, title) in one commit
+    topic_changed = await context.finish(current_puzzle_id)
 
     # If a new session is created refresh sidebar to add new session to list of sessions
-    is_new_session = not chat_data.session_id or str(chat_data.session_id).strip() == "" # means: new session was just created
-    logger.debug(f"{TOOL} is_new_session: ", is_new_session)
-    if topic_changed or is_new_session:
+    logger.debug(f"{TOOL} is_new_session: ", context.is_new_session)
+    if topic_changed or context.is_new_session:
         triggers.append("refreshSidebar")
         logger.debug(f"{TOOL} refresh sidebar")
     else:
@@ -272,7 +257,8 @@ async def chat(
     # format llm response to proper html output
     logger.debug(f"{TOOL} Format the LLM response into a readable HTML format")
     corrected_text = re.sub(r'^[ \t]{1,3}-', '    -', llm_response, flags=re.MULTILINE)
-    llm_response_html = markdown.markdown(corrected_text, extensions=['extra', 'sane_lists'])
+    with span("markdown", "answer"):
+        llm_response_html = markdown.markdown(corrected_text, extensions=['extra', 'sane_lists'])
 
     # create and send HTML response
     logger.debug(f"{TOOL} Pass content to front-end...")
@@ -283,7 +269,7 @@ async def chat(
     session_script = f'<script>document.getElementById("session_id_input").value = "{session_id}";</script>'    
     
     html_response = HTMLResponse(content=user_msg + ai_msg + session_script)
-    html_response.headers["HX-Trigger"] = "refreshPuzzle"
+    html_response.headers["HX-Trigger"] = ", ".join(dict.fromkeys(triggers + ["refreshPuzzle"]))
     return html_response
 
 
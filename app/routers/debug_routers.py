@@ -0,0 +1,42 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import JSONResponse
+from typing import Optional
+import logging
+
+from app.core.tracing import trace_store
+from app.core.query_budget import endpoint_query_stats
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+# Slowest recent requests
+@router.get("/traces", response_class=JSONResponse)
+async def get_slowest_traces(
+    limit: int = Query(20, ge=1, le=500, description="Number of traces"),
+    path: Optional[str] = Query(None, description="Only requests whose path starts with this"),
+):
+    """Slowest of the last REQUEST_TRACES requests with their time per category (db, llm, llm.<node>, ...)"""
+    traces = trace_store.slowest(limit=limit, path=path)
+    return JSONResponse(content=[trace.to_dict(spans=False) for trace in traces])
+
+
+# One request with all spans
+@router.get("/traces/{trace_id}", response_class=JSONResponse)
+async def get_trace(trace_id: str):
+    """All spans of a request (id from the X-Trace-Id response header)"""
+    trace = trace_store.get(trace_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="Trace not found (no longer in the buffer?)")
+    return JSONResponse(content=trace.to_dict())
+
+
+# Statement counts per endpoint
+@router.get("/queries", response_class=JSONResponse)
+async def get_query_stats(
+    limit: int = Query(5, ge=1, le=50, description="Statement shapes per route"),
+    route: Optional[str] = Query(None, description="Only routes starting with this, e.g. 'POST /puzzles'"),
+):
+    """Statements per request and the most frequent statement shapes per route (N+1 candidates first)"""
+    return JSONResponse(content=endpoint_query_stats.report(limit=limit, route=route))
@@ -1,24 +1,29 @@
 # import moduls/libraries
-from fastapi import APIRouter, Depends, Query, Request, Body
-from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse
+from fastapi import APIRouter, Depends, Query, Request, Body, HTTPException
+from fastapi.responses import RedirectResponse, HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import Optional
 from uuid import UUID, uuid4
 from pathlib import Path
+import json
 import logging
 
 
 # import form project
-from app.core.database import get_db
+from app.core.database import get_db, get_async_db
+from app.core.puzzle_cache import puzzle_graph_cache
+from app.core.tracing import trace_templates, span
 from app import models
-from app.schemas import PuzzleCreate, PuzzleGenerate, ChatFromRequest
-from app.services import PuzzleServices, SessionService
+from app.schemas import PuzzleCreate, PuzzleGenerate, PuzzleBatchGenerate, ChatFromRequest
+from app.services import PuzzleServices, SessionService, BatchGenerationService, generation_queue
+from app.services import AsyncPuzzleServices, AsyncSessionService
 
 logger = logging.getLogger(__name__)
 
 # create Jinja2 template engine
-templates = Jinja2Templates(directory=Path(__file__).parent.parent / "templates")
+templates = trace_templates(Jinja2Templates(directory=Path(__file__).parent.parent / "templates"))
 
 router = APIRouter()
 
@@ -34,24 +39,24 @@ async def show_create_puzzle(request: Request):
 async def create_puzzle(
     puzzle: PuzzleCreate, 
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     session_id: Optional[UUID] = Query(None)
 ):
     """Create a new puzzle, store in database and create new session"""
     # Create puzzle and store in database
-    services = PuzzleServices(db)
-    new_puzzle = services.create_puzzle(puzzle)
+    services = AsyncPuzzleServices(db)
+    new_puzzle = await services.create_puzzle(puzzle)
 
     final_session = None
     existing_session = None
 
     # add session to existing session
     if session_id:
-        existing_session = db.query(models.Session).filter(models.Session.id == session_id).first()
+        existing_session = await db.get(models.Session, session_id)
         if existing_session:
             existing_session.puzzle_id = new_puzzle.id
             existing_session.topic_name = new_puzzle.name
-            db.commit()
+            await db.commit()
             final_session_id = existing_session.id
 
     # Create new session with puzzle id and puzzle name as topic name
@@ -62,7 +67,7 @@ async def create_puzzle(
             puzzle_id=new_puzzle.id,
         )
         db.add(new_session)
-        db.commit()
+        await db.commit()
         final_session_id = new_session.id
 
     # Check if request (from editor.js) is from chat context (via header)
@@ -82,28 +87,20 @@ async def create_puzzle(
 
 # Update puzzle
 @router.put("/{puzzle_id}", response_class=HTMLResponse)
-async def update_puzzle(puzzle_id: UUID, puzzle: PuzzleCreate, db: Session = Depends(get_db)):
+async def update_puzzle(puzzle_id: UUID, puzzle: PuzzleCreate, db: AsyncSession = Depends(get_async_db)):
     """Update an existing puzzle and related session topic"""
     TOOL = "puzzle_router.update_puzzle:"
 
     # Updating existing puzzle
-    services = PuzzleServices(db)
+    services = AsyncPuzzleServices(db)
     logger.debug(f"{TOOL} updating puzzle...")
-    updated_puzzle = services.update_puzzle(puzzle_id, puzzle)
+    updated_puzzle = await services.update_puzzle(puzzle_id, puzzle)
 
     # Load sessions with puzzle_id and update session topic
     # there should be only one session
     # ToDo: if there isn't a session yet create new one
     logger.debug(f"{TOOL} get linked session...")
-    linked_session = db.query(models.Session).filter(models.Session.puzzle_id == updated_puzzle.id).all()
-    for session in linked_session:
-        if session.topic_name != updated_puzzle.name:
-            session.topic_name = updated_puzzle.name
-            logger.debug(f"{TOOL} update session topic '{session.topic_name}'")
-            logger.debug(f"{TOOL} with puzzle name '{updated_puzzle.name}'")
-            db.add(session)
-    if linked_session:
-        db.commit()
+    await AsyncSessionService(db).sync_topic_with_puzzle(updated_puzzle)
 
     return RedirectResponse(url=f"/puzzles/{updated_puzzle.id}", status_code=303)
 
@@ -116,20 +113,75 @@ async def show_generate_puzzle(request: Request):
 
 
 # Generate puzzle (LLM Endpoint)
-@router.post("/generate")
-async def generate_puzzle(puzzle_generate: PuzzleGenerate, db: Session = Depends(get_db)):
-    """Generate a new puzzle with LLM"""
-    services = PuzzleServices(db)
-    puzzle_generated = await services.generate_puzzle(puzzle_generate)
-    new_puzzle = services.create_puzzle(puzzle_generated)
-    return RedirectResponse(url=f"/puzzles/{new_puzzle.id}", status_code=303)
+@router.post("/generate", status_code=202)
+async def generate_puzzle(puzzle_generate: PuzzleGenerate):
+    """Queue a new LLM puzzle generation and return the job id right away"""
+    job, created = await generation_queue.submit(puzzle_generate)
+    return JSONResponse(
+        status_code=202,
+        content={
+            **job.to_dict(),
+            "deduplicated": not created,  # identical config was already in flight
+            "status_url": f"/puzzles/generate/jobs/{job.id}",
+            "events_url": f"/puzzles/generate/jobs/{job.id}/events",
+        },
+    )
+
+
+# Generate many puzzles (LLM Endpoint)
+@router.post("/generate/batch")
+async def generate_puzzle_batch(batch: PuzzleBatchGenerate):
+    """Generate a batch of puzzles, stream one NDJSON line per finished puzzle and a summary at the end"""
+    service = BatchGenerationService()
+
+    async def result_stream():
+        async for line in service.run(batch.configs, models=batch.models):
+            yield json.dumps(line) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+
+# Generation job status (polling)
+@router.get("/generate/jobs/{job_id}", response_class=JSONResponse)
+async def get_generation_job(job_id: str):
+    """Get status and progress of a generation job"""
+    job = await generation_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Generation job not found")
+    return JSONResponse(content=job.to_dict())
+
+
+# Generation job status (Server-Sent Events)
+@router.get("/generate/jobs/{job_id}/events")
+async def stream_generation_job(job_id: str):
+    """Stream status changes of a generation job until it is finished"""
+    job = await generation_queue.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Generation job not found")
+
+    async def event_stream():
+        async for status in generation_queue.subscribe(job_id):
+            yield f"data: {json.dumps(status)}\n\n"
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+# Puzzle graph cache counters
+@router.get("/cache/stats", response_class=JSONResponse)
+async def get_puzzle_cache_stats():
+    """Hit/miss/eviction counters of the in-process puzzle graph cache"""
+    return JSONResponse(content=puzzle_graph_cache.stats())
 
 
 # get a list of puzzle (GET)
 @router.get("/")
 async def get_puzzles(
     request: Request,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     name: Optional[str] = Query(None, description="Filter by name"),
     game_mode: Optional[str] = Query(None, description="Filter by game mode"),
     model: Optional[str] = Query(None, description="Filter by model type"),
@@ -137,35 +189,36 @@ async def get_puzzles(
     order: Optional[str] = Query("asc", description="Sort order")
 ):
     """Get a list of puzzles, with optional filters and sorting"""
-    services = PuzzleServices(db)
-    puzzles = services.get_all_puzzle(name, game_mode, model, sort_by, order)
+    services = AsyncPuzzleServices(db)
+    puzzles = await services.get_all_puzzle(name, game_mode, model, sort_by, order)
     return templates.TemplateResponse("puzzles.html", {"request": request, "puzzles": puzzles})
 
 
 # API Delete Request
 @router.delete("/{puzzle_id}/delete", status_code=204)
-async def delete_puzzle(puzzle_id: UUID, db: Session = Depends(get_db)):
+async def delete_puzzle(puzzle_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Delete a puzzle"""
-    services = PuzzleServices(db)
-    services.delete_puzzle(puzzle_id)
+    services = AsyncPuzzleServices(db)
+    await services.delete_puzzle(puzzle_id)
     return HTMLResponse(content="", status_code=200)
 
 
 @router.get("/{puzzle_id}/update", response_class=HTMLResponse)
-def show_update_puzzle(request: Request, puzzle_id: UUID, db: Session = Depends(get_db)):
+async def show_update_puzzle(request: Request, puzzle_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Show update puzzle page"""
-    services = PuzzleServices(db)
-    puzzle = services.get_puzzle_by_id(puzzle_id)
+    services = AsyncPuzzleServices(db)
+    puzzle = await services.get_puzzle_graph(puzzle_id)
     return templates.TemplateResponse("update-puzzle.html", {"request": request, "puzzle": puzzle})
 
 
 # Serialize puzzle data to JSON for puzzle visualization
 @router.get("/{puzzle_id}/data", response_class=JSONResponse)
-async def get_puzzle_data(puzzle_id: UUID, db: Session = Depends(get_db)):
+async def get_puzzle_data(puzzle_id: UUID, db: AsyncSession = Depends(get_async_db)):
     """Get puzzle data as JSON for visualization"""
-    services = PuzzleServices(db)
-    puzzle_data = services.serialize_puzzle(puzzle_id) # Serialize puzzle data to JSON
-    return JSONResponse(content=puzzle_data)
+    services = AsyncPuzzleServices(db)
+    puzzle_data = await services.serialize_puzzle(puzzle_id) # Serialize puzzle data to JSON
+    with span("serialize", "puzzle_data"):
+        return JSONResponse(content=puzzle_data)
 
 
 
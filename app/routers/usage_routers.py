@@ -0,0 +1,41 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import JSONResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+import logging
+
+from app.core.database import get_async_db
+from app.services import UsageServices
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+# Latency and tokens per model
+@router.get("/models", response_class=JSONResponse)
+async def get_model_usage(
+    since_hours: float = Query(24, gt=0, description="Time window in hours"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """p50/p95/p99 latency of the successful calls, success rate and tokens per provider/model"""
+    return JSONResponse(content=await UsageServices(db).model_latency(since_hours))
+
+
+# Latency and tokens per agent graph node
+@router.get("/nodes", response_class=JSONResponse)
+async def get_node_usage(
+    since_hours: float = Query(24, gt=0, description="Time window in hours"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Same as /models per agent graph node and model"""
+    return JSONResponse(content=await UsageServices(db).node_usage(since_hours))
+
+
+# Tokens per stored puzzle
+@router.get("/puzzles", response_class=JSONResponse)
+async def get_puzzle_usage(
+    since_hours: float = Query(24, gt=0, description="Time window in hours"),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """Tokens and calls per successfully stored puzzle, per model and operation (generate, batch, chat)"""
+    return JSONResponse(content=await UsageServices(db).tokens_per_puzzle(since_hours))
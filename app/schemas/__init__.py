@@ -1,5 +1,6 @@
 
-from app.schemas.puzzle_schema import PuzzleCreate, PuzzleGenerate, PuzzleLLMResponse, PuzzleExport
+from app.schemas.puzzle_schema import PuzzleCreate, PuzzleGenerate, PuzzleLLMResponse, PuzzleExport, PuzzleBatchGenerate
+from app.schemas.puzzle_edit_schema import PuzzleEditOp, PuzzleEditResponse
 from app.schemas.unit_schema import UnitCreate, UnitRead, UnitGenerate, UnitRead, UnitUpdate
 from app.schemas.node_schema import NodeCreate, NodeGenerate, NodeRead
 from app.schemas.edge_schema import EdgeCreate, EdgeGenerate, EdgeRead
@@ -0,0 +1,26 @@
+from pydantic import BaseModel, ConfigDict
+from typing import Optional, List, Literal
+
+
+# One typed modification of an existing puzzle (flat, so it works with structured LLM output)
+class PuzzleEditOp(BaseModel):
+    op: Literal["add_node", "remove_node", "move_node", "add_edge", "remove_edge", "set_unit_path"]
+    node: Optional[int] = None # node index (add_node, remove_node, move_node)
+    x: Optional[int] = None # new coordinates (add_node, move_node)
+    y: Optional[int] = None
+    edge: Optional[int] = None # edge index (add_edge, remove_edge)
+    start: Optional[int] = None # node indexes (add_edge, remove_edge without edge index)
+    end: Optional[int] = None
+    unit: Optional[int] = None # position of the unit in the unit list (set_unit_path)
+    path: Optional[List[int]] = None # new node indexes of the unit path (set_unit_path)
+
+    model_config = ConfigDict(extra="forbid")
+
+
+# LLM response of the patch modify mode
+class PuzzleEditResponse(BaseModel):
+    ops: List[PuzzleEditOp]
+    coins: Optional[int] = None # only if the coins change
+    description: Optional[str] = None # only if the description changes
+
+    model_config = ConfigDict(extra="forbid")
@@ -43,6 +43,14 @@ class PuzzleGenerate(BaseModel):
     )
 
 
+# Many configs at once (batch generation)
+class PuzzleBatchGenerate(BaseModel):
+    configs: List[PuzzleGenerate]
+    models: Optional[List[str]] = None # spread configs round-robin over these models
+
+    model_config = ConfigDict(extra="forbid")
+
+
 class PuzzleLLMResponse(BaseModel):
     name: Optional[str]
     nodes: List[NodeGenerate]
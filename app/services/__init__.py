@@ -1,3 +1,9 @@
 
 from app.services.puzzle_services import PuzzleServices
-from app.services.session_services import SessionService
\ No newline at end of file
+from app.services.puzzle_edits import PuzzleEditor, PuzzleEditError
+from app.services.session_services import SessionService
+from app.services.chat_context import ChatContext, ChatContextLoader
+from app.services.generation_queue import generation_queue, GenerationQueue, GenerationJob
+from app.services.batch_generation import BatchGenerationService
+from app.services.async_services import AsyncPuzzleServices, AsyncSessionService
+from app.services.usage_services import UsageServices
@@ -0,0 +1,143 @@
+from typing import List, Optional
+from uuid import UUID
+import logging
+
+from fastapi import HTTPException
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+
+from app import models
+from app.core.puzzle_graph import PuzzleGraph
+from app.core.puzzle_cache import puzzle_graph_cache
+from app.schemas import PuzzleCreate
+from app.services.puzzle_services import PuzzleServices
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPuzzleServices:
+    """ Async variant of PuzzleServices for the FastAPI routers.
+    Reads use native async queries, writes reuse the PuzzleServices logic via run_sync,
+    so statements are executed by the async driver and don't block the event loop."""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def create_puzzle(self, puzzle_data: PuzzleCreate) -> models.Puzzle:
+        """Insert new puzzle and its related rows"""
+        return await self.db.run_sync(lambda session: PuzzleServices(session).create_puzzle(puzzle_data))
+
+    async def update_puzzle(self, puzzle_id: UUID, puzzle_data: PuzzleCreate) -> models.Puzzle:
+        """Update existing puzzle by deleting old data and recreating with new data"""
+        return await self.db.run_sync(lambda session: PuzzleServices(session).update_puzzle(puzzle_id, puzzle_data))
+
+    async def delete_puzzle(self, puzzle_id: UUID):
+        """Fetch puzzle by id and delete"""
+        puzzle = await self.get_puzzle_by_id(puzzle_id)
+        await self.db.delete(puzzle)
+        await self.db.commit()
+        puzzle_graph_cache.invalidate(puzzle_id)
+
+    async def get_all_puzzle(
+            self,
+            name: Optional[str] = None,
+            game_mode: Optional[str] = None,
+            model: Optional[str] = None,
+            sort_by: Optional[str] = None,
+            order: Optional[str] = "asc"
+    ) -> List[models.Puzzle]:
+        """Fetch puzzle with filter"""
+        query = select(models.Puzzle)
+        if name:
+            query = query.where(models.Puzzle.name == name)
+        if game_mode:
+            query = query.where(models.Puzzle.game_mode == game_mode)
+        if model:
+            query = query.where(models.Puzzle.model == model)
+        if sort_by:
+            sort_column = getattr(models.Puzzle, sort_by, None)
+            if sort_column:
+                query = query.order_by(sort_column.desc() if order == "desc" else sort_column.asc())
+
+        result = await self.db.execute(query)
+        return list(result.scalars().all())
+
+    async def get_puzzle_by_id(self, puzzle_id) -> models.Puzzle:
+        """Fetch puzzle by id with nodes, edges, units and paths"""
+        query = (select(models.Puzzle)
+                 .options(selectinload(models.Puzzle.units)
+                          .selectinload(models.Unit.path)
+                          .selectinload(models.Path.path_node))
+                 .options(selectinload(models.Puzzle.nodes))
+                 .options(selectinload(models.Puzzle.edges))
+                 .where(models.Puzzle.id == puzzle_id))
+        puzzle = (await self.db.execute(query)).scalars().first()
+        if not puzzle:
+            raise HTTPException(status_code=404, detail="Puzzle not found")
+        return puzzle
+
+    async def get_puzzle_graph(self, puzzle_id) -> PuzzleGraph:
+        """Load puzzle as PuzzleGraph (raises 404). Cache hits don't touch the DB"""
+        graph = puzzle_graph_cache.get(puzzle_id)
+        if graph is not None:
+            return graph
+        return await self.db.run_sync(lambda session: PuzzleServices(session).get_puzzle_graph(puzzle_id))
+
+    async def serialize_puzzle(self, puzzle_id) -> dict | None:
+        """Loads Puzzle by ID and serializes it. Returns a Puzzle dict."""
+        try:
+            graph = await self.get_puzzle_graph(puzzle_id)
+        except Exception as e:
+            logger.error(f"serializing_puzzle: Error loading puzzle by ID {e}", exc_info=True)
+            return None
+        return graph.to_editor_dict()
+
+
+class AsyncSessionService:
+    """ Async variant of the SessionService read paths used by the routers"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    async def get_all_sessions(self) -> List[models.Session]:
+        """ Gets a list of all sessions """
+        result = await self.db.execute(select(models.Session).order_by(models.Session.created_at.desc()))
+        return list(result.scalars().all())
+
+    async def get_latest_session(self):
+        """ Gets latest session and its messages"""
+        try:
+            result = await self.db.execute(select(models.Session).order_by(models.Session.created_at.desc()).limit(1))
+            latest_session = result.scalars().first()
+            if latest_session is None:
+                return [], None
+
+            result = await self.db.execute(select(models.Message).where(models.Message.session_id == latest_session.id))
+            return list(result.scalars().all()), latest_session.id
+
+        except Exception as e:
+            logger.error(f"Error getting latest session: {e}", exc_info=True)
+            return [], None
+
+    async def get_puzzle_id(self, session_id: UUID):
+        """Get puzzle id by session id"""
+        if not session_id:
+            return None
+        result = await self.db.execute(select(models.Session.puzzle_id).where(models.Session.id == session_id))
+        return result.scalars().first()
+
+    async def get_session_by_puzzle_id(self, puzzle_id: UUID) -> models.Session | None:
+        result = await self.db.execute(select(models.Session).where(models.Session.puzzle_id == puzzle_id))
+        return result.scalars().first()
+
+    async def sync_topic_with_puzzle(self, puzzle: models.Puzzle):
+        """Rename all sessions linked to the puzzle to the puzzle name"""
+        result = await self.db.execute(select(models.Session).where(models.Session.puzzle_id == puzzle.id))
+        changed = False
+        for session in result.scalars().all():
+            if session.topic_name != puzzle.name:
+                session.topic_name = puzzle.name
+                changed = True
+        if changed:
+            await self.db.commit()
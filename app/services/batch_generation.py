@@ -0,0 +1,235 @@
+import asyncio
+import time
+import logging
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field, asdict
+from typing import AsyncIterator, Optional
+from uuid import uuid4, UUID
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.usage_ledger import usage_scope, UsageScope
+from app.llm.request_policy import request_gate
+from app.schemas import PuzzleGenerate, PuzzleCreate
+
+logger = logging.getLogger(__name__)
+
+
+def get_provider(model_name: str) -> str:
+    """ Provider name of a model, used to group rate limits"""
+    if model_name.startswith("gpt"):
+        return "openai"
+    if model_name.startswith("gemini"):
+        return "gemini"
+    return model_name.split("-")[0]
+
+
+class RateLimiter:
+    """ Spaces out requests so that at most 'per_minute' requests start within one minute"""
+
+    def __init__(self, per_minute: int):
+        self.interval = 60.0 / per_minute if per_minute and per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            wait = self._next_slot - now
+            self._next_slot = max(now, self._next_slot) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+@dataclass
+class ProviderStats:
+    succeeded: int = 0
+    failed: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    total_tokens: int = 0
+
+
+@dataclass
+class BatchSummary:
+    total: int = 0
+    succeeded: int = 0
+    failed: int = 0
+    elapsed_seconds: float = 0.0
+    puzzles_per_minute: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    total_tokens: int = 0
+    providers: dict[str, ProviderStats] = field(default_factory=dict)
+
+    def add_usage(self, provider: str, usage: Optional[dict], success: bool):
+        stats = self.providers.setdefault(provider, ProviderStats())
+        if success:
+            stats.succeeded += 1
+        else:
+            stats.failed += 1
+        for key in ("input_tokens", "output_tokens", "cached_tokens", "total_tokens"):
+            value = (usage or {}).get(key) or 0
+            setattr(stats, key, getattr(stats, key) + value)
+            setattr(self, key, getattr(self, key) + value)
+
+    def to_dict(self) -> dict:
+        return {"type": "summary", **asdict(self)}
+
+
+class BatchGenerationService:
+    """
+    Generates many puzzles at once for offline content pipelines.
+    Configs are fanned out across providers, each provider has its own concurrency cap
+    and rate limit that every LLM request counts against, retries and hedges included.
+    Results are yielded as soon as a puzzle is finished and stored with bulk inserts in
+    chunks of 'persist_chunk_size'.
+    """
+
+    def __init__(
+            self,
+            concurrency: Optional[dict[str, int]] = None,
+            rate_limits: Optional[dict[str, int]] = None,
+            persist_chunk_size: Optional[int] = None,
+    ):
+        self.concurrency = concurrency or settings.BATCH_PROVIDER_CONCURRENCY
+        self.rate_limits = rate_limits or settings.BATCH_PROVIDER_RPM
+        self.persist_chunk_size = persist_chunk_size or settings.BATCH_PERSIST_CHUNK_SIZE
+        self._semaphores: dict[str, asyncio.Semaphore] = {}
+        self._limiters: dict[str, RateLimiter] = {}
+
+    def _semaphore(self, provider: str) -> asyncio.Semaphore:
+        if provider not in self._semaphores:
+            self._semaphores[provider] = asyncio.Semaphore(self.concurrency.get(provider, 2))
+        return self._semaphores[provider]
+
+    def _limiter(self, provider: str) -> RateLimiter:
+        if provider not in self._limiters:
+            self._limiters[provider] = RateLimiter(self.rate_limits.get(provider, 0))
+        return self._limiters[provider]
+
+    @asynccontextmanager
+    async def _request_slot(self, model_name: str):
+        """ Request gate of the batch: one request of the model's provider within its limits"""
+        provider = get_provider(model_name)
+        async with self._semaphore(provider):
+            await self._limiter(provider).acquire()
+            yield
+
+    @staticmethod
+    def assign_models(configs: list[PuzzleGenerate], models: Optional[list[str]]) -> list[PuzzleGenerate]:
+        """ Spread configs round-robin over the given models (keeps config.model if no models given)"""
+        if not models:
+            return configs
+        return [config.model_copy(update={"model": models[i % len(models)]}) for i, config in enumerate(configs)]
+
+    @staticmethod
+    def _load_examples(game_modes: set[str]) -> dict[str, list[dict]]:
+        """ Serialize few shot examples once per game mode for the whole batch"""
+        from app.services import PuzzleServices
+        db = SessionLocal()
+        try:
+            services = PuzzleServices(db)
+            return {mode: services.get_serialized_examples(mode) for mode in game_modes}
+        finally:
+            db.close()
+
+    @staticmethod
+    def _persist(puzzles: list[PuzzleCreate], puzzle_ids: list) -> None:
+        from app.services import PuzzleServices
+        db = SessionLocal()
+        try:
+            PuzzleServices(db).create_puzzles_bulk(puzzles, puzzle_ids)
+        finally:
+            db.close()
+
+    async def _generate_one(self, index: int, config: PuzzleGenerate, examples: list[dict]) -> tuple[dict, Optional[PuzzleCreate], UsageScope]:
+        from app.services.puzzle_services import generate_puzzle_from_examples
+        provider = get_provider(config.model)
+
+        started = time.perf_counter()
+        # examples are loaded once per batch, the generation itself needs no db session
+        with request_gate(self._request_slot), usage_scope("batch", puzzle_nodes=config.node_count) as scope:
+            puzzle, usage = await generate_puzzle_from_examples(config, examples)
+        latency = time.perf_counter() - started
+
+        result = {
+            "type": "result",
+            "index": index,
+            "name": config.name,
+            "model": config.model,
+            "provider": provider,
+            "status": "ok" if puzzle else "failed",
+            "puzzle_id": None,
+            "latency_seconds": round(latency, 3),
+            "usage": usage,
+            "error": None if puzzle else f"{config.model} did not return a valid puzzle",
+        }
+        return result, puzzle, scope
+
+    async def run(self, configs: list[PuzzleGenerate], models: Optional[list[str]] = None) -> AsyncIterator[dict]:
+        """ Generate all configs. Yields one result dict per puzzle and a summary dict at the end"""
+        configs = self.assign_models(configs, models)
+        summary = BatchSummary(total=len(configs))
+        started = time.perf_counter()
+        logger.info(f"Batch generation of {len(configs)} puzzles started")
+
+        examples = await asyncio.to_thread(self._load_examples, {c.game_mode.lower() for c in configs})
+        tasks = [
+            asyncio.create_task(self._generate_one(i, config, examples[config.game_mode.lower()]))
+            for i, config in enumerate(configs)
+        ]
+
+        pending_puzzles, pending_ids = [], []
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    result, puzzle, scope = await next_done
+                except Exception as e:
+                    logger.error(f"Batch generation task crashed: {e}", exc_info=True)
+                    summary.failed += 1
+                    yield {"type": "result", "status": "failed", "error": str(e)}
+                    continue
+
+                if puzzle:
+                    result["puzzle_id"] = str(uuid4())
+                    scope.puzzle_created(result["puzzle_id"])
+                    pending_puzzles.append(puzzle)
+                    pending_ids.append(result["puzzle_id"])
+                    summary.succeeded += 1
+                else:
+                    summary.failed += 1
+                summary.add_usage(result["provider"], result["usage"], puzzle is not None)
+                yield result
+
+                if len(pending_puzzles) >= self.persist_chunk_size:
+                    yield await self._flush(pending_puzzles, pending_ids, summary)
+                    pending_puzzles, pending_ids = [], []
+
+            if pending_puzzles:
+                yield await self._flush(pending_puzzles, pending_ids, summary)
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        summary.elapsed_seconds = round(time.perf_counter() - started, 3)
+        if summary.elapsed_seconds:
+            summary.puzzles_per_minute = round(summary.succeeded / summary.elapsed_seconds * 60, 2)
+        logger.info(f"Batch generation finished: {summary.succeeded}/{summary.total} puzzles "
+                    f"({summary.puzzles_per_minute} puzzles/min)")
+        yield summary.to_dict()
+
+    async def _flush(self, puzzles: list[PuzzleCreate], puzzle_ids: list[str], summary: BatchSummary) -> dict:
+        """ Bulk insert a chunk of finished puzzles"""
+        try:
+            await asyncio.to_thread(self._persist, puzzles, [UUID(i) for i in puzzle_ids])
+            return {"type": "persisted", "puzzle_ids": puzzle_ids}
+        except Exception as e:
+            logger.error(f"Could not store batch of {len(puzzles)} puzzles: {e}", exc_info=True)
+            summary.succeeded -= len(puzzles)
+            summary.failed += len(puzzles)
+            return {"type": "persist_error", "puzzle_ids": puzzle_ids, "error": str(e)}
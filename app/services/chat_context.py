@@ -0,0 +1,122 @@
+import asyncio
+from typing import Optional, Union
+from uuid import uuid4, UUID
+import logging
+
+from app import models
+from app.core.config import settings
+from app.core.puzzle_graph import PuzzleGraph
+from app.services.puzzle_services import PuzzleServices
+from app.services.session_services import SessionService
+
+logger = logging.getLogger(__name__)
+
+
+class ChatContext:
+    """
+    Session and puzzle graph of one chat turn.
+    Loaded once per request by ChatContextLoader and shared with the ChatAgent.
+    Session writes of the turn (new session, puzzle link, title) are only applied to the
+    loaded objects and written by finish() in one commit.
+    """
+
+    def __init__(self, db, session: models.Session, is_new_session: bool,
+                 puzzle_graph: Optional[PuzzleGraph] = None,
+                 placeholder_title: Optional[str] = None, title_task: Optional[asyncio.Task] = None):
+        self.db = db
+        self.session = session
+        self.is_new_session = is_new_session
+        self.puzzle_graph = puzzle_graph
+        self.placeholder_title = placeholder_title # title of a new session until the LLM title is ready
+        self.title_task = title_task
+
+    @property
+    def session_id(self) -> UUID:
+        return self.session.id
+
+    @property
+    def puzzle_id(self) -> Optional[UUID]:
+        return self.session.puzzle_id
+
+    def link_puzzle(self, puzzle_id: Union[UUID, str]):
+        """ Link a (new) puzzle to the session, written by finish()"""
+        self.session.puzzle_id = puzzle_id if isinstance(puzzle_id, UUID) else UUID(str(puzzle_id).strip())
+
+    async def finish(self, current_puzzle_id: Union[UUID, str, None] = None) -> bool:
+        """
+        Apply the session changes of the turn and commit them at once.
+        The puzzle name wins over the title of a new session. Returns True if the title changed (refresh the sidebar).
+        """
+        topic_changed = False
+        if current_puzzle_id:
+            self.link_puzzle(current_puzzle_id)
+            try:
+                # graph comes from the cache, the agent just wrote or read it
+                name = PuzzleServices(self.db).get_puzzle_graph(self.session.puzzle_id).name
+                if name and self.session.topic_name != name:
+                    self.session.topic_name = name
+                    topic_changed = True
+            except Exception as e:
+                logger.error(f"Could not update session topic: {e}", exc_info=True)
+
+        title_pending = False
+        if self.title_task is not None:
+            if topic_changed:
+                self.title_task.cancel()
+            else:
+                # title ran alongside the agent; if it isn't ready yet it is stored later and the sidebar polls for it
+                done, _ = await asyncio.wait({self.title_task}, timeout=settings.SESSION_TITLE_WAIT)
+                title = self.title_task.result() if done else None
+                if title and self.session.topic_name == self.placeholder_title:
+                    self.session.topic_name = title
+                    topic_changed = True
+                title_pending = not done
+
+        if self.db.new or self.db.dirty:
+            self.db.commit()
+
+        if title_pending:
+            SessionService(self.db).store_title_when_ready(self.title_task, self.session.id, self.placeholder_title)
+        return topic_changed
+
+
+class ChatContextLoader:
+    """ Loads everything a chat turn needs in one round of queries"""
+
+    def __init__(self, db):
+        self.db = db
+
+    async def load(self, session_id: Optional[UUID], user_message: str, model: str) -> ChatContext:
+        """
+        One select for the session (none for a new one) and the puzzle graph from the cache or its own selects.
+        The LLM puzzle context is only serialized if an agent node needs it (see PuzzleContextResolver).
+        """
+        session = self.db.get(models.Session, session_id) if session_id else None
+        if session is None:
+            context = await self._new_session(user_message, model)
+        else:
+            context = ChatContext(self.db, session, is_new_session=False)
+
+        if context.puzzle_id:
+            try:
+                context.puzzle_graph = PuzzleServices(self.db).get_puzzle_graph(context.puzzle_id)
+            except Exception as e:
+                logger.error(f"Could not load puzzle of session '{context.session_id}': {e}", exc_info=True)
+        return context
+
+    async def _new_session(self, user_message: str, model: str) -> ChatContext:
+        services = SessionService(self.db)
+        if settings.SESSION_TITLE_MODE == "llm":
+            topic_name = await services.create_topic_name(message=user_message, model=model)
+        else:
+            topic_name = services.local_topic_name(user_message)
+
+        # added to the db session, inserted with the commit of the turn
+        session = models.Session(id=uuid4(), topic_name=topic_name)
+        self.db.add(session)
+        logger.debug(f"New session: {session.id}")
+
+        title_task = None
+        if settings.SESSION_TITLE_MODE == "background":
+            title_task = services.start_title_task(user_message, model)
+        return ChatContext(self.db, session, is_new_session=True, placeholder_title=topic_name, title_task=title_task)
@@ -0,0 +1,310 @@
+import asyncio
+import hashlib
+import json
+import time
+import logging
+from dataclasses import dataclass, field, asdict
+from typing import AsyncIterator, Optional
+from uuid import uuid4
+
+import aiosqlite
+
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.usage_ledger import usage_scope
+from app.schemas import PuzzleGenerate, PuzzleCreate
+
+logger = logging.getLogger(__name__)
+
+# job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+FINISHED_STATES = (JOB_DONE, JOB_FAILED)
+
+
+@dataclass
+class GenerationJob:
+    """ One puzzle generation request waiting for (or handled by) a worker"""
+    id: str
+    config: dict
+    dedup_key: str
+    status: str = JOB_QUEUED
+    progress: int = 0
+    stage: str = "Waiting for a free worker"
+    puzzle_id: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def to_dict(self) -> dict:
+        """ Public job status (without the raw config) for the status endpoints"""
+        data = asdict(self)
+        data.pop("config")
+        data.pop("dedup_key")
+        data["puzzle_url"] = f"/puzzles/{self.puzzle_id}" if self.puzzle_id else None
+        return data
+
+
+class GenerationQueue:
+    """
+    In-process job queue for LLM puzzle generation.
+    A fixed number of workers pulls jobs from an asyncio.Queue, so the number of
+    concurrent LLM generations is bounded. Identical configs that are still in flight
+    share one job. In durable mode jobs are mirrored to a SQLite file and unfinished
+    jobs are picked up again on the next startup.
+    """
+
+    def __init__(self, workers: int = 2, durable: bool = False, db_path: str = ""):
+        self.workers = max(1, workers)
+        self.durable = durable
+        self.db_path = db_path
+        self._queue: asyncio.Queue | None = None
+        self._jobs: dict[str, GenerationJob] = {}
+        self._in_flight: dict[str, str] = {}  # dedup key → job id
+        self._listeners: dict[str, set[asyncio.Queue]] = {}
+        self._worker_tasks: list[asyncio.Task] = []
+
+    @staticmethod
+    def config_key(config: PuzzleGenerate) -> str:
+        """ Stable hash of a generation config, used to detect duplicate requests"""
+        payload = json.dumps(config.model_dump(), sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    async def start(self):
+        """ Start worker tasks (and reload unfinished jobs in durable mode)"""
+        if self._worker_tasks:
+            return
+        self._queue = asyncio.Queue()
+
+        if self.durable:
+            await self._init_store()
+            for job in await self._load_unfinished_jobs():
+                logger.info(f"Re-queue unfinished generation job {job.id}")
+                job.status = JOB_QUEUED
+                job.stage = "Waiting for a free worker"
+                self._jobs[job.id] = job
+                self._in_flight[job.dedup_key] = job.id
+                self._queue.put_nowait(job.id)
+
+        for number in range(self.workers):
+            self._worker_tasks.append(asyncio.create_task(self._worker(number)))
+        logger.info(f"Generation queue started with {self.workers} worker(s) (durable={self.durable})")
+
+    async def stop(self):
+        """ Cancel all workers. Running jobs stay 'running' in the durable store and are re-queued on restart"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        logger.info("Generation queue stopped")
+
+    async def submit(self, config: PuzzleGenerate) -> tuple[GenerationJob, bool]:
+        """
+        Queue a generation config.
+        Returns the job and False if an identical config is already in flight.
+        """
+        if self._queue is None:
+            raise RuntimeError("Generation queue is not started")
+
+        dedup_key = self.config_key(config)
+        existing_id = self._in_flight.get(dedup_key)
+        if existing_id and existing_id in self._jobs:
+            logger.info(f"Generation config already in flight, reuse job {existing_id}")
+            return self._jobs[existing_id], False
+
+        job = GenerationJob(id=str(uuid4()), config=config.model_dump(), dedup_key=dedup_key)
+        self._jobs[job.id] = job
+        self._in_flight[dedup_key] = job.id
+        await self._persist(job)
+        self._queue.put_nowait(job.id)
+        logger.info(f"Queued generation job {job.id} (queue size: {self._queue.qsize()})")
+        return job, True
+
+    async def get(self, job_id: str) -> GenerationJob | None:
+        """ Get job from memory or from the durable store"""
+        job = self._jobs.get(job_id)
+        if job is None and self.durable:
+            job = await self._load_job(job_id)
+        return job
+
+    def counts(self) -> dict[str, int]:
+        """ Jobs in memory per status (metrics)"""
+        counts = {status: 0 for status in (JOB_QUEUED, JOB_RUNNING, JOB_DONE, JOB_FAILED)}
+        for job in list(self._jobs.values()):
+            counts[job.status] = counts.get(job.status, 0) + 1
+        return counts
+
+    async def subscribe(self, job_id: str) -> AsyncIterator[dict]:
+        """
+        Yield the job status every time it changes until the job is finished.
+        Jobs that are finished or only in the durable store (no worker of this process updates them)
+        yield their stored status once.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.is_finished:
+            job = job or await self.get(job_id)
+            if job is not None:
+                yield job.to_dict()
+            return
+
+        listener: asyncio.Queue = asyncio.Queue()
+        self._listeners.setdefault(job_id, set()).add(listener)
+        try:
+            yield job.to_dict()
+            while not job.is_finished:
+                job = await listener.get()
+                yield job.to_dict()
+        finally:
+            self._listeners.get(job_id, set()).discard(listener)
+            if not self._listeners.get(job_id):
+                self._listeners.pop(job_id, None)
+
+    # ---------- workers ----------
+
+    async def _worker(self, number: int):
+        while True:
+            job_id = await self._queue.get()
+            job = self._jobs.get(job_id)
+            try:
+                if job and not job.is_finished:
+                    await self._run(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Generation worker {number}: job {job_id} crashed: {e}", exc_info=True)
+                await self._update(job, status=JOB_FAILED, stage="Generation failed", error=str(e))
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: GenerationJob):
+        """ Generate the puzzle with the LLM and store it. Database work runs in a thread, not on the event loop"""
+        from app.services.puzzle_services import generate_puzzle_from_examples
+
+        config = PuzzleGenerate(**job.config)
+        await self._update(job, status=JOB_RUNNING, progress=10, stage=f"Generating puzzle with {config.model}")
+
+        examples = await asyncio.to_thread(self._load_examples, config.game_mode)
+        with usage_scope("generate", puzzle_nodes=config.node_count) as scope:
+            puzzle_generated, _ = await generate_puzzle_from_examples(config, examples)
+        if puzzle_generated is None:
+            await self._update(job, status=JOB_FAILED, stage="Generation failed",
+                               error=f"{config.model} did not return a valid puzzle")
+            return
+
+        await self._update(job, progress=80, stage="Saving puzzle")
+        puzzle_id = await asyncio.to_thread(self._persist_puzzle, puzzle_generated)
+        scope.puzzle_created(puzzle_id)
+        await self._update(job, status=JOB_DONE, progress=100, stage="Puzzle generated", puzzle_id=str(puzzle_id))
+
+    @staticmethod
+    def _load_examples(game_mode: str) -> list:
+        from app.services import PuzzleServices
+        db = SessionLocal()
+        try:
+            return PuzzleServices(db).get_serialized_examples(game_mode)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _persist_puzzle(puzzle: PuzzleCreate):
+        from app.services import PuzzleServices
+        db = SessionLocal()
+        try:
+            return PuzzleServices(db).create_puzzle(puzzle).id
+        finally:
+            db.close()
+
+    async def _update(self, job: GenerationJob | None, **changes):
+        """ Apply status changes, persist them and notify subscribers"""
+        if job is None:
+            return
+        for key, value in changes.items():
+            setattr(job, key, value)
+        job.updated_at = time.time()
+
+        if job.is_finished:
+            # identical configs may be generated again from now on
+            if self._in_flight.get(job.dedup_key) == job.id:
+                self._in_flight.pop(job.dedup_key, None)
+            self._prune_finished()
+
+        await self._persist(job)
+        for listener in self._listeners.get(job.id, set()):
+            listener.put_nowait(job)
+
+    def _prune_finished(self):
+        """ Keep only the latest finished jobs in memory"""
+        finished = [job for job in self._jobs.values() if job.is_finished]
+        overflow = len(finished) - settings.GENERATION_JOBS_KEEP
+        if overflow > 0:
+            for job in sorted(finished, key=lambda j: j.updated_at)[:overflow]:
+                self._jobs.pop(job.id, None)
+
+    # ---------- durable store ----------
+
+    async def _init_store(self):
+        async with aiosqlite.connect(self.db_path) as conn:
+            await conn.execute(
+                """CREATE TABLE IF NOT EXISTS generation_jobs (
+                    id TEXT PRIMARY KEY,
+                    dedup_key TEXT NOT NULL,
+                    config TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress INTEGER NOT NULL,
+                    stage TEXT,
+                    puzzle_id TEXT,
+                    error TEXT,
+                    created_at REAL,
+                    updated_at REAL
+                )"""
+            )
+            await conn.commit()
+
+    async def _persist(self, job: GenerationJob):
+        if not self.durable:
+            return
+        try:
+            async with aiosqlite.connect(self.db_path) as conn:
+                await conn.execute(
+                    "INSERT OR REPLACE INTO generation_jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job.id, job.dedup_key, json.dumps(job.config), job.status, job.progress, job.stage,
+                     job.puzzle_id, job.error, job.created_at, job.updated_at),
+                )
+                await conn.commit()
+        except Exception as e:
+            logger.error(f"Could not persist generation job {job.id}: {e}", exc_info=True)
+
+    @staticmethod
+    def _row_to_job(row) -> GenerationJob:
+        return GenerationJob(
+            id=row[0], dedup_key=row[1], config=json.loads(row[2]), status=row[3], progress=row[4],
+            stage=row[5], puzzle_id=row[6], error=row[7], created_at=row[8], updated_at=row[9],
+        )
+
+    async def _load_job(self, job_id: str) -> GenerationJob | None:
+        async with aiosqlite.connect(self.db_path) as conn:
+            async with conn.execute("SELECT * FROM generation_jobs WHERE id = ?", (job_id,)) as cursor:
+                row = await cursor.fetchone()
+        return self._row_to_job(row) if row else None
+
+    async def _load_unfinished_jobs(self) -> list[GenerationJob]:
+        async with aiosqlite.connect(self.db_path) as conn:
+            async with conn.execute(
+                    "SELECT * FROM generation_jobs WHERE status IN (?, ?) ORDER BY created_at",
+                    (JOB_QUEUED, JOB_RUNNING)) as cursor:
+                rows = await cursor.fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+
+# process-wide queue used by the routers
+generation_queue = GenerationQueue(
+    workers=settings.GENERATION_WORKERS,
+    durable=settings.GENERATION_QUEUE_DURABLE,
+    db_path=settings.GENERATION_JOBS_URL,
+)
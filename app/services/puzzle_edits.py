@@ -0,0 +1,162 @@
+from typing import Iterable
+from uuid import uuid4, UUID
+import logging
+
+from app.core.puzzle_graph import PuzzleGraph
+from app.schemas import PuzzleEditOp
+
+logger = logging.getLogger(__name__)
+
+
+class PuzzleEditError(ValueError):
+    """An edit operation can't be applied to the puzzle"""
+
+
+class PuzzleEditor:
+    """
+    Applies typed edit operations (add/remove/move node, add/remove edge, set unit path)
+    to a working copy of a PuzzleGraph and keeps track of the rows that have to change.
+    Nothing is written here, see PuzzleServices.apply_edits.
+    """
+
+    def __init__(self, graph: PuzzleGraph):
+        self.graph = graph
+        # working copy: node index → [node id, x, y], edge index → [start, end], units → [id, type, faction, path]
+        self.nodes = {index: [node_id, x, y] for node_id, index, x, y in zip(graph.node_ids, graph.node_index, graph.node_x, graph.node_y)}
+        self.edges = {index: [start, end] for index, start, end in zip(graph.edge_index, graph.edge_start, graph.edge_end)}
+        self.units = [[graph.unit_ids[u], graph.unit_types[u], graph.unit_factions[u], graph.unit_path(u).tolist()]
+                      for u in range(graph.unit_count)]
+        self.coins = graph.coins
+        self.description = graph.description
+
+        # row changes
+        self.added_nodes: set[int] = set()
+        self.removed_nodes: dict[int, str] = {}  # index → id of stored nodes that are gone
+        self.moved_nodes: set[int] = set()
+        self.added_edges: set[int] = set()
+        self.removed_edges: set[int] = set()  # indexes of stored edges that are gone
+        self.changed_paths: set[int] = set()  # unit positions
+        self.applied: list[str] = []
+
+    # ---------- helpers ----------
+
+    def _require_node(self, index, op: PuzzleEditOp):
+        if index is None or index not in self.nodes:
+            raise PuzzleEditError(f"{op.op}: node {index} doesn't exist")
+
+    def _remove_edge(self, index: int):
+        self.edges.pop(index)
+        if index in self.added_edges:
+            self.added_edges.discard(index)
+        else:
+            self.removed_edges.add(index)
+
+    # ---------- operations ----------
+
+    def add_node(self, op: PuzzleEditOp):
+        index = op.node if op.node is not None else max(self.nodes, default=-1) + 1
+        if index in self.nodes:
+            raise PuzzleEditError(f"add_node: node {index} already exists")
+        if op.x is None or op.y is None:
+            raise PuzzleEditError(f"add_node: node {index} needs x and y")
+        self.nodes[index] = [str(uuid4()), op.x, op.y]
+        self.added_nodes.add(index)
+        self.applied.append(f"Added node {index} at ({op.x}, {op.y})")
+
+    def remove_node(self, op: PuzzleEditOp):
+        self._require_node(op.node, op)
+        users = [u for u, unit in enumerate(self.units) if op.node in unit[3]]
+        if users:
+            raise PuzzleEditError(f"remove_node: node {op.node} is used by the path of unit(s) {users}, change the paths first")
+
+        for index in [i for i, (start, end) in self.edges.items() if op.node in (start, end)]:
+            self._remove_edge(index)
+        node_id = self.nodes.pop(op.node)[0]
+        if op.node in self.added_nodes:
+            self.added_nodes.discard(op.node)
+        else:
+            self.removed_nodes[op.node] = node_id
+        self.moved_nodes.discard(op.node)
+        self.applied.append(f"Removed node {op.node} and its edges")
+
+    def move_node(self, op: PuzzleEditOp):
+        self._require_node(op.node, op)
+        if op.x is None and op.y is None:
+            raise PuzzleEditError(f"move_node: node {op.node} needs x and/or y")
+        node = self.nodes[op.node]
+        node[1] = op.x if op.x is not None else node[1]
+        node[2] = op.y if op.y is not None else node[2]
+        if op.node not in self.added_nodes:
+            self.moved_nodes.add(op.node)
+        self.applied.append(f"Moved node {op.node} to ({node[1]}, {node[2]})")
+
+    def add_edge(self, op: PuzzleEditOp):
+        self._require_node(op.start, op)
+        self._require_node(op.end, op)
+        if op.start == op.end:
+            raise PuzzleEditError(f"add_edge: edge can't connect node {op.start} with itself")
+        if any({start, end} == {op.start, op.end} for start, end in self.edges.values()):
+            raise PuzzleEditError(f"add_edge: nodes {op.start} and {op.end} are already connected")
+        index = op.edge if op.edge is not None else max(self.edges, default=-1) + 1
+        if index in self.edges:
+            raise PuzzleEditError(f"add_edge: edge {index} already exists")
+        self.edges[index] = [op.start, op.end]
+        self.added_edges.add(index)
+        self.applied.append(f"Added edge {index} ({op.start} → {op.end})")
+
+    def remove_edge(self, op: PuzzleEditOp):
+        index = op.edge
+        if index is None:
+            # find edge by its nodes (both directions)
+            matches = [i for i, (start, end) in self.edges.items() if {start, end} == {op.start, op.end}]
+            index = matches[0] if matches else None
+        if index is None or index not in self.edges:
+            raise PuzzleEditError(f"remove_edge: edge {op.edge if op.edge is not None else (op.start, op.end)} doesn't exist")
+        start, end = self.edges[index]
+        self._remove_edge(index)
+        self.applied.append(f"Removed edge {index} ({start} → {end})")
+
+    def set_unit_path(self, op: PuzzleEditOp):
+        if op.unit is None or not 0 <= op.unit < len(self.units):
+            raise PuzzleEditError(f"set_unit_path: unit {op.unit} doesn't exist")
+        if not op.path:
+            raise PuzzleEditError(f"set_unit_path: unit {op.unit} needs a path")
+        for index in op.path:
+            self._require_node(index, op)
+        unit = self.units[op.unit]
+        unit[3] = list(op.path)
+        self.changed_paths.add(op.unit)
+        self.applied.append(f"Changed path of unit {op.unit} ({unit[2]} {unit[1]}) to {op.path}")
+
+    def apply(self, ops: Iterable[PuzzleEditOp]) -> list[str]:
+        """Apply all operations in order. Raises PuzzleEditError on the first invalid one (the working copy is then discarded)"""
+        for op in ops:
+            getattr(self, op.op)(op)
+        return self.applied
+
+    def set_meta(self, coins=None, description=None):
+        if coins is not None and coins != self.coins:
+            self.coins = coins
+            self.applied.append(f"Set coins to {coins}")
+        if description is not None and description != self.description:
+            self.description = description
+            self.applied.append("Updated description")
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.applied)
+
+    # ---------- result ----------
+
+    def node_id(self, index: int) -> UUID:
+        return UUID(self.nodes[index][0])
+
+    def to_graph(self) -> PuzzleGraph:
+        """The edited puzzle as new PuzzleGraph"""
+        meta = {key: getattr(self.graph, key) for key in ("id", "name", "model", "game_mode", "is_working")}
+        return PuzzleGraph(
+            meta=dict(meta, coins=self.coins, description=self.description),
+            nodes=[(index, x, y, node_id) for index, (node_id, x, y) in self.nodes.items()],
+            edges=[(index, start, end) for index, (start, end) in self.edges.items()],
+            units=self.units,
+        )
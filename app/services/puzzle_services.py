@@ -1,110 +1,174 @@
 from app import models
 from typing import List, Optional
 from fastapi import HTTPException
+from sqlalchemy import select, delete, update, func
 from sqlalchemy.orm import joinedload
 from uuid import uuid4, UUID
 import logging
-from utils.logger_config import configure_logging
+from utils.logger_config import configure_logging, payload
 
-from app.schemas import PuzzleCreate, PuzzleGenerate, PuzzleLLMResponse
+from app.schemas import PuzzleCreate, PuzzleGenerate, PuzzleLLMResponse, PuzzleEditResponse
 from app.llm import get_llm
+from app.core.bulk_insert import bulk_insert
+from app.core.puzzle_graph import PuzzleGraph
+from app.core.puzzle_cache import puzzle_graph_cache
+from app.core.config import settings
+from app.services.puzzle_edits import PuzzleEditor
 from app.prompts.prompt_manager import get_puzzle_generation_prompt
+from app.prompts.puzzle_encoding import encode_puzzle, use_compact_format, request_puzzle
 
 logger = logging.getLogger(__name__)
 
+LOAD_CHUNK_SIZE = 200 # puzzle ids per IN list when loading several graphs
+
 class PuzzleServices:
     """ Handles all puzzle related DB operation"""
 
     def __init__(self, db):
         self.db = db
+        self.last_usage = None # token usage of the latest LLM generation
 
-    # create puzzle
-    def create_puzzle(self, puzzle_data: PuzzleCreate):
-        """Insert new puzzle to DB table puzzles and its related units"""
-
-        puzzle = models.Puzzle(
-            id=uuid4(),
+    @staticmethod
+    def _puzzle_columns(puzzle_data: PuzzleCreate) -> dict:
+        """Puzzle column values derived from PuzzleCreate"""
+        return dict(
             name=puzzle_data.name,
             model=puzzle_data.model,
             enemy_count=len([enemy for enemy in puzzle_data.units if enemy.faction == "enemy"]),
             player_unit_count=len([player for player in puzzle_data.units if player.faction == "player"]),
             game_mode=puzzle_data.game_mode,
-            node_count=len([node for node in puzzle_data.nodes]),
-            edge_count=len([edge for edge in puzzle_data.edges]),
+            node_count=len(puzzle_data.nodes),
+            edge_count=len(puzzle_data.edges),
             coins=puzzle_data.coins,
             description=puzzle_data.description,
-            is_working=puzzle_data.is_working,
+            is_working=puzzle_data.is_working if puzzle_data.is_working else False,
         )
-        self.db.add(puzzle)
-        self.db.flush()
 
-        # Create nodes, build and return index → id map. Used to build edges
+    @staticmethod
+    def _build_child_rows(puzzle_id: UUID, puzzle_data: PuzzleCreate, rows: dict[type, list[dict]]):
+        """Build node, edge, unit, path and path_node rows of one puzzle.
+        IDs are assigned up front, so no per-row flush or node lookup is needed."""
+        # index → id map. Used to build edges and paths
         node_map = {}
         for node_data in puzzle_data.nodes:
-            node = models.Node(
-                id=uuid4(),
+            node_map[node_data.index] = uuid4()
+            rows[models.Node].append(dict(
+                id=node_map[node_data.index],
                 node_index=node_data.index,
                 x_position=node_data.x,
                 y_position=node_data.y,
-                puzzle_id=puzzle.id
-            )
-            self.db.add(node)
-            self.db.flush()
-            node_map[node_data.index] = node.id
+                puzzle_id=puzzle_id,
+            ))
 
         for edge_data in puzzle_data.edges:
-            start_uuid = node_map.get(edge_data.start)
-            end_uuid = node_map.get(edge_data.end)
-            edge = models.Edge(
+            rows[models.Edge].append(dict(
                 id=uuid4(),
                 edge_index=edge_data.index,
-                start_node_id=start_uuid,
-                end_node_id=end_uuid,
-                puzzle_id=puzzle.id
-            )
-            self.db.add(edge)
-            self.db.flush()
-
-        # Create Unit
+                start_node_id=node_map.get(edge_data.start),
+                end_node_id=node_map.get(edge_data.end),
+                puzzle_id=puzzle_id,
+            ))
+
         for unit_data in puzzle_data.units:
-            unit = models.Unit(
-                id=uuid4(),
-                unit_type=unit_data.type,
-                faction=unit_data.faction,
-                puzzle_id=puzzle.id,
-            )
-            self.db.add(unit)
-            self.db.flush()
-
-            # Create path
-            path = models.Path(unit_id=unit.id)
-            self.db.add(path)
-            self.db.flush()
-
-            # Create path_node
+            unit_id = uuid4()
+            path_id = uuid4()
+            rows[models.Unit].append(dict(id=unit_id, unit_type=unit_data.type, faction=unit_data.faction, puzzle_id=puzzle_id))
+            rows[models.Path].append(dict(id=path_id, unit_id=unit_id))
             for index, n_index in enumerate(unit_data.path):
-                node = (
-                    self.db.query(models.Node)
-                    .filter(
-                        models.Node.puzzle_id == puzzle.id,
-                        models.Node.node_index == n_index
-                    )
-                    .first()
-                )
-                path_node = models.PathNode(
+                if n_index not in node_map:
+                    logger.warning(f"Path of unit {unit_data.type} references unknown node {n_index}")
+                    continue
+                rows[models.PathNode].append(dict(
                     id=uuid4(),
-                    path_id=path.id,
-                    node_id=node.id,
+                    path_id=path_id,
+                    node_id=node_map[n_index],
                     order_index=index,
-                    node_index=n_index
-                )
-                self.db.add(path_node)
-                self.db.flush()
+                    node_index=n_index,
+                ))
+
+    def _insert_rows(self, rows: dict[type, list[dict]]):
+        """Bulk insert rows in foreign key order"""
+        for model in (models.Puzzle, models.Node, models.Edge, models.Unit, models.Path, models.PathNode):
+            bulk_insert(self.db, model, rows.get(model, []))
+
+    @staticmethod
+    def _empty_rows() -> dict[type, list[dict]]:
+        return {model: [] for model in (models.Puzzle, models.Node, models.Edge, models.Unit, models.Path, models.PathNode)}
+
+    @staticmethod
+    def _graph_from_rows(puzzle_id: UUID, columns: dict, rows: dict[type, list[dict]]) -> PuzzleGraph:
+        """PuzzleGraph of a puzzle that is about to be written (rows of one puzzle only)"""
+        unit_by_path = {path["id"]: path["unit_id"] for path in rows[models.Path]}
+        return PuzzleGraph.from_rows(
+            dict(columns, id=puzzle_id),
+            [(n["id"], n["node_index"], n["x_position"], n["y_position"]) for n in rows[models.Node]],
+            [(e["edge_index"], e["start_node_id"], e["end_node_id"]) for e in rows[models.Edge]],
+            [(u["id"], u["unit_type"], u["faction"]) for u in rows[models.Unit]],
+            [(unit_by_path[pn["path_id"]], pn["node_index"]) for pn in rows[models.PathNode]],
+        )
+
+    @staticmethod
+    def _document_columns(graph: PuzzleGraph) -> dict:
+        """graph_blob column value. Cleared in normalized mode, so it can never be stale"""
+        return dict(graph_blob=graph.to_bytes() if settings.PUZZLE_STORAGE_MODE == "document" else None)
+
+    @staticmethod
+    def _written(puzzle_id: UUID, graph: PuzzleGraph):
+        """Invalidate the cache after a write and keep the freshly written graph"""
+        puzzle_graph_cache.invalidate(puzzle_id)
+        puzzle_graph_cache.put(puzzle_id, graph, puzzle_graph_cache.version(puzzle_id))
+
+    # create puzzle
+    def create_puzzle(self, puzzle_data: PuzzleCreate):
+        """Insert new puzzle to DB table puzzles and its related units"""
+
+        puzzle_id = uuid4()
+        columns = self._puzzle_columns(puzzle_data)
+        rows = self._empty_rows()
+        self._build_child_rows(puzzle_id, puzzle_data, rows)
+        graph = self._graph_from_rows(puzzle_id, columns, rows)
+
+        puzzle = models.Puzzle(id=puzzle_id, **columns, **self._document_columns(graph))
+        self.db.add(puzzle)
+        self.db.flush()
+
+        # Create nodes, edges, units, paths and path nodes in bulk
+        self._insert_rows(rows)
 
         self.db.commit()
+        self._written(puzzle.id, graph)
         logger.info(f"Created new puzzle with id: {puzzle.id}")
         return puzzle
 
+
+    def create_puzzles_bulk(
+            self,
+            puzzles_data: List[PuzzleCreate],
+            puzzle_ids: Optional[List[UUID]] = None,
+    ) -> List[UUID]:
+        """Insert many puzzles with all related rows in one transaction"""
+        puzzle_ids = puzzle_ids or [uuid4() for _ in puzzles_data]
+        rows = self._empty_rows()
+        graphs = []
+
+        for puzzle_id, puzzle_data in zip(puzzle_ids, puzzles_data):
+            columns = self._puzzle_columns(puzzle_data)
+            puzzle_rows = self._empty_rows()
+            self._build_child_rows(puzzle_id, puzzle_data, puzzle_rows)
+            graph = self._graph_from_rows(puzzle_id, columns, puzzle_rows)
+            graphs.append(graph)
+
+            rows[models.Puzzle].append(dict(id=puzzle_id, **columns, **self._document_columns(graph)))
+            for model, model_rows in puzzle_rows.items():
+                rows[model].extend(model_rows)
+
+        self._insert_rows(rows)
+        self.db.commit()
+        for puzzle_id, graph in zip(puzzle_ids, graphs):
+            self._written(puzzle_id, graph)
+        logger.info(f"Created {len(puzzle_ids)} puzzles in bulk ({sum(len(r) for r in rows.values())} rows)")
+        return puzzle_ids
+
     # get all puzzle
     def get_all_puzzle(
             self,
@@ -155,223 +219,344 @@ class PuzzleServices:
         if puzzle:
             self.db.delete(puzzle)
             self.db.commit()
+            puzzle_graph_cache.invalidate(puzzle_id)
+
+
+    def _delete_child_rows(self, puzzle_id: UUID):
+        """Delete path nodes, paths, units, edges and nodes of a puzzle with set-based DELETEs"""
+        unit_ids = select(models.Unit.id).where(models.Unit.puzzle_id == puzzle_id)
+        path_ids = select(models.Path.id).where(models.Path.unit_id.in_(unit_ids))
+        self.db.execute(delete(models.PathNode).where(models.PathNode.path_id.in_(path_ids)))
+        self.db.execute(delete(models.Path).where(models.Path.unit_id.in_(unit_ids)))
+        self.db.execute(delete(models.Unit).where(models.Unit.puzzle_id == puzzle_id))
+        self.db.execute(delete(models.Edge).where(models.Edge.puzzle_id == puzzle_id))
+        self.db.execute(delete(models.Node).where(models.Node.puzzle_id == puzzle_id))
 
 
     def update_puzzle(self, puzzle_id: UUID, puzzle_data: PuzzleCreate):
         """Update existing puzzle by deleting old data and recreating with new data"""
         TOOL = "PuzzleServices.update_puzzle:"
-        logger.debug(f"\n{TOOL} Puzzle Data (PuzzleCreate): \n", puzzle_data)
-        puzzle = self.get_puzzle_by_id(puzzle_id)
+        logger.debug("\n%s Puzzle Data (PuzzleCreate): \n%s", TOOL, payload(puzzle_data))
+        puzzle = self.db.query(models.Puzzle).filter(models.Puzzle.id == puzzle_id).first()
         if not puzzle:
             raise HTTPException(status_code=404, detail="Puzzle not found")
-        logger.debug("\nPuzzle: \n", puzzle)
+        logger.debug("\nPuzzle: \n%s", payload(puzzle))
 
+        columns = self._puzzle_columns(puzzle_data)
+        rows = self._empty_rows()
+        self._build_child_rows(puzzle.id, puzzle_data, rows)
+        graph = self._graph_from_rows(puzzle.id, columns, rows)
 
         # Update puzzle metadata
         logger.debug(f"{TOOL} update puzzle meta data...")
-        puzzle.name = puzzle_data.name
-        puzzle.model = puzzle_data.model
-        puzzle.enemy_count = len([enemy for enemy in puzzle_data.units if enemy.faction == "enemy"])
-        puzzle.player_unit_count = len([player for player in puzzle_data.units if player.faction == "player"])
-        puzzle.game_mode = puzzle_data.game_mode
-        puzzle.node_count = len([node for node in puzzle_data.nodes])
-        puzzle.edge_count = len([edge for edge in puzzle_data.edges])
-        puzzle.coins = puzzle_data.coins
-        puzzle.description = puzzle_data.description
-        puzzle.is_working = puzzle_data.is_working if puzzle_data.is_working else False
+        for key, value in {**columns, **self._document_columns(graph)}.items():
+            setattr(puzzle, key, value)
         self.db.flush()
 
         # Delete old nodes, edges, and units
-        for node in puzzle.nodes:
-            self.db.delete(node)
-        for edge in puzzle.edges:
-            self.db.delete(edge)
-        for unit in puzzle.units:
-            self.db.delete(unit)
-        self.db.flush()
-
-        # Create new nodes, build and return index → id map
-        node_map = {}
-        for node_data in puzzle_data.nodes:
-            node = models.Node(
-                id=uuid4(),
-                node_index=node_data.index,
-                x_position=node_data.x,
-                y_position=node_data.y,
-                puzzle_id=puzzle.id
-            )
-            self.db.add(node)
-            self.db.flush()
-            node_map[node_data.index] = node.id
+        self._delete_child_rows(puzzle.id)
 
-        # Create new edges
-        for edge_data in puzzle_data.edges:
-            start_uuid = node_map.get(edge_data.start)
-            end_uuid = node_map.get(edge_data.end)
-            edge = models.Edge(
-                id=uuid4(),
-                edge_index=edge_data.index,
-                start_node_id=start_uuid,
-                end_node_id=end_uuid,
-                puzzle_id=puzzle.id
-            )
-            self.db.add(edge)
-            self.db.flush()
-
-        # Create new units
-        for unit_data in puzzle_data.units:
-            unit = models.Unit(
-                id=uuid4(),
-                unit_type=unit_data.type,
-                faction=unit_data.faction,
-                puzzle_id=puzzle.id,
-            )
-            self.db.add(unit)
-            self.db.flush()
-
-            # Create path
-            if unit:
-                path = models.Path(unit_id=unit.id)
-                self.db.add(path)
-                self.db.flush()
-
-            # Create path_node
-            for index, n_index in enumerate(unit_data.path):
-                node = (
-                    self.db.query(models.Node)
-                    .filter(
-                        models.Node.puzzle_id == puzzle.id,
-                        models.Node.node_index == n_index
-                    )
-                    .first()
-                )
-                if node:
-                    path_node = models.PathNode(
-                        id=uuid4(),
-                        path_id=path.id,
-                        node_id=node.id,
-                        order_index=index,
-                        node_index=n_index
-                    )
-                    self.db.add(path_node)
-                    self.db.flush()
+        # Create new nodes, edges, units, paths and path nodes in bulk
+        self._insert_rows(rows)
 
         self.db.commit()
+        self._written(puzzle.id, graph)
+        # children were replaced outside the ORM, reload them on next access
+        self.db.expire(puzzle, ["nodes", "edges", "units"])
         return puzzle
 
 
-    # generate puzzle
-    async def generate_puzzle(self, puzzle_config: PuzzleGenerate) -> PuzzleCreate | None:
-        """ Generates a new puzzle from given config"""
-        logger.debug(f"Puzzle Config: ", puzzle_config)
+    def apply_edits(self, puzzle_id: UUID, edit: PuzzleEditResponse) -> tuple[PuzzleGraph, list[str]]:
+        """Validate and apply typed edit operations with targeted writes instead of delete and recreate.
+        Raises PuzzleEditError if an operation doesn't fit the puzzle (nothing is written then)"""
+        graph = self.get_puzzle_graph(puzzle_id)
+        editor = PuzzleEditor(graph)
+        editor.apply(edit.ops)
+        editor.set_meta(coins=edit.coins, description=edit.description)
+        if not editor.changed:
+            return graph, []
+        new_graph = editor.to_graph()
+
+        # old path nodes of changed unit paths
+        unit_ids = [UUID(editor.units[u][0]) for u in editor.changed_paths]
+        path_ids = dict(self.db.execute(select(models.Path.unit_id, models.Path.id).where(models.Path.unit_id.in_(unit_ids))).all()) if unit_ids else {}
+        if path_ids:
+            self.db.execute(delete(models.PathNode).where(models.PathNode.path_id.in_(list(path_ids.values()))))
+
+        # removed (and replaced) edges, then removed nodes
+        stale_edges = editor.removed_edges
+        if stale_edges:
+            self.db.execute(delete(models.Edge).where(models.Edge.puzzle_id == puzzle_id, models.Edge.edge_index.in_(stale_edges)))
+        if editor.removed_nodes:
+            self.db.execute(delete(models.Node).where(models.Node.id.in_([UUID(i) for i in editor.removed_nodes.values()])))
+
+        bulk_insert(self.db, models.Node, [
+            dict(id=editor.node_id(index), node_index=index, x_position=editor.nodes[index][1],
+                 y_position=editor.nodes[index][2], puzzle_id=puzzle_id)
+            for index in sorted(editor.added_nodes)
+        ])
+        if editor.moved_nodes:
+            self.db.execute(update(models.Node), [
+                dict(id=editor.node_id(index), x_position=editor.nodes[index][1], y_position=editor.nodes[index][2])
+                for index in editor.moved_nodes
+            ])
+        bulk_insert(self.db, models.Edge, [
+            dict(id=uuid4(), edge_index=index, start_node_id=editor.node_id(editor.edges[index][0]),
+                 end_node_id=editor.node_id(editor.edges[index][1]), puzzle_id=puzzle_id)
+            for index in sorted(editor.added_edges)
+        ])
+
+        path_rows, path_node_rows = [], []
+        for u in editor.changed_paths:
+            unit_id = UUID(editor.units[u][0])
+            path_id = path_ids.get(unit_id)
+            if path_id is None:
+                path_id = uuid4()
+                path_rows.append(dict(id=path_id, unit_id=unit_id))
+            for order, index in enumerate(editor.units[u][3]):
+                path_node_rows.append(dict(id=uuid4(), path_id=path_id, node_id=editor.node_id(index), order_index=order, node_index=index))
+        bulk_insert(self.db, models.Path, path_rows)
+        bulk_insert(self.db, models.PathNode, path_node_rows)
+
+        self.db.execute(update(models.Puzzle).where(models.Puzzle.id == puzzle_id).values(
+            node_count=new_graph.node_count,
+            edge_count=new_graph.edge_count,
+            coins=new_graph.coins,
+            description=new_graph.description,
+            **self._document_columns(new_graph),
+        ))
+        self.db.commit()
+        self._written(puzzle_id, new_graph)
+        logger.info(f"Applied {len(edit.ops)} edit operations to puzzle {puzzle_id}")
+        return new_graph, editor.applied
+
+
+    def backfill_documents(self, batch_size: int = 100, force: bool = False) -> int:
+        """Write graph_blob for puzzles without one (all puzzles with force). Returns the number of written documents"""
+        query = select(models.Puzzle.id)
+        if not force:
+            query = query.where(models.Puzzle.graph_blob.is_(None))
+        puzzle_ids = self.db.execute(query).scalars().all()
+
+        for start in range(0, len(puzzle_ids), batch_size):
+            for puzzle_id in puzzle_ids[start:start + batch_size]:
+                blob = self._load_normalized_graph(puzzle_id).to_bytes()
+                self.db.execute(update(models.Puzzle).where(models.Puzzle.id == puzzle_id).values(graph_blob=blob))
+            self.db.commit()
+            logger.info(f"Backfilled {min(start + batch_size, len(puzzle_ids))}/{len(puzzle_ids)} puzzle documents")
+        return len(puzzle_ids)
+
 
-        # get example puzzles from database
-        example_puzzles = self.get_all_puzzle()
+    def get_serialized_examples(self, game_mode: str) -> list[dict | str]:
+        """Serialize working puzzles of a game mode. Used as examples in few shot prompts
+        (dicts, or compact text blocks with PUZZLE_PROMPT_FORMAT=compact)"""
+        puzzle_ids = self.db.execute(
+            select(models.Puzzle.id)
+            .where(func.lower(models.Puzzle.game_mode) == game_mode.lower(), models.Puzzle.is_working == True)
+        ).scalars().all()
 
-        # Serialize each puzzle to JSON format to use it as examples in few shot prompt
         serialized_examples = []
-        try:
-            for puzzle in example_puzzles:
-                if puzzle.game_mode.lower() == puzzle_config.game_mode.lower() and puzzle.is_working:
-                    serialized = self.serialize_puzzle(puzzle.id)
-                    # Add description and name for context
-                    serialized['name'] = puzzle.name
-                    serialized['description'] = puzzle.description
-                    serialized['game_mode'] = puzzle.game_mode
-                    serialized_examples.append(serialized)
-
-
-            llm = get_llm(puzzle_config.model)
-            prompts = await get_puzzle_generation_prompt(
-                example_puzzles=serialized_examples,
-                db=self.db,
-                game_mode=puzzle_config.game_mode,
-                node_count=puzzle_config.node_count,
-                edge_count=puzzle_config.edge_count,
-                turns=puzzle_config.turns,
-                units=puzzle_config.units,
-                description=puzzle_config.description,
-            )
-
-            puzzle_generated = await llm.structured(prompts, PuzzleLLMResponse)
-
-            if not puzzle_generated:
-                logger.error(f"Failed to generate puzzle.", puzzle_generated.description)  # debugging
-                raise Exception("Puzzle generation failed")
-
-            new_puzzle = PuzzleCreate(
-                name=puzzle_config.name,
-                model=puzzle_config.model,
-                game_mode=puzzle_config.game_mode,
-                coins=puzzle_generated.coins,
-                nodes=[n.model_dump() for n in puzzle_generated.nodes],
-                edges=[n.model_dump() for n in puzzle_generated.edges],
-                units=[n.model_dump() for n in puzzle_generated.units],
-                description=puzzle_generated.description
-            )
-            return new_puzzle
+        for graph in self.get_puzzle_graphs(puzzle_ids):
+            if use_compact_format():
+                serialized_examples.append(encode_puzzle(graph))
+            else:
+                # editor JSON plus name, description and game mode for context
+                serialized_examples.append(graph.to_example_dict())
+        return serialized_examples
+
+
+    # generate puzzle
+    async def generate_puzzle(
+            self,
+            puzzle_config: PuzzleGenerate,
+            serialized_examples: Optional[list[dict]] = None,
+    ) -> PuzzleCreate | None:
+        """ Generates a new puzzle from given config.
+        Pass serialized_examples to reuse already loaded few shot examples (e.g. in batches)."""
+        logger.debug(f"Puzzle Config: {puzzle_config}")
+        self.last_usage = None
 
+        try:
+            # get example puzzles from database
+            if serialized_examples is None:
+                serialized_examples = self.get_serialized_examples(puzzle_config.game_mode)
         except Exception as e:
-            logger.error(f"Error while generating a puzzle: {e}", exc_info=True)
+            logger.error(f"Error while loading example puzzles: {e}", exc_info=True)
             return None
 
+        puzzle, self.last_usage = await generate_puzzle_from_examples(puzzle_config, serialized_examples)
+        return puzzle
+
+
+
+    def get_puzzle_graph(self, puzzle_id) -> PuzzleGraph:
+        """Get a puzzle as PuzzleGraph. Served from the process-wide cache if possible"""
+        graph = puzzle_graph_cache.get(puzzle_id)
+        if graph is None:
+            version = puzzle_graph_cache.version(puzzle_id)
+            graph = self._load_puzzle_graph(puzzle_id)
+            puzzle_graph_cache.put(puzzle_id, graph, version)
+        return graph
+
+
+    def get_puzzle_graphs(self, puzzle_ids: list) -> list[PuzzleGraph]:
+        """Several puzzles as PuzzleGraphs (in the given order, missing ones left out).
+        Cached graphs come from the cache, the others are loaded with one select per table"""
+        graphs = {str(puzzle_id): puzzle_graph_cache.get(puzzle_id) for puzzle_id in puzzle_ids}
+        missing = [puzzle_id for puzzle_id, graph in graphs.items() if graph is None]
+        for start in range(0, len(missing), LOAD_CHUNK_SIZE):
+            chunk = missing[start:start + LOAD_CHUNK_SIZE]
+            versions = {puzzle_id: puzzle_graph_cache.version(puzzle_id) for puzzle_id in chunk}
+            for puzzle_id, graph in self._load_puzzle_graphs([UUID(puzzle_id) for puzzle_id in chunk]).items():
+                puzzle_graph_cache.put(puzzle_id, graph, versions[puzzle_id])
+                graphs[puzzle_id] = graph
+        return [graphs[str(puzzle_id)] for puzzle_id in puzzle_ids if graphs[str(puzzle_id)] is not None]
+
+
+    def _load_puzzle_graphs(self, puzzle_ids: list[UUID]) -> dict[str, PuzzleGraph]:
+        """Load several puzzles at once, keyed by str(puzzle id). Like _load_puzzle_graph, documents first in document mode"""
+        graphs = {}
+        if settings.PUZZLE_STORAGE_MODE == "document":
+            rows = self.db.execute(
+                select(models.Puzzle.id, models.Puzzle.graph_blob)
+                .where(models.Puzzle.id.in_(puzzle_ids), models.Puzzle.graph_blob.is_not(None))
+            ).all()
+            graphs = {str(puzzle_id): PuzzleGraph.from_bytes(blob, puzzle_id=puzzle_id) for puzzle_id, blob in rows}
+            puzzle_ids = [puzzle_id for puzzle_id in puzzle_ids if str(puzzle_id) not in graphs]
+        if puzzle_ids:
+            graphs.update(self._load_normalized_graphs(puzzle_ids))
+        return graphs
+
+
+    def _load_puzzle_graph(self, puzzle_id) -> PuzzleGraph:
+        """Load from the document column in document mode, else (or if there is no document yet) from the tables"""
+        if settings.PUZZLE_STORAGE_MODE == "document":
+            graph = self._load_document_graph(puzzle_id)
+            if graph is not None:
+                return graph
+        return self._load_normalized_graph(puzzle_id)
+
+
+    def _load_document_graph(self, puzzle_id) -> Optional[PuzzleGraph]:
+        """Load a puzzle from its graph_blob (one row). None if the puzzle has no document"""
+        blob = self.db.execute(select(models.Puzzle.graph_blob).where(models.Puzzle.id == puzzle_id)).scalar()
+        if blob is None:
+            return None
+        return PuzzleGraph.from_bytes(blob, puzzle_id=puzzle_id)
+
+
+    def _load_normalized_graph(self, puzzle_id) -> PuzzleGraph:
+        """Load a puzzle as PuzzleGraph with plain column selects (no ORM objects are built)"""
+        puzzle_row = self.db.execute(
+            select(models.Puzzle.id, models.Puzzle.name, models.Puzzle.model, models.Puzzle.game_mode,
+                   models.Puzzle.coins, models.Puzzle.description, models.Puzzle.is_working)
+            .where(models.Puzzle.id == puzzle_id)
+        ).mappings().first()
+        if not puzzle_row:
+            raise HTTPException(status_code=404, detail="Puzzle not found")
+
+        node_rows = self.db.execute(
+            select(models.Node.id, models.Node.node_index, models.Node.x_position, models.Node.y_position)
+            .where(models.Node.puzzle_id == puzzle_id)
+        ).all()
+        edge_rows = self.db.execute(
+            select(models.Edge.edge_index, models.Edge.start_node_id, models.Edge.end_node_id)
+            .where(models.Edge.puzzle_id == puzzle_id)
+        ).all()
+        unit_rows = self.db.execute(
+            select(models.Unit.id, models.Unit.unit_type, models.Unit.faction)
+            .where(models.Unit.puzzle_id == puzzle_id)
+        ).all()
+        path_rows = self.db.execute(
+            select(models.Path.unit_id, models.PathNode.node_index)
+            .join(models.PathNode, models.PathNode.path_id == models.Path.id)
+            .join(models.Unit, models.Unit.id == models.Path.unit_id)
+            .where(models.Unit.puzzle_id == puzzle_id)
+            .order_by(models.Path.unit_id, models.PathNode.order_index)
+        ).all()
+
+        return PuzzleGraph.from_rows(puzzle_row, node_rows, edge_rows, unit_rows, path_rows)
+
+
+    def _load_normalized_graphs(self, puzzle_ids: list[UUID]) -> dict[str, PuzzleGraph]:
+        """_load_normalized_graph for several puzzles: the same five selects with IN, rows grouped by puzzle"""
+        puzzle_rows = self.db.execute(
+            select(models.Puzzle.id, models.Puzzle.name, models.Puzzle.model, models.Puzzle.game_mode,
+                   models.Puzzle.coins, models.Puzzle.description, models.Puzzle.is_working)
+            .where(models.Puzzle.id.in_(puzzle_ids))
+        ).mappings().all()
+
+        rows: dict[str, tuple[list, list, list, list]] = {str(row["id"]): ([], [], [], []) for row in puzzle_rows}
+        queries = (
+            select(models.Node.puzzle_id, models.Node.id, models.Node.node_index, models.Node.x_position, models.Node.y_position)
+            .where(models.Node.puzzle_id.in_(puzzle_ids)),
+            select(models.Edge.puzzle_id, models.Edge.edge_index, models.Edge.start_node_id, models.Edge.end_node_id)
+            .where(models.Edge.puzzle_id.in_(puzzle_ids)),
+            select(models.Unit.puzzle_id, models.Unit.id, models.Unit.unit_type, models.Unit.faction)
+            .where(models.Unit.puzzle_id.in_(puzzle_ids)),
+            select(models.Unit.puzzle_id, models.Path.unit_id, models.PathNode.node_index)
+            .join(models.PathNode, models.PathNode.path_id == models.Path.id)
+            .join(models.Unit, models.Unit.id == models.Path.unit_id)
+            .where(models.Unit.puzzle_id.in_(puzzle_ids))
+            .order_by(models.Path.unit_id, models.PathNode.order_index),
+        )
+        for table, query in enumerate(queries):
+            for puzzle_id, *values in self.db.execute(query).all():
+                if str(puzzle_id) in rows:
+                    rows[str(puzzle_id)][table].append(tuple(values))
+
+        return {str(row["id"]): PuzzleGraph.from_rows(row, *rows[str(row["id"])]) for row in puzzle_rows}
 
 
     # Serialize puzzle data to dict
     def serialize_puzzle(self, puzzle_id):
         """Loads Puzzle by ID and serializes it. Returns a Puzzle dict."""
-        logger.debug("\nSerializing Puzzle: ", puzzle_id)
+        logger.debug(f"Serializing Puzzle: {puzzle_id}")
         try:
-            puzzle = self.get_puzzle_by_id(puzzle_id)
-            logger.debug(f"serializing_puzzle: Loaded puzzle {type(puzzle)}")
+            return self.get_puzzle_graph(puzzle_id).to_editor_dict()
         except Exception as e:
             logger.error(f"serializing_puzzle: Error loading puzzle by ID {e}", exc_info=True)
             return None
 
-        logger.debug("serializing_puzzle: serializing...")
-        puzzle_data = {
-            "nodes": [
-                {
-                    "id": str(node.id),
-                    "node_index": node.node_index,
-                    "x_position": node.x_position,
-                    "y_position": node.y_position
-                }
-                for node in sorted(puzzle.nodes, key=lambda n: n.node_index)
-            ],
-            "edges": [
-                {
-                    "edge_index": edge.edge_index,
-                    "start_node_id": str(edge.start_node_id),
-                    "end_node_id": str(edge.end_node_id)
-                }
-                for edge in sorted(puzzle.edges, key=lambda e: e.edge_index)
-            ],
-            "units": [
-                {
-                    "id": str(unit.id),
-                    "unit_type": unit.unit_type,
-                    "faction": unit.faction,
-                    "path": {
-                        "path_node": [
-                            {
-                                "node_id": str(path_node.node_id),
-                                "order_index": path_node.order_index,
-                                "node_index": path_node.node_index
-                            }
-                            for path_node in sorted(unit.path.path_node, key=lambda pn: pn.order_index)
-                        ]
-                    } if unit.path and unit.path.path_node else {"path_node": []}
-                }
-                for unit in puzzle.units
-            ]
-        }
-        if not puzzle_data:
-            logger.error("serializing_puzzle: failed to serialize puzzle", exc_info=True)
-            return None
-
-        logger.debug("serializing_puzzle: serializing successfully: \n")
-        return puzzle_data
 
+async def generate_puzzle_from_examples(
+        puzzle_config: PuzzleGenerate,
+        serialized_examples: list,
+) -> tuple[Optional[PuzzleCreate], Optional[dict]]:
+    """ LLM part of the puzzle generation, no database needed (batches pass preloaded examples).
+    Returns the puzzle (None on errors) and the token usage of the LLM call"""
+    usage = None
+    try:
+        llm = get_llm(puzzle_config.model)
+        prompts = await get_puzzle_generation_prompt(
+            example_puzzles=serialized_examples,
+            game_mode=puzzle_config.game_mode,
+            node_count=puzzle_config.node_count,
+            edge_count=puzzle_config.edge_count,
+            turns=puzzle_config.turns,
+            units=puzzle_config.units,
+            description=puzzle_config.description,
+        )
 
+        puzzle_generated = await request_puzzle(llm, prompts, PuzzleLLMResponse)
+        usage = getattr(llm, "last_usage", None)
+
+        if not puzzle_generated:
+            logger.error(f"Failed to generate puzzle: {puzzle_config.model} returned no puzzle")
+            return None, usage
+
+        new_puzzle = PuzzleCreate(
+            name=puzzle_config.name,
+            model=puzzle_config.model,
+            game_mode=puzzle_config.game_mode,
+            coins=puzzle_generated.coins,
+            nodes=[n.model_dump() for n in puzzle_generated.nodes],
+            edges=[n.model_dump() for n in puzzle_generated.edges],
+            units=[n.model_dump() for n in puzzle_generated.units],
+            description=puzzle_generated.description
+        )
+        return new_puzzle, usage
 
+    except Exception as e:
+        logger.error(f"Error while generating a puzzle: {e}", exc_info=True)
+        return None, usage
@@ -1,18 +1,39 @@
 from uuid import uuid4, UUID
+import asyncio
 import logging
-from typing import Any
+import re
+from typing import Any, Optional
 from app.llm import get_llm
 from app import models
 from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.puzzle_cache import puzzle_graph_cache
 import aiosqlite
+from sqlalchemy import select, exists
 
 logger = logging.getLogger(__name__)
 
+# running title (and title store) tasks (asyncio only keeps weak references to tasks)
+_title_tasks: set[asyncio.Task] = set()
+# sessions whose LLM title is stored once its task is done, the sidebar polls while there are any
+_pending_titles: set[UUID] = set()
+
+
 class SessionService:
 
     def __init__(self, db):
        self.db = db
 
+
+    @staticmethod
+    def local_topic_name(message: str, max_words: int = 5) -> str:
+        """ Placeholder title from the first words of the message (no LLM)"""
+        words = re.sub(r"[^\w\s-]", " ", message or "").split()
+        if not words:
+            return "New chat"
+        title = " ".join(words[:max_words])[:40].rstrip()
+        return title[0].upper() + title[1:]
+
     async def create_topic_name(self, message: str, model: str) -> str:
         """ Takes in first message of a session and creates a new topic name"""
         llm = get_llm(model)
@@ -36,7 +57,11 @@ class SessionService:
         else:
             logger.debug("No session found")
 
-        topic_name = await self.create_topic_name(message=user_message, model=model)
+        # "llm" waits for the title before the first answer, otherwise the session starts with a local title
+        if settings.SESSION_TITLE_MODE == "llm":
+            topic_name = await self.create_topic_name(message=user_message, model=model)
+        else:
+            topic_name = self.local_topic_name(user_message)
 
         new_session = models.Session(
            id=uuid4(),
@@ -47,9 +72,78 @@ class SessionService:
 
         logger.debug(f"New session was created. \nSession id: ", new_session.id)
 
+        # LLM title is generated while the agent works on the first message
+        if settings.SESSION_TITLE_MODE == "background":
+            self.store_title_when_ready(self.start_title_task(user_message, model), new_session.id, placeholder=topic_name)
+
         return new_session.id
 
 
+    def start_title_task(self, message: str, model: str) -> asyncio.Task:
+        """ Generate the LLM title in the background. The task returns the title or None on errors"""
+        async def generate() -> Optional[str]:
+            try:
+                topic_name = await self.create_topic_name(message=message, model=model)
+                return topic_name.strip() if topic_name else None
+            except Exception as e:
+                logger.warning(f"Could not generate topic name: {e}")
+                return None
+
+        task = asyncio.create_task(generate())
+        _title_tasks.add(task)
+        task.add_done_callback(_title_tasks.discard)
+        return task
+
+
+    def store_title_when_ready(self, task: asyncio.Task, session_id: UUID, placeholder: str):
+        """ Store the title of a title task as soon as it is done (the session has to be committed by then)"""
+        async def store(title: str):
+            try:
+                # sync db session, in a thread so the event loop doesn't wait for the commit
+                await asyncio.to_thread(self.store_topic_name, session_id, title, placeholder)
+            finally:
+                _pending_titles.discard(session_id)
+
+        def title_done(done: asyncio.Task):
+            if done.cancelled() or not done.result():
+                _pending_titles.discard(session_id)
+                return
+            store_task = asyncio.get_running_loop().create_task(store(done.result()))
+            _title_tasks.add(store_task)
+            store_task.add_done_callback(_title_tasks.discard)
+
+        _pending_titles.add(session_id)
+        task.add_done_callback(title_done)
+
+
+    @staticmethod
+    def titles_pending() -> bool:
+        """ True while a late LLM title still has to be stored (the sidebar keeps refreshing)"""
+        return bool(_pending_titles)
+
+
+    @staticmethod
+    def store_topic_name(session_id: UUID, topic_name: str, placeholder: str) -> bool:
+        """
+        Replace the placeholder title. Uses its own db session, the request one may be closed already.
+        A title that changed in the meantime (e.g. to the puzzle name) is kept. Returns True if the title changed.
+        """
+        db = SessionLocal()
+        try:
+            session = db.query(models.Session).filter(models.Session.id == session_id).first()
+            if not session or session.topic_name != placeholder:
+                return False
+            session.topic_name = topic_name
+            db.commit()
+            logger.debug(f"Session title generated: {topic_name}")
+            return True
+        except Exception as e:
+            logger.error(f"Could not store topic name: {e}", exc_info=True)
+            return False
+        finally:
+            db.close()
+
+
     def get_latest_session(self):
         """ Gets latest session """
         try:
@@ -84,15 +178,19 @@ class SessionService:
             if session:
                 logger.debug("session found")
 
+                deleted_puzzle_id = None
                 if session.puzzle_id:
                     puzzle = self.db.query(models.Puzzle).filter(models.Puzzle.id == session.puzzle_id).first()
                     if puzzle:
                         self.db.delete(puzzle)
+                        deleted_puzzle_id = puzzle.id
                     else:
                         logger.debug("Could not delete puzzle", exc_info=True)
 
                 self.db.delete(session)
                 self.db.commit()
+                if deleted_puzzle_id:
+                    puzzle_graph_cache.invalidate(deleted_puzzle_id) # after the commit, a load in between can't cache the old graph
                 logger.info(f"session successfully deleted: {session_id}")
             else:
                 logger.warning("session not found", exc_info=True)
@@ -141,7 +239,8 @@ class SessionService:
 
         logger.debug(f"Updating session title to puzzle name...")
         try:
-            puzzle = self.db.query(models.Puzzle).filter(models.Puzzle.id == puzzle_id).first()
+            from app.services.puzzle_services import PuzzleServices
+            puzzle = PuzzleServices(self.db).get_puzzle_graph(puzzle_id)
             logger.debug(f"New puzzle title: {puzzle.name}")
             session = self.db.query(models.Session).filter(models.Session.id == session_id).first()
             logger.debug(f"Current session title: {session.topic_name}")
@@ -166,27 +265,24 @@ class SessionService:
 
         logger.info(f"Checking for orphaned puzzles...")
 
-        # Get all puzzles
-        puzzles = self.db.query(models.Puzzle).all()
+        # Get all puzzles without a session (one query instead of a session lookup per puzzle)
+        orphans = self.db.execute(
+            select(models.Puzzle.id, models.Puzzle.name)
+            .where(~exists().where(models.Session.puzzle_id == models.Puzzle.id))
+        ).all()
         created_count = 0
 
-        for puzzle in puzzles:
-            # Check if a session already exists for this puzzle
-            existing_session = self.db.query(models.Session).filter(
-                models.Session.puzzle_id == puzzle.id
-            ).first()
+        for puzzle_id, puzzle_name in orphans:
+            logger.info(f"Creating missing session for puzzle '{puzzle_name}'")
 
-            if not existing_session:
-                logger.info(f"Creating missing session for puzzle '{puzzle.name}'")
-
-                # 3. Create new session linked to the puzzle
-                new_session = models.Session(
-                    id=uuid4(),
-                    topic_name=puzzle.name,  # Use puzzle name as default topic
-                    puzzle_id=puzzle.id
-                )
-                self.db.add(new_session)
-                created_count += 1
+            # Create new session linked to the puzzle
+            new_session = models.Session(
+                id=uuid4(),
+                topic_name=puzzle_name,  # Use puzzle name as default topic
+                puzzle_id=puzzle_id
+            )
+            self.db.add(new_session)
+            created_count += 1
 
         # Commit only if changes were made
         if created_count > 0:
@@ -223,8 +319,8 @@ class SessionService:
                 logger.debug(f"{len(orphan_threads)} orphan threads found. Deleting...")
 
                 # delete orphan threads
-                for thread_id in orphan_threads:
-                    await conn.execute("DELETE FROM checkpoints WHERE thread_id = ?", (str(thread_id),))
+                await conn.executemany("DELETE FROM checkpoints WHERE thread_id = ?",
+                                       [(str(thread_id),) for thread_id in orphan_threads])
 
                 await conn.commit()
                 logger.info(f"Orphan threads successfully deleted: {orphan_threads}")
@@ -244,12 +340,9 @@ class SessionService:
                 logger.error(f"No puzzle id found for session '{session_id}'")
                 raise Exception(f"No puzzle id found for session '{session_id}'")
 
-            # Get puzzle
-            puzzle = self.db.query(models.Puzzle).filter(models.Puzzle.id == puzzle_id).first()
-
-            if not puzzle:
-                logger.error(f"No puzzle found for puzzle ID '{puzzle_id}'")
-                raise Exception(f"No puzzle found for puzzle ID '{puzzle_id}'")
+            # Get puzzle (raises 404 if it doesn't exist)
+            from app.services.puzzle_services import PuzzleServices
+            puzzle = PuzzleServices(self.db).get_puzzle_graph(puzzle_id)
 
             # Serialize puzzle
             from app.agents import AgentTools
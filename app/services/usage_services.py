@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta, timezone
+import logging
+
+from sqlalchemy import select, or_, func, case, distinct
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app import models
+
+logger = logging.getLogger(__name__)
+
+PUZZLE_OPERATIONS = ("generate", "batch") # operations whose only purpose is a puzzle
+PERCENTILES = (50, 95, 99) # latency percentiles of the successful calls (nearest rank)
+
+
+class UsageServices:
+    """ Aggregates over the LLM call ledger (llm_calls)"""
+
+    def __init__(self, db: AsyncSession):
+        self.db = db
+
+    @staticmethod
+    def _since(hours: float) -> datetime:
+        return datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(hours=hours)
+
+    async def _summarize(self, since_hours: float, *group_by) -> list[dict]:
+        """Calls, success rate, latency percentiles and tokens per group (columns of LLMCall), all grouped in SQL"""
+        call = models.LLMCall
+        since = self._since(since_hours)
+        names = [column.key for column in group_by]
+
+        totals = (await self.db.execute(
+            select(*group_by,
+                   func.count().label("calls"),
+                   func.sum(case((call.success, 1), else_=0)).label("succeeded"),
+                   func.sum(call.input_tokens).label("input_tokens"),
+                   func.sum(call.output_tokens).label("output_tokens"),
+                   func.sum(call.cached_tokens).label("cached_tokens"))
+            .where(call.created_at >= since)
+            .group_by(*group_by)
+        )).all()
+
+        # nearest rank percentiles: only the rows at those ranks leave the database
+        ranked = (
+            select(*group_by, call.latency_ms,
+                   func.row_number().over(partition_by=group_by, order_by=call.latency_ms).label("rank"),
+                   func.count().over(partition_by=group_by).label("total"))
+            .where(call.created_at >= since, call.success.is_(True))
+            .subquery()
+        )
+        percentile_rows = (await self.db.execute(
+            select(*(ranked.c[name] for name in names), ranked.c.latency_ms, ranked.c.rank, ranked.c.total)
+            .where(or_(*(ranked.c.rank == (ranked.c.total * pct + 99) // 100 for pct in PERCENTILES)))
+        )).all()
+        percentiles: dict[tuple, dict] = {}
+        for row in percentile_rows:
+            group = percentiles.setdefault(tuple(getattr(row, name) for name in names), {})
+            for pct in PERCENTILES:
+                if row.rank == (row.total * pct + 99) // 100:
+                    group[pct] = row.latency_ms
+
+        summary = []
+        for row in totals:
+            group_key = tuple(getattr(row, name) for name in names)
+            latencies = percentiles.get(group_key, {})
+            summary.append({
+                **dict(zip(names, group_key)),
+                "calls": row.calls,
+                "success_rate": round((row.succeeded or 0) / row.calls, 4),
+                **{f"p{pct}_latency_ms": latencies.get(pct) for pct in PERCENTILES},
+                "input_tokens": row.input_tokens or 0,
+                "output_tokens": row.output_tokens or 0,
+                "cached_tokens": row.cached_tokens or 0,
+            })
+        return sorted(summary, key=lambda item: item["p95_latency_ms"] or 0, reverse=True)
+
+    async def model_latency(self, since_hours: float = 24) -> list[dict]:
+        """Per provider/model: latency percentiles of the successful calls, success rate, tokens"""
+        return await self._summarize(since_hours, models.LLMCall.provider, models.LLMCall.model)
+
+    async def node_usage(self, since_hours: float = 24) -> list[dict]:
+        """Per agent graph node and model (node None: calls outside of the chat agent)"""
+        return await self._summarize(since_hours, models.LLMCall.node, models.LLMCall.model)
+
+    async def tokens_per_puzzle(self, since_hours: float = 24) -> list[dict]:
+        """
+        Tokens per stored puzzle per model and operation.
+        Generation jobs count all their calls (failed attempts included), chat turns only count if they stored a puzzle.
+        """
+        call = models.LLMCall
+        rows = (await self.db.execute(
+            select(call.model, call.operation,
+                   func.count().label("calls"),
+                   func.count(distinct(call.group_id)).label("attempts"),
+                   func.count(distinct(call.created_puzzle_id)).label("puzzles"),
+                   func.sum(call.total_tokens).label("total_tokens"),
+                   func.sum(call.input_tokens).label("input_tokens"),
+                   func.sum(call.output_tokens).label("output_tokens"),
+                   func.sum(case((call.created_puzzle_id.is_(None), call.total_tokens), else_=0)).label("failed_tokens"))
+            .where(call.created_at >= self._since(since_hours))
+            .where(or_(call.operation.in_(PUZZLE_OPERATIONS), call.created_puzzle_id.is_not(None)))
+            .group_by(call.model, call.operation)
+        )).all()
+
+        result = []
+        for row in rows:
+            total_tokens = row.total_tokens or 0
+            result.append({
+                "model": row.model,
+                "operation": row.operation,
+                "calls": row.calls,
+                "total_tokens": total_tokens,
+                "input_tokens": row.input_tokens or 0,
+                "output_tokens": row.output_tokens or 0,
+                "failed_tokens": row.failed_tokens or 0,
+                "puzzles": row.puzzles,
+                "attempts": row.attempts,
+                "tokens_per_puzzle": round(total_tokens / row.puzzles, 1) if row.puzzles else None,
+                "calls_per_puzzle": round(row.calls / row.puzzles, 2) if row.puzzles else None,
+            })
+        return sorted(result, key=lambda item: (item["model"], item["operation"] or ""))
@@ -111,8 +111,13 @@ document.addEventListener("DOMContentLoaded", () => {
       body: JSON.stringify(data),
     });
 
-    if (response.redirected) {
-    window.location.href = response.url;  // manually follow it
+    if (response.status === 202) {
+      // generation runs in the background → follow job progress
+      const job = await response.json();
+      console.log("📥 Generation job queued:", job);
+      followGenerationJob(job);
+    } else if (response.redirected) {
+      window.location.href = response.url;  // manually follow it
     } else if (response.ok) {
       alert("Puzzle generation request sent!");
     } else {
@@ -121,6 +126,62 @@ document.addEventListener("DOMContentLoaded", () => {
       console.error("Server response:", err);
     }
   });
+
+  // --- Show job progress (SSE with polling fallback) ---
+  function showGenerationStatus(job) {
+    const statusBox = document.getElementById("generation-status");
+    if (!statusBox) return;
+    statusBox.style.display = "block";
+    document.getElementById("generation-stage").textContent = job.stage;
+    document.getElementById("generation-progress").value = job.progress;
+  }
+
+  function finishGenerationJob(job) {
+    if (job.status === "done") {
+      window.location.href = job.puzzle_url;
+    } else if (job.status === "failed") {
+      alert("Error generating puzzle: " + (job.error || "unknown error"));
+    }
+  }
+
+  function followGenerationJob(job) {
+    showGenerationStatus(job);
+
+    if (!window.EventSource) {
+      pollGenerationJob(job.status_url);
+      return;
+    }
+
+    const events = new EventSource(job.events_url);
+    events.onmessage = (event) => {
+      const status = JSON.parse(event.data);
+      showGenerationStatus(status);
+      if (status.status === "done" || status.status === "failed") {
+        events.close();
+        finishGenerationJob(status);
+      }
+    };
+    events.onerror = () => {
+      // connection lost → keep tracking the job by polling
+      events.close();
+      pollGenerationJob(job.status_url);
+    };
+  }
+
+  async function pollGenerationJob(statusUrl) {
+    const response = await fetch(statusUrl);
+    if (!response.ok) {
+      alert("Error loading generation status: " + await response.text());
+      return;
+    }
+    const status = await response.json();
+    showGenerationStatus(status);
+    if (status.status === "done" || status.status === "failed") {
+      finishGenerationJob(status);
+    } else {
+      setTimeout(() => pollGenerationJob(statusUrl), 2000);
+    }
+  }
 });
 
 // Function to scroll chat container to bottom
@@ -0,0 +1,70 @@
+"""
+Shared helpers for the benchmark scripts.
+Import this module BEFORE anything from 'app', it points the settings to a throw-away database.
+"""
+import os
+import random
+import tempfile
+from pathlib import Path
+
+
+def use_temp_database(name: str = "bench") -> Path:
+    """Point DATABASE_URL and CHECKPOINTS_URL to a temp dir and fill in dummy API keys"""
+    tmp_dir = Path(tempfile.mkdtemp(prefix=f"puzzle_{name}_"))
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{tmp_dir / 'puzzle.db'}")
+    os.environ.setdefault("CHECKPOINTS_URL", f"{tmp_dir / 'checkpointer.db'}")
+    os.environ.setdefault("GENERATION_JOBS_URL", f"{tmp_dir / 'generation_jobs.db'}")
+    for key in ("GOOGLE_API_KEY", "GROQ_API_KEY", "CLAUD_KEY", "OPENAI_API_KEY", "TAVILY_API_KEY"):
+        os.environ.setdefault(key, "benchmark")
+    return tmp_dir
+
+
+def make_puzzle(node_count: int = 50, unit_count: int = 6, seed: int = 0, name: str = "Benchmark Puzzle") -> dict:
+    """Build a PuzzleCreate payload: nodes on a grid, edges to right/lower neighbours, units walking along rows"""
+    rng = random.Random(seed)
+    columns = max(1, int(node_count ** 0.5))
+    nodes = [{"index": i, "x": (i % columns) * 200, "y": (i // columns) * 200} for i in range(node_count)]
+
+    edges = []
+    for i in range(node_count):
+        for neighbour in (i + 1 if (i + 1) % columns else None, i + columns):
+            if neighbour is not None and neighbour < node_count:
+                edges.append({"index": len(edges), "start": i, "end": neighbour})
+
+    units = []
+    for u in range(unit_count):
+        start = rng.randrange(node_count)
+        path = [start]
+        while len(path) < 4 and path[-1] + 1 < node_count and (path[-1] + 1) % columns:
+            path.append(path[-1] + 1)
+        units.append({"type": "Grunt" if u % 2 else "Swordsman", "faction": "enemy" if u % 2 else "player", "path": path})
+
+    return {
+        "name": name,
+        "model": "benchmark",
+        "game_mode": "skirmish",
+        "coins": 5,
+        "nodes": nodes,
+        "edges": edges,
+        "units": units,
+        "description": "Generated for benchmarks",
+        "is_working": True,
+    }
+
+
+def percentile(values: list[float], pct: float) -> float:
+    """Nearest-rank percentile (values in seconds → result in milliseconds)"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return round(ordered[rank] * 1000, 2)
+
+
+def latency_summary(values: list[float]) -> dict:
+    return {
+        "count": len(values),
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+    }
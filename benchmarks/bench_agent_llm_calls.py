@@ -0,0 +1,113 @@
+"""
+Benchmark: LLM calls per chat turn with AGENT_EXECUTION_MODE=llm vs. templated.
+
+    python -m benchmarks.bench_agent_llm_calls
+
+Runs the same scripted conversation (create with missing details, create, chat, modify,
+invalid modify, chat, generate) through ChatAgent.process in both modes. The model is replaced
+by a scripted client that counts chat/structured calls, so no API key or network is needed.
+Prints the calls per turn and the average per mode as JSON.
+"""
+import asyncio
+import json
+from uuid import uuid4
+
+from benchmarks._setup import use_temp_database, make_puzzle
+
+use_temp_database("agent_llm_calls")
+
+from app import models  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.database import Base, engine, SessionLocal  # noqa: E402
+from app.schemas import PuzzleCreate, PuzzleLLMResponse, PuzzleEditResponse  # noqa: E402
+import app.agents.chat_agent as chat_agent  # noqa: E402
+import app.agents.agent_tools as agent_tools  # noqa: E402
+import app.services.puzzle_services as puzzle_services  # noqa: E402
+
+PUZZLE = make_puzzle(node_count=12, unit_count=3, name="Ambush")
+MISSING = {"name": "Ambush", "game_mode": None, "node_count": None, "edge_count": None, "turns": None, "units": None}
+COMPLETE = {"name": "Ambush", "game_mode": "skirmish", "node_count": 12, "edge_count": 14, "turns": 4,
+            "units": [{"type": "Grunt", "faction": "enemy", "count": 2}, {"type": "Swordsman", "faction": "player", "count": 1}]}
+
+# (message, intent the LLM classifier answers, collect_info extraction, edit operations)
+CONVERSATION = [
+    ("Create a puzzle called Ambush", "create", MISSING, None),
+    ("skirmish, 12 nodes, 14 edges, 4 turns, 2 enemy grunts and 1 player swordsman", "create", COMPLETE, None),
+    ("What does the enemy do in turn 2?", "chat", None, None),
+    ("Move node 3 to 400, 200", "modify", None, [{"op": "move_node", "node": 3, "x": 400, "y": 200}]),
+    ("Remove node 99", "modify", None, [{"op": "remove_node", "node": 99}]),
+    ("Thanks!", "chat", None, None),
+]
+NEW_SESSION = [("Generate a random puzzle for me", "generate", None, None)]
+
+
+class ScriptedLLM:
+    """Answers every prompt of the agent from the current turn and counts the calls"""
+
+    def __init__(self):
+        self.calls = 0
+        self.turn = None
+        self.last_usage = None
+
+    async def chat(self, prompt: dict):
+        self.calls += 1
+        message, intent, collected, _ = self.turn
+        if "intent classifier" in prompt["system_prompt"]:
+            return intent
+        if "Extract puzzle generation parameters" in prompt["system_prompt"]:
+            return json.dumps(collected)
+        return f"Scripted answer to: {message}"
+
+    async def structured(self, prompt: dict, schema):
+        self.calls += 1
+        if schema is PuzzleEditResponse:
+            return PuzzleEditResponse(ops=self.turn[3] or [])
+        if schema is PuzzleLLMResponse:
+            return PuzzleLLMResponse(**{key: PUZZLE[key] for key in ("name", "nodes", "edges", "units", "coins", "description")})
+        moved = dict(PUZZLE, nodes=[dict(node, x=node["x"] + 10) for node in PUZZLE["nodes"]])
+        return schema(**moved)
+
+
+async def run_conversation(mode: str, llm: ScriptedLLM) -> list[dict]:
+    settings.AGENT_EXECUTION_MODE = mode
+    turns = []
+    for conversation in (CONVERSATION, NEW_SESSION):
+        db = SessionLocal()
+        try:
+            session = models.Session(id=uuid4(), topic_name=f"llm calls {mode}")
+            db.add(session)
+            db.commit()
+            agent = chat_agent.ChatAgent(db, str(session.id), "gpt-benchmark")
+            puzzle_id = None
+            for turn in conversation:
+                llm.turn, llm.calls = turn, 0
+                answer, puzzle_id = await agent.process(turn[0], puzzle_id)
+                turns.append({"message": turn[0], "llm_calls": llm.calls, "answer": str(answer)[:80]})
+        finally:
+            db.close()
+    return turns
+
+
+async def main():
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    puzzle_services.PuzzleServices(db).create_puzzle(PuzzleCreate(**PUZZLE))  # few shot example
+    db.close()
+
+    llm = ScriptedLLM()
+    for module in (chat_agent, agent_tools, puzzle_services):
+        module.get_llm = lambda model: llm
+
+    report = {}
+    for mode in ("llm", "templated"):
+        turns = await run_conversation(mode, llm)
+        report[mode] = {
+            "avg_llm_calls_per_turn": round(sum(turn["llm_calls"] for turn in turns) / len(turns), 2),
+            "max_llm_calls_per_turn": max(turn["llm_calls"] for turn in turns),
+            "turns": turns,
+        }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,83 @@
+"""
+Benchmark: per-turn cost of the agent conversation memory as sessions get longer.
+
+    python -m benchmarks.bench_agent_memory --turns 10 50 200 500
+
+Simulates turns of one user + one assistant message (~400 chars each) and compares
+  unbounded: messages list grows (operator.add), every node joins the whole history and slices it
+  window:    ConversationMemory window + rolling local summary, context rendered once per turn
+per session length: state bytes written with every checkpoint, context chars (~ prompt tokens / 4)
+and CPU time of preparing the context for one turn. No database or LLM needed, archived
+messages are only counted.
+Prints the numbers as JSON.
+"""
+import argparse
+import json
+import time
+
+from benchmarks._setup import use_temp_database
+
+use_temp_database("agent_memory")
+
+from app.core.config import settings  # noqa: E402
+from app.agents.agent_memory import window_messages, summarize_locally, render_context, WINDOW_KEY  # noqa: E402
+
+NODES_JOINING_HISTORY = 3  # intent, chat/collect, format_response used to join the history each turn
+
+
+def turn_messages(turn: int) -> list[dict]:
+    text = f"Turn {turn}: please move node {turn % 30} next to node {(turn + 1) % 30}. " + "Some more details. " * 18
+    return [{"role": "user", "content": text}, {"role": "assistant", "content": "Done. " + text}]
+
+
+def unbounded_turn(messages: list[dict]) -> tuple[list[dict], str]:
+    for _ in range(NODES_JOINING_HISTORY):
+        conversation = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+        conversation = conversation[-3000:]
+    return messages, conversation
+
+
+def window_turn(messages: list[dict], summary: str) -> tuple[list[dict], str, str]:
+    window = settings.MEMORY_WINDOW_MESSAGES
+    if len(messages) > window:
+        evicted, kept = messages[:-window], messages[-window:]
+        summary = summarize_locally(summary, evicted)
+        messages = window_messages(messages, {WINDOW_KEY: kept})
+    return messages, summary, render_context(summary, messages)
+
+
+def run(turns: int) -> dict:
+    unbounded, window, summary = [], [], ""
+    cpu_unbounded = cpu_window = 0.0
+    for turn in range(turns):
+        new = turn_messages(turn)
+        unbounded = unbounded + new
+        started = time.perf_counter()
+        _, context_unbounded = unbounded_turn(unbounded)
+        cpu_unbounded = time.perf_counter() - started
+
+        window = window_messages(window, new)
+        started = time.perf_counter()
+        window, summary, context_window = window_turn(window, summary)
+        cpu_window = time.perf_counter() - started
+
+    return {
+        "turns": turns,
+        "unbounded": {
+            "state_bytes": len(json.dumps({"messages": unbounded})),
+            "context_chars": len(context_unbounded),
+            "last_turn_cpu_us": round(cpu_unbounded * 1e6, 1),
+        },
+        "window": {
+            "state_bytes": len(json.dumps({"messages": window, "summary": summary, "conversation": context_window})),
+            "context_chars": len(context_window),
+            "last_turn_cpu_us": round(cpu_window * 1e6, 1),
+        },
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, nargs="*", default=[10, 50, 200, 500], help="session lengths")
+    parsed = parser.parse_args()
+    print(json.dumps([run(turns) for turns in parsed.turns], indent=2))
@@ -0,0 +1,126 @@
+"""
+Load test: latency of GET /puzzles/{id}/data while a big puzzle write is running.
+
+    python -m benchmarks.bench_async_db --nodes 400 --readers 20 --duration 10
+
+Runs the app in-process (ASGI transport) against a temp SQLite database and prints
+p50/p95/p99 of the reads as JSON in three phases: idle, during repeated PUT /puzzles/{id}
+(editor save) and during repeated POST /puzzles/chat turns that modify the puzzle
+(AgentTools.update_puzzle). The chat uses the fake LLM without latency, scripted to
+return the whole big puzzle, so every turn rewrites all nodes, edges and units.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks._setup import use_temp_database, make_puzzle, latency_summary
+
+use_temp_database("async_db")
+
+import httpx  # noqa: E402
+from uuid import uuid4, UUID  # noqa: E402
+
+from app import models  # noqa: E402
+from app.main import app  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.database import Base, engine, SessionLocal  # noqa: E402
+from app.llm.fake_client import add_rule  # noqa: E402
+
+CHAT_MODEL = "fake-fast"
+CHAT_MESSAGE = "Update the puzzle: move every node a bit to the right"
+
+
+async def read_loop(client: httpx.AsyncClient, puzzle_id: str, stop_at: float, latencies: list[float]):
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        response = await client.get(f"/puzzles/{puzzle_id}/data")
+        response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+
+async def save_loop(client: httpx.AsyncClient, puzzle_id: str, payload: dict, stop_at: float, latencies: list[float]):
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        response = await client.put(f"/puzzles/{puzzle_id}", json=payload)
+        if response.status_code >= 400:
+            raise RuntimeError(f"save failed: {response.status_code} {response.text}")
+        latencies.append(time.perf_counter() - started)
+
+
+async def chat_loop(client: httpx.AsyncClient, session_id: str, stop_at: float, latencies: list[float]):
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        response = await client.post("/puzzles/chat", json={"session_id": session_id, "content": CHAT_MESSAGE,
+                                                            "model": CHAT_MODEL})
+        if response.status_code >= 400:
+            raise RuntimeError(f"chat failed: {response.status_code} {response.text}")
+        latencies.append(time.perf_counter() - started)
+
+
+def chat_session(puzzle_id: str) -> str:
+    """Session linked to the puzzle, so chat turns modify it"""
+    db = SessionLocal()
+    try:
+        session = models.Session(id=uuid4(), topic_name="Async DB benchmark", puzzle_id=UUID(puzzle_id))
+        db.add(session)
+        db.commit()
+        return str(session.id)
+    finally:
+        db.close()
+
+
+async def run_phase(client, puzzle_id, payload, readers: int, duration: float, writer: str = None) -> dict:
+    stop_at = time.perf_counter() + duration
+    read_latencies, write_latencies = [], []
+    tasks = [read_loop(client, puzzle_id, stop_at, read_latencies) for _ in range(readers)]
+    if writer == "save":
+        tasks.append(save_loop(client, puzzle_id, payload, stop_at, write_latencies))
+    elif writer == "chat":
+        tasks.append(chat_loop(client, chat_session(puzzle_id), stop_at, write_latencies))
+    await asyncio.gather(*tasks)
+
+    result = {"reads": latency_summary(read_latencies)}
+    if writer:
+        result[{"save": "saves", "chat": "chat_turns"}[writer]] = latency_summary(write_latencies)
+    return result
+
+
+async def main(args):
+    Base.metadata.create_all(bind=engine)
+    payload = make_puzzle(node_count=args.nodes, unit_count=args.units)
+
+    # chat turns: modify intent, the model returns the whole big puzzle, summary rendered locally
+    settings.PUZZLE_MODIFY_MODE = "full"
+    settings.PUZZLE_PROMPT_FORMAT = "json"
+    settings.PUZZLE_CHANGE_SUMMARY = "local"
+    settings.FAKE_LLM_LATENCY = {CHAT_MODEL: "0"}
+    add_rule(r"extracts puzzle modification parameters", payload)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/puzzles/", json=payload, headers={"X-From-Chat": "true"})
+        response.raise_for_status()
+        puzzle_id = response.json()["puzzle_id"]
+
+        idle = await run_phase(client, puzzle_id, payload, args.readers, args.duration)
+        during_save = await run_phase(client, puzzle_id, payload, args.readers, args.duration, writer="save")
+        during_chat_update = await run_phase(client, puzzle_id, payload, args.readers, args.duration, writer="chat")
+
+    print(json.dumps({
+        "nodes": args.nodes,
+        "readers": args.readers,
+        "duration_seconds": args.duration,
+        "idle": idle,
+        "during_save": during_save,
+        "during_chat_update": during_chat_update,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=400, help="nodes of the saved puzzle")
+    parser.add_argument("--units", type=int, default=12, help="units of the saved puzzle")
+    parser.add_argument("--readers", type=int, default=20, help="concurrent /data readers")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per phase")
+    asyncio.run(main(parser.parse_args()))
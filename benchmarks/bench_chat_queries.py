@@ -0,0 +1,111 @@
+"""
+Benchmark: SQL statements per chat turn around the agent (POST /puzzles/chat).
+
+    python -m benchmarks.bench_chat_queries
+
+Counts the statements the chat router sends before and after the agent runs, for
+  old:     get_or_create_session, get_puzzle_id, get_serialized_puzzle_json, update_session_title
+  context: ChatContextLoader.load + ChatContext.finish
+in three cases: new session, existing session with its puzzle cached, and with a cold puzzle cache.
+The agent itself is left out (it's the same in both). Prints the counts and statements as JSON
+and fails if the context path needs more than one select for the session plus the puzzle selects.
+"""
+import asyncio
+import json
+from uuid import uuid4
+
+from benchmarks._setup import use_temp_database, make_puzzle
+
+use_temp_database("chat_queries")
+
+from sqlalchemy import event  # noqa: E402
+
+from app import models  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.database import Base, engine, SessionLocal  # noqa: E402
+from app.core.puzzle_cache import puzzle_graph_cache  # noqa: E402
+from app.schemas import PuzzleCreate  # noqa: E402
+from app.services import PuzzleServices, SessionService, ChatContextLoader  # noqa: E402
+
+MESSAGE = "Move node 3 a bit to the left"
+MODEL = "gpt-benchmark"
+
+
+class StatementLog:
+    def __init__(self):
+        self.statements = []
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(" ".join(statement.split())[:90])
+
+    def take(self) -> list[str]:
+        statements, self.statements = self.statements, []
+        return statements
+
+
+async def old_turn(session_id, puzzle_id):
+    db = SessionLocal()
+    try:
+        services = SessionService(db)
+        session_id = await services.get_or_create_session(session_id=session_id, user_message=MESSAGE, model=MODEL)
+        if services.get_puzzle_id(session_id=session_id):
+            await services.get_serialized_puzzle_json(session_id=session_id, model=MODEL)
+        # ... agent ...
+        if puzzle_id:
+            await services.update_session_title(puzzle_id=puzzle_id, session_id=session_id)
+    finally:
+        db.close()
+
+
+async def context_turn(session_id, puzzle_id):
+    db = SessionLocal()
+    try:
+        context = await ChatContextLoader(db).load(session_id=session_id, user_message=MESSAGE, model=MODEL)
+        # ... agent ...
+        await context.finish(puzzle_id)
+    finally:
+        db.close()
+
+
+async def main():
+    Base.metadata.create_all(bind=engine)
+    settings.SESSION_TITLE_MODE = "local"  # no LLM title
+
+    db = SessionLocal()
+    puzzle_id = PuzzleServices(db).create_puzzle(PuzzleCreate(**make_puzzle(node_count=30))).id
+    session = models.Session(id=uuid4(), topic_name="Benchmark Puzzle", puzzle_id=puzzle_id)
+    db.add(session)
+    db.commit()
+    session_id = session.id
+    db.close()
+
+    log = StatementLog()
+    cases = {
+        "new_session": (None, None, False),
+        "existing_session_cached_puzzle": (session_id, puzzle_id, False),
+        "existing_session_cold_puzzle": (session_id, puzzle_id, True),
+    }
+    report = {}
+    for case, (case_session, case_puzzle, cold) in cases.items():
+        report[case] = {}
+        for name, turn in (("old", old_turn), ("context", context_turn)):
+            puzzle_graph_cache.clear()
+            if not cold:
+                warm_db = SessionLocal()
+                PuzzleServices(warm_db).get_puzzle_graph(puzzle_id)
+                warm_db.close()
+            log.take()
+            await turn(case_session, case_puzzle)
+            statements = log.take()
+            report[case][name] = {"count": len(statements), "statements": statements}
+
+    print(json.dumps(report, indent=2))
+
+    # one select for the session, the rest is the puzzle graph on a cold cache
+    cached = report["existing_session_cached_puzzle"]["context"]["statements"]
+    assert len([s for s in cached if s.startswith("SELECT")]) == 1, cached
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
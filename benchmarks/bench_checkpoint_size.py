@@ -0,0 +1,103 @@
+"""
+Benchmark: LangGraph checkpoint bytes per chat turn with the puzzle copied into the state vs. a reference.
+
+    python -m benchmarks.bench_checkpoint_size --nodes 50 400 2000 --turns 5
+
+Two parts:
+  state:  serialized size of one agent state with "puzzle": [<puzzle JSON>] (old) and with
+          "puzzle_ref": {"id"} (now), times the checkpoints one turn writes
+          (input + memory, intent, tool node, format_response)
+  live:   chat turns through ChatAgent.process on a puzzle of each size with a scripted model,
+          measuring the bytes added to checkpointer.db per turn
+Prints both as JSON.
+"""
+import argparse
+import asyncio
+import json
+import sqlite3
+from uuid import uuid4
+
+from benchmarks._setup import use_temp_database, make_puzzle
+
+use_temp_database("checkpoint_size")
+
+from app import models  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.database import Base, engine, SessionLocal  # noqa: E402
+from app.core.puzzle_graph import PuzzleGraph  # noqa: E402
+from app.schemas import PuzzleCreate  # noqa: E402
+from app.agents.puzzle_reference import puzzle_reference  # noqa: E402
+import app.agents.chat_agent as chat_agent  # noqa: E402
+from benchmarks.bench_agent_llm_calls import ScriptedLLM  # noqa: E402
+
+CHECKPOINTS_PER_TURN = 5
+MESSAGES = [{"role": "user" if i % 2 == 0 else "assistant", "content": "Tell me about the enemy. " * 10} for i in range(12)]
+
+
+def serialized_size(state: dict) -> int:
+    try:
+        from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+        return len(JsonPlusSerializer().dumps_typed(state)[1])
+    except ImportError:
+        return len(json.dumps(state).encode())
+
+
+def state_sizes(node_count: int) -> dict:
+    graph = PuzzleGraph.from_create(PuzzleCreate(**make_puzzle(node_count=node_count, unit_count=8)), uuid4())
+    base = {"messages": MESSAGES, "model": "gpt-4o-mini", "session_id": str(uuid4()), "tool_result": [],
+            "current_puzzle_id": str(graph.id), "user_intent": "chat"}
+    old = serialized_size(dict(base, puzzle=[json.dumps(graph.to_llm_dict("gpt-4o-mini"))]))
+    new = serialized_size(dict(base, puzzle_ref=puzzle_reference(graph.id)))
+    return {"state_bytes_old": old, "state_bytes_now": new,
+            "turn_bytes_old": old * CHECKPOINTS_PER_TURN, "turn_bytes_now": new * CHECKPOINTS_PER_TURN}
+
+
+def checkpoint_bytes() -> int:
+    with sqlite3.connect(settings.CHECKPOINTS_URL) as conn:
+        tables = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+        total = 0
+        for table in tables:
+            columns = [row[1] for row in conn.execute(f"PRAGMA table_info({table})")]
+            total += sum(conn.execute(f"SELECT COALESCE(SUM(LENGTH({c})), 0) FROM {table}").fetchone()[0] for c in columns)
+        return total
+
+
+async def live_turn_bytes(node_count: int, turns: int) -> list[int]:
+    db = SessionLocal()
+    try:
+        from app.services import PuzzleServices
+        puzzle = PuzzleServices(db).create_puzzle(PuzzleCreate(**make_puzzle(node_count=node_count, unit_count=8)))
+        session = models.Session(id=uuid4(), topic_name="checkpoint size", puzzle_id=puzzle.id)
+        db.add(session)
+        db.commit()
+
+        agent = chat_agent.ChatAgent(db, str(session.id), "gpt-benchmark")
+        sizes = []
+        for _ in range(turns):
+            before = checkpoint_bytes()
+            await agent.process("Tell me about the enemy", puzzle.id)
+            sizes.append(checkpoint_bytes() - before)
+        return sizes
+    finally:
+        db.close()
+
+
+async def main(nodes: list[int], turns: int):
+    Base.metadata.create_all(bind=engine)
+    llm = ScriptedLLM()
+    llm.turn = ("Tell me about the enemy", "chat", None, None)
+    chat_agent.get_llm = lambda model: llm
+
+    report = []
+    for node_count in nodes:
+        live = await live_turn_bytes(node_count, turns)
+        report.append({"nodes": node_count, **state_sizes(node_count), "live_turn_bytes_now": live})
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, nargs="*", default=[50, 400, 2000], help="puzzle sizes")
+    parser.add_argument("--turns", type=int, default=5, help="live chat turns per size")
+    parsed = parser.parse_args()
+    asyncio.run(main(parsed.nodes, parsed.turns))
@@ -0,0 +1,62 @@
+"""
+Benchmark: read latency of the normalized tables vs. the graph_blob document.
+
+    python -m benchmarks.bench_document_storage --nodes 50 400 2000 --repeat 200
+
+Writes one puzzle per size with PUZZLE_STORAGE_MODE=document (so both representations exist),
+then loads it through both paths with the puzzle cache bypassed:
+  normalized: five column selects over puzzles/nodes/edges/units/paths/path_nodes
+  document:   one select of puzzles.graph_blob + decompress
+Each read includes the editor JSON serialization (what GET /puzzles/{id}/data does).
+Prints p50/p95/p99 per size and path as JSON.
+"""
+import argparse
+import json
+import os
+import time
+
+from benchmarks._setup import use_temp_database, make_puzzle, latency_summary
+
+use_temp_database("document_storage")
+os.environ["PUZZLE_STORAGE_MODE"] = "document"
+
+from app.core.database import Base, engine, SessionLocal  # noqa: E402
+from app.schemas import PuzzleCreate  # noqa: E402
+from app.services import PuzzleServices  # noqa: E402
+
+
+def measure(read, repeat: int) -> dict:
+    latencies = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        read()
+        latencies.append(time.perf_counter() - started)
+    return latency_summary(latencies)
+
+
+def bench_size(node_count: int, units: int, repeat: int) -> dict:
+    db = SessionLocal()
+    try:
+        services = PuzzleServices(db)
+        puzzle_id = services.create_puzzle(PuzzleCreate(**make_puzzle(node_count=node_count, unit_count=units))).id
+        blob_size = len(services._load_normalized_graph(puzzle_id).to_bytes())
+
+        return {
+            "nodes": node_count,
+            "document_bytes": blob_size,
+            "normalized": measure(lambda: services._load_normalized_graph(puzzle_id).to_editor_dict(), repeat),
+            "document": measure(lambda: services._load_document_graph(puzzle_id).to_editor_dict(), repeat),
+        }
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, nargs="*", default=[50, 400, 2000], help="puzzle sizes")
+    parser.add_argument("--units", type=int, default=12, help="units per puzzle")
+    parser.add_argument("--repeat", type=int, default=200, help="reads per path and size")
+    parsed = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    print(json.dumps([bench_size(n, parsed.units, parsed.repeat) for n in parsed.nodes], indent=2))
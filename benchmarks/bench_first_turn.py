@@ -0,0 +1,76 @@
+"""
+Benchmark: first-turn latency of a new chat session per SESSION_TITLE_MODE.
+
+    python -m benchmarks.bench_first_turn --title-latency 0.8 --agent-latency 1.5 --repeat 10
+
+Replays what POST /chat does for the first message of a session: ChatContextLoader.load, the agent
+answer (one model call of --agent-latency seconds) and ChatContext.finish, which waits up to
+--title-wait seconds (SESSION_TITLE_WAIT) for a background title. The model is a client that just
+sleeps, so the numbers show how the title call adds to (llm) or overlaps with (background) the agent
+answer. 'title' is the time until the LLM title is stored, which the sidebar picks up by polling.
+Prints p50/p95/p99 of the answer and the title per mode as JSON.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks._setup import use_temp_database, latency_summary
+
+use_temp_database("first_turn")
+
+from app.core.config import settings  # noqa: E402
+from app.core.database import Base, engine, SessionLocal  # noqa: E402
+import app.services.session_services as session_services  # noqa: E402
+from app.services import ChatContextLoader  # noqa: E402
+
+
+class SleepingLLM:
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    async def chat(self, prompt: dict):
+        await asyncio.sleep(self.latency)
+        return "Noble man builds a bridge ambush"
+
+
+async def first_turn(agent_llm: SleepingLLM) -> tuple[float, float]:
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        context = await ChatContextLoader(db).load(session_id=None, user_message="Create a bridge ambush puzzle",
+                                                   model="gpt-benchmark")
+        await agent_llm.chat({})  # agent answer
+        await context.finish()
+        answered = time.perf_counter() - started
+        while session_services.SessionService.titles_pending():
+            await asyncio.sleep(0.01)
+        return answered, time.perf_counter() - started
+    finally:
+        db.close()
+
+
+async def main(title_latency: float, agent_latency: float, repeat: int, title_wait: float):
+    Base.metadata.create_all(bind=engine)
+    session_services.get_llm = lambda model: SleepingLLM(title_latency)
+    agent_llm = SleepingLLM(agent_latency)
+    settings.SESSION_TITLE_WAIT = title_wait
+
+    report = {}
+    for mode in ("llm", "background", "local"):
+        settings.SESSION_TITLE_MODE = mode
+        turns = [await first_turn(agent_llm) for _ in range(repeat)]
+        report[mode] = {"answer": latency_summary([answer for answer, _ in turns]),
+                        "title": latency_summary([title for _, title in turns])}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--title-latency", type=float, default=0.8, help="seconds of the topic name LLM call")
+    parser.add_argument("--agent-latency", type=float, default=1.5, help="seconds of the agent answer")
+    parser.add_argument("--repeat", type=int, default=10, help="first turns per mode")
+    parser.add_argument("--title-wait", type=float, default=settings.SESSION_TITLE_WAIT,
+                        help="seconds the answer waits for a background title")
+    parsed = parser.parse_args()
+    asyncio.run(main(parsed.title_latency, parsed.agent_latency, parsed.repeat, parsed.title_wait))
@@ -0,0 +1,84 @@
+"""
+Benchmark: tail latency of LLM calls with and without request policies (deadline, retries, hedging).
+
+    python -m benchmarks.bench_llm_policy --calls 400 --concurrency 20 --latency lognormal:0.3,0.9
+    python -m benchmarks.bench_llm_policy --hedge-percentiles 90 95 99
+
+Sends --calls chat calls (--concurrency at a time) through get_llm to the fake provider, whose latency
+follows --latency (a heavy-tailed distribution, see app/llm/fake_client.py). Runs once without the policy
+layer and once per hedge percentile. The first --warmup calls of every run fill the latency window the
+hedge threshold is taken from and are not counted.
+Prints p50/p95/p99/max per run and the extra requests the hedges cost as JSON.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from benchmarks._setup import use_temp_database, latency_summary
+
+use_temp_database("llm_policy")
+
+from app.core.config import settings  # noqa: E402
+from app.core.metrics import llm_policy_attempts  # noqa: E402
+from app.llm import get_llm  # noqa: E402
+from app.llm import request_policy  # noqa: E402
+
+MODEL = "fake-policy"
+
+
+async def run(calls: int, concurrency: int, warmup: int) -> list[float]:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def call(number: int) -> float:
+        async with semaphore:
+            started = time.perf_counter()
+            await get_llm(MODEL).chat({"system_prompt": "You are a helpful assistant.",
+                                       "user_prompt": f"What does the enemy do in turn {number}?"})
+            return time.perf_counter() - started
+
+    for number in range(warmup):
+        await call(number)
+    return list(await asyncio.gather(*(call(number) for number in range(calls))))
+
+
+def hedges() -> float:
+    return llm_policy_attempts.value(policy="chat", kind="hedge")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=40, help="Calls before the measured ones (hedge threshold)")
+    parser.add_argument("--latency", default="lognormal:0.3,0.9", help="Fake LLM latency distribution")
+    parser.add_argument("--hedge-percentiles", type=float, nargs="+", default=[90, 95])
+    parser.add_argument("--timeout", type=float, default=10, help="attempt_timeout of the policy")
+    args = parser.parse_args()
+
+    settings.LLM_LEDGER_ENABLED = False
+    settings.FAKE_LLM_LATENCY = {MODEL: args.latency}
+
+    runs = {"no_policy": None} | {f"hedge_p{pct:g}": pct for pct in args.hedge_percentiles}
+    results = {}
+    for name, percentile in runs.items():
+        settings.LLM_POLICY_ENABLED = percentile is not None
+        settings.LLM_POLICIES = {"chat": {"deadline": args.timeout * 3, "attempt_timeout": args.timeout,
+                                          "retries": 2, "hedge_percentile": percentile}}
+        request_policy.model_latencies.clear()
+        hedged_before = hedges()
+        latencies = asyncio.run(run(args.calls, args.concurrency, args.warmup))
+        extra = hedges() - hedged_before
+        results[name] = {
+            **latency_summary(latencies),
+            "max_ms": round(max(latencies) * 1000, 2),
+            "hedged_requests": int(extra),
+            "extra_request_share": round(extra / (args.calls + args.warmup), 3),
+        }
+
+    print(json.dumps({"latency": args.latency, "calls": args.calls, "concurrency": args.concurrency,
+                      "runs": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
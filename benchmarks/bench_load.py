@@ -0,0 +1,231 @@
+"""
+Load test: concurrent users on the main routes, end to end through the app with the fake LLM.
+
+    python -m benchmarks.bench_load --users 20 --duration 30 --mix chat=3,editor=3,browse=3,generate=1
+    python -m benchmarks.bench_load --output new.json --baseline main.json --tolerance 0.2
+
+Runs the app in-process (ASGI transport) against a temp SQLite database. Every virtual user picks
+a scenario by weight, runs it and starts over until the time is up:
+
+  chat:      new session, then a conversation through POST /puzzles/chat (generate, chat, modify)
+  editor:    GET /puzzles/{id}/data and PUT /puzzles/{id} with moved nodes
+  browse:    list page GET /puzzles/ and the chat sidebar
+  generate:  POST /puzzles/generate and polling of the job until the puzzle is stored
+
+The LLM is the local fake provider (model "fake", latency from --llm-latency, see app/llm/fake_client.py).
+Prints throughput, errors and p50/p95/p99 per route as JSON. With --baseline the p95 and the throughput
+of every route are compared to an earlier report, regressions beyond --tolerance make the exit code 1.
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import sys
+import time
+
+from benchmarks._setup import use_temp_database, make_puzzle, latency_summary
+
+use_temp_database("load")
+
+import httpx  # noqa: E402
+
+from app.main import app  # noqa: E402
+from app.core.config import settings  # noqa: E402
+from app.core.database import Base, engine, add_missing_columns  # noqa: E402
+from app.services import generation_queue  # noqa: E402
+
+CONVERSATION = [
+    "Generate a random puzzle with 12 nodes, 2 enemies and 1 player",
+    "What does the enemy do in turn 2?",
+    "Move node 0 to 300, 200",
+    "Thanks!",
+]
+SESSION_ID = re.compile(r'session_id_input"\)\.value = "([0-9a-f\-]+)"')
+
+
+class LoadRun:
+    """Latencies and errors per route of one run"""
+
+    def __init__(self, client: httpx.AsyncClient, puzzles: list[dict], model: str, stop_at: float, seed: int):
+        self.client = client
+        self.puzzles = puzzles # {"id", "payload"} of the seeded puzzles
+        self.model = model
+        self.stop_at = stop_at
+        self.rng = random.Random(seed)
+        self.latencies: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+
+    async def request(self, route: str, method: str, url: str, **kwargs) -> httpx.Response | None:
+        """Send one request and file its latency under the route name (errors: status >= 400 or exception)"""
+        started = time.perf_counter()
+        try:
+            response = await self.client.request(method, url, **kwargs)
+        except Exception as e:
+            self.errors[route] = self.errors.get(route, 0) + 1
+            print(f"{route}: {type(e).__name__}: {e}", file=sys.stderr)
+            return None
+        self.latencies.setdefault(route, []).append(time.perf_counter() - started)
+        if response.status_code >= 400:
+            self.errors[route] = self.errors.get(route, 0) + 1
+            return None
+        return response
+
+    def puzzle(self) -> dict:
+        return self.rng.choice(self.puzzles)
+
+    async def chat(self):
+        session_id = ""
+        for message in CONVERSATION:
+            if time.perf_counter() >= self.stop_at:
+                return
+            response = await self.request("POST /puzzles/chat", "POST", "/puzzles/chat",
+                                          json={"session_id": session_id, "content": message, "model": self.model})
+            if response is None:
+                return
+            match = SESSION_ID.search(response.text)
+            session_id = match.group(1) if match else session_id
+
+    async def editor(self):
+        puzzle = self.puzzle()
+        await self.request("GET /puzzles/{id}/data", "GET", f"/puzzles/{puzzle['id']}/data")
+        payload = dict(puzzle["payload"], nodes=[dict(node, x=node["x"] + self.rng.randint(-20, 20))
+                                                 for node in puzzle["payload"]["nodes"]])
+        await self.request("PUT /puzzles/{id}", "PUT", f"/puzzles/{puzzle['id']}", json=payload)
+
+    async def browse(self):
+        await self.request("GET /puzzles/", "GET", "/puzzles/")
+        await self.request("GET /puzzles/chat/sidebar", "GET", "/puzzles/chat/sidebar")
+
+    async def generate(self):
+        config = {"name": f"Load {self.rng.randint(1, 10 ** 9)}", "model": self.model, "game_mode": "skirmish",
+                  "node_count": 12, "edge_count": 16, "turns": 4, "description": "",
+                  "units": [{"type": "Grunt", "faction": "enemy", "count": 2}, {"type": "Swordsman", "faction": "player", "count": 1}]}
+        started = time.perf_counter()
+        response = await self.request("POST /puzzles/generate", "POST", "/puzzles/generate", json=config)
+        if response is None:
+            return
+        job = response.json()
+
+        # the job outlives the request, poll until the worker stored the puzzle (or gave up)
+        while job.get("status") not in ("done", "failed") and time.perf_counter() < self.stop_at + 60:
+            await asyncio.sleep(0.1)
+            response = await self.request("GET /puzzles/generate/jobs/{id}", "GET", job["status_url"])
+            if response is None:
+                return
+            job = dict(response.json(), status_url=job["status_url"])
+        if job.get("status") == "done":
+            self.latencies.setdefault("generation job (queued → stored)", []).append(time.perf_counter() - started)
+        else:
+            self.errors["generation job (queued → stored)"] = self.errors.get("generation job (queued → stored)", 0) + 1
+
+    async def user(self, mix: dict[str, int]):
+        scenarios, weights = list(mix), list(mix.values())
+        while time.perf_counter() < self.stop_at:
+            scenario = self.rng.choices(scenarios, weights)[0]
+            await getattr(self, scenario)()
+
+
+def parse_mix(text: str) -> dict[str, int]:
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in ("chat", "editor", "browse", "generate"):
+            raise argparse.ArgumentTypeError(f"unknown scenario '{name}'")
+        mix[name.strip()] = int(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    """Routes whose p95 grew or whose throughput dropped by more than the tolerance"""
+    regressions = []
+    for route, now in report["routes"].items():
+        before = baseline.get("routes", {}).get(route)
+        if not before:
+            continue
+        if before["p95_ms"] and now["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {before['p95_ms']} → {now['p95_ms']} ms")
+        if before["requests_per_second"] and now["requests_per_second"] < before["requests_per_second"] * (1 - tolerance):
+            regressions.append(f"{route}: {before['requests_per_second']} → {now['requests_per_second']} req/s")
+    return regressions
+
+
+async def main(args) -> int:
+    Base.metadata.create_all(bind=engine)
+    add_missing_columns(engine)
+    settings.FAKE_LLM_LATENCY = {args.model: args.llm_latency}
+    settings.FAKE_LLM_SEED = args.seed
+    await generation_queue.start() # the ASGI transport doesn't run the lifespan
+
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120) as client:
+            puzzles = []
+            for i in range(args.puzzles):
+                payload = make_puzzle(node_count=args.nodes, unit_count=6, seed=i, name=f"Load Puzzle {i}")
+                response = await client.post("/puzzles/", json=payload, headers={"X-From-Chat": "true"})
+                response.raise_for_status()
+                puzzles.append({"id": response.json()["puzzle_id"], "payload": payload})
+
+            started = time.perf_counter()
+            runs = [LoadRun(client, puzzles, args.model, started + args.duration, seed=args.seed + user)
+                    for user in range(args.users)]
+            await asyncio.gather(*(run.user(args.mix) for run in runs))
+            elapsed = time.perf_counter() - started
+    finally:
+        await generation_queue.stop()
+
+    latencies: dict[str, list[float]] = {}
+    errors: dict[str, int] = {}
+    for run in runs:
+        for route, values in run.latencies.items():
+            latencies.setdefault(route, []).extend(values)
+        for route, count in run.errors.items():
+            errors[route] = errors.get(route, 0) + count
+
+    report = {
+        "users": args.users,
+        "duration_seconds": round(elapsed, 2),
+        "mix": args.mix,
+        "model": args.model,
+        "llm_latency": args.llm_latency,
+        "puzzle_nodes": args.nodes,
+        "routes": {
+            route: {**latency_summary(values), "errors": errors.get(route, 0),
+                    "requests_per_second": round(len(values) / elapsed, 2)}
+            for route, values in sorted(latencies.items())
+        },
+        "total_requests_per_second": round(sum(len(values) for values in latencies.values()) / elapsed, 2),
+    }
+    for route in errors.keys() - latencies.keys():
+        report["routes"][route] = {"count": 0, "errors": errors[route]}
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            report["regressions"] = compare(report, json.load(f), args.tolerance)
+        exit_code = 1 if report["regressions"] else 0
+
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    print(output)
+    return exit_code
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load")
+    parser.add_argument("--mix", type=parse_mix, default="chat=3,editor=3,browse=3,generate=1",
+                        help="scenario weights (chat, editor, browse, generate)")
+    parser.add_argument("--puzzles", type=int, default=10, help="puzzles seeded for the editor scenario")
+    parser.add_argument("--nodes", type=int, default=50, help="nodes per seeded puzzle")
+    parser.add_argument("--model", default="fake", help="fake model used by chat and generation")
+    parser.add_argument("--llm-latency", default="lognormal:0.8,0.5", help="fake LLM latency distribution, '0' for none")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the scenario choice and the fake answers")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--baseline", help="JSON report of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95/throughput change against the baseline")
+    sys.exit(asyncio.run(main(parser.parse_args())))
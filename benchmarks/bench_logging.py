@@ -0,0 +1,125 @@
+"""
+Benchmark: event loop stalls caused by logging, per logging mode.
+
+    python -m benchmarks.bench_logging --tasks 50 --duration 5 --sink-latency 2
+    python -m benchmarks.bench_logging --modes sync:text queued:json --sample-rate 0.1
+
+Every mode (LOG_MODE:LOG_FORMAT) runs --tasks coroutines that log like a chat turn does (agent state with
+the whole puzzle, the LLM response, short progress lines) while a probe task sleeps --probe-ms and measures
+how late it wakes up. The console stream is a sink that blocks --sink-latency ms per write (a slow terminal,
+pipe or log driver), in sync mode that block happens inside the event loop.
+Prints the probe lag p50/p95/p99/max, total stall time and the records written per mode as JSON.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+from benchmarks._setup import use_temp_database, make_puzzle, latency_summary
+
+tmp_dir = use_temp_database("logging")
+
+from app.core.config import settings  # noqa: E402
+from utils.logger_config import configure_logging, stop_logging, payload, sampled  # noqa: E402
+
+logger = logging.getLogger("app.agents.chat_agent")
+
+
+class SlowSink:
+    """Stream that blocks on every write like a full pipe would"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.writes = 0
+        self.bytes = 0
+
+    def write(self, text: str):
+        time.sleep(self.latency)
+        self.writes += 1
+        self.bytes += len(text)
+        return len(text)
+
+    def flush(self):
+        pass
+
+
+async def chat_turns(puzzle: dict, stop_at: float):
+    """Log lines of one chat turn after another, the LLM call is a short sleep"""
+    state = {"current_puzzle_id": "c0ffee", "collected_info": puzzle, "tool_result": [json.dumps(puzzle)]}
+    while time.perf_counter() < stop_at:
+        logger.info("Classify intent...")
+        logger.info("Current State: %s", payload(state), extra=sampled("agent_state"))
+        await asyncio.sleep(0.005)
+        logger.info("Llm response: %s", payload(puzzle["description"] * 50), extra=sampled("llm_response"))
+        logger.info("generated data: %s", payload(puzzle), extra=sampled("puzzle"))
+        await asyncio.sleep(0)
+
+
+async def probe(interval: float, stop_at: float) -> list[float]:
+    """How much later than requested the loop resumes a sleeping task"""
+    lags = []
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(max(0.0, time.perf_counter() - started - interval))
+    return lags
+
+
+async def run_mode(args, puzzle: dict) -> dict:
+    stop_at = time.perf_counter() + args.duration
+    tasks = [asyncio.create_task(chat_turns(puzzle, stop_at)) for _ in range(args.tasks)]
+    lags = await probe(args.probe_ms / 1000, stop_at)
+    await asyncio.gather(*tasks)
+    return {
+        "probe_lag": latency_summary(lags),
+        "max_lag_ms": round(max(lags, default=0) * 1000, 2),
+        "stall_ms": round(sum(lags) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", nargs="+", default=["sync:text", "sync:json", "queued:text", "queued:json"])
+    parser.add_argument("--tasks", type=int, default=50, help="Concurrent chat turns")
+    parser.add_argument("--duration", type=float, default=5, help="Seconds per mode")
+    parser.add_argument("--nodes", type=int, default=60, help="Nodes of the logged puzzle")
+    parser.add_argument("--sink-latency", type=float, default=1.0, help="ms every console write blocks")
+    parser.add_argument("--probe-ms", type=float, default=10, help="Sleep interval of the lag probe")
+    parser.add_argument("--payload-chars", type=int, default=settings.LOG_PAYLOAD_CHARS)
+    parser.add_argument("--sample-rate", type=float, default=settings.LOG_SAMPLE_RATE)
+    args = parser.parse_args()
+
+    os.chdir(tmp_dir) # error log file of the file handler
+    puzzle = make_puzzle(node_count=args.nodes)
+    settings.LOG_PAYLOAD_CHARS = args.payload_chars
+    settings.LOG_SAMPLE_RATE = args.sample_rate
+
+    stdout = sys.stdout
+    results = {}
+    for mode in args.modes:
+        settings.LOG_MODE, _, settings.LOG_FORMAT = mode.partition(":")
+        sink = SlowSink(args.sink_latency / 1000)
+        sys.stdout = sink # configure_logging binds the console handler to sys.stdout
+        try:
+            configure_logging()
+            result = asyncio.run(run_mode(args, puzzle))
+            stop_logging() # the listener writes what's still queued
+        finally:
+            sys.stdout = stdout
+        results[mode] = {**result, "records_written": sink.writes, "bytes_written": sink.bytes}
+
+    print(json.dumps({
+        "tasks": args.tasks,
+        "duration_s": args.duration,
+        "sink_latency_ms": args.sink_latency,
+        "payload_chars": args.payload_chars,
+        "sample_rate": args.sample_rate,
+        "modes": results,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
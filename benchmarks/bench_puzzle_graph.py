@@ -0,0 +1,95 @@
+"""
+Benchmark: PuzzleGraph vs. the ORM tree (memory + construction + serialization time).
+
+    python -m benchmarks.bench_puzzle_graph --nodes 50 400 2000 --repeat 20
+
+Stores one puzzle per size in a temp SQLite database, then loads it
+  orm:   PuzzleServices.get_puzzle_by_id (joinedload tree) + editor/LLM serialization from the ORM objects
+  graph: PuzzleServices.get_puzzle_graph (column selects → arrays) + PuzzleGraph serializers
+and prints retained memory (tracemalloc) and median times per size as JSON.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+import tracemalloc
+
+from benchmarks._setup import use_temp_database, make_puzzle
+
+use_temp_database("puzzle_graph")
+
+from app.core.database import Base, engine, SessionLocal  # noqa: E402
+from app.core.puzzle_graph import PuzzleGraph  # noqa: E402
+from app.schemas import PuzzleCreate  # noqa: E402
+from app.services import PuzzleServices  # noqa: E402
+
+
+def retained_bytes(build) -> int:
+    """Memory still allocated after build() returned (i.e. the size of the built object)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return after - before
+
+
+def median_ms(run, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def bench_size(node_count: int, units: int, repeat: int) -> dict:
+    db = SessionLocal()
+    try:
+        services = PuzzleServices(db)
+        puzzle_id = services.create_puzzle(PuzzleCreate(**make_puzzle(node_count=node_count, unit_count=units))).id
+
+        def load_orm():
+            db.expire_all()  # don't measure the identity map
+            return services.get_puzzle_by_id(puzzle_id)
+
+        def load_graph():
+            return services.get_puzzle_graph(puzzle_id)
+
+        orm_puzzle = load_orm()
+        graph = load_graph()
+
+        return {
+            "nodes": node_count,
+            "edges": graph.edge_count,
+            "units": graph.unit_count,
+            "orm": {
+                "retained_bytes": retained_bytes(load_orm),
+                "load_ms": median_ms(load_orm, repeat),
+                "to_graph_ms": median_ms(lambda: PuzzleGraph.from_orm(orm_puzzle), repeat),
+            },
+            "graph": {
+                "retained_bytes": retained_bytes(load_graph),
+                "load_ms": median_ms(load_graph, repeat),
+                "editor_json_ms": median_ms(graph.to_editor_dict, repeat),
+                "llm_json_ms": median_ms(lambda: graph.to_llm_dict(), repeat),
+                "validate_ms": median_ms(graph.validate, repeat),
+            },
+        }
+    finally:
+        db.close()
+
+
+async def main(args):
+    Base.metadata.create_all(bind=engine)
+    print(json.dumps([bench_size(n, args.units, args.repeat) for n in args.nodes], indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, nargs="*", default=[50, 400, 2000], help="puzzle sizes")
+    parser.add_argument("--units", type=int, default=12, help="units per puzzle")
+    parser.add_argument("--repeat", type=int, default=20, help="runs per measurement")
+    asyncio.run(main(parser.parse_args()))
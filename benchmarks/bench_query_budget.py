@@ -0,0 +1,112 @@
+"""
+Benchmark: SQL statements of the service paths that used to be N+1, checked against query budgets.
+
+    python -m benchmarks.bench_query_budget --puzzles 10 50
+
+For every --puzzles size the database is filled up to that many working puzzles (without sessions) and
+  startup_sessions:  SessionService.ensure_puzzles_have_sessions
+  few_shot_examples: PuzzleServices.get_serialized_examples on a cold puzzle cache
+  create_puzzle:     PuzzleServices.create_puzzle
+  load_graph:        PuzzleServices.get_puzzle_graph on a cold puzzle cache
+run inside query_budget(). The budgets don't depend on the number of puzzles, so a loop with one
+query per puzzle fails at the larger size. Prints statements and shapes per path as JSON, the exit code
+is 1 if a budget was exceeded.
+"""
+import argparse
+import asyncio
+import json
+import sys
+
+from benchmarks._setup import use_temp_database, make_puzzle
+
+use_temp_database("query_budget")
+
+from sqlalchemy import delete  # noqa: E402
+
+from app import models  # noqa: E402
+from app.core.database import Base, engine, SessionLocal  # noqa: E402
+from app.core.puzzle_cache import puzzle_graph_cache  # noqa: E402
+from app.core.query_budget import instrument_queries, query_budget, QueryBudgetExceeded  # noqa: E402
+from app.schemas import PuzzleCreate  # noqa: E402
+from app.services import PuzzleServices, SessionService  # noqa: E402
+
+# statements per path, independent of the number of puzzles
+BUDGETS = {
+    "startup_sessions": 3,   # orphan select + session insert (+ commit)
+    "few_shot_examples": 6,  # id select + puzzle, nodes, edges, units, paths
+    "create_puzzle": 8,      # one insert per table (+ commit)
+    "load_graph": 5,         # puzzle, nodes, edges, units, paths
+}
+
+
+def fill(count: int, nodes: int) -> list:
+    """Top the database up to count working puzzles and drop all sessions"""
+    db = SessionLocal()
+    try:
+        db.execute(delete(models.Session))
+        db.commit()
+        services = PuzzleServices(db)
+        existing = db.query(models.Puzzle).filter(models.Puzzle.game_mode == "skirmish").count()
+        for i in range(existing, count):
+            services.create_puzzle(PuzzleCreate(**make_puzzle(node_count=nodes, seed=i, name=f"Puzzle {i}")))
+        return [puzzle_id for (puzzle_id,) in db.query(models.Puzzle.id).all()]
+    finally:
+        db.close()
+
+
+async def run_paths(puzzle_ids: list, nodes: int) -> dict:
+    async def startup_sessions(db):
+        await SessionService(db).ensure_puzzles_have_sessions()
+
+    async def few_shot_examples(db):
+        puzzle_graph_cache.clear()
+        PuzzleServices(db).get_serialized_examples("skirmish")
+
+    async def create_puzzle(db):
+        PuzzleServices(db).create_puzzle(PuzzleCreate(**make_puzzle(node_count=nodes, name="Extra")))
+
+    async def load_graph(db):
+        puzzle_graph_cache.clear()
+        PuzzleServices(db).get_puzzle_graph(puzzle_ids[-1])
+
+    report = {}
+    for path in (startup_sessions, few_shot_examples, create_puzzle, load_graph):
+        db = SessionLocal()
+        budget = query_budget(BUDGETS[path.__name__], path.__name__)
+        try:
+            with budget as counter:
+                await path(db)
+            exceeded = False
+        except QueryBudgetExceeded:
+            exceeded = True
+        finally:
+            db.close()
+        report[path.__name__] = {
+            "statements": counter.count,
+            "budget": BUDGETS[path.__name__],
+            "exceeded": exceeded,
+            "shapes": {shape: count for shape, count in counter.shapes.most_common()},
+        }
+    return report
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--puzzles", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--nodes", type=int, default=20, help="Nodes per puzzle")
+    args = parser.parse_args()
+
+    Base.metadata.create_all(bind=engine)
+    instrument_queries(engine)
+
+    results = {}
+    for count in args.puzzles:
+        puzzle_ids = fill(count, args.nodes)
+        results[count] = await run_paths(puzzle_ids, args.nodes)
+
+    print(json.dumps(results, indent=2))
+    return 1 if any(path["exceeded"] for report in results.values() for path in report.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
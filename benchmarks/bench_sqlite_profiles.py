@@ -0,0 +1,89 @@
+"""
+Benchmark: read/write throughput of the puzzle endpoints per SQLite storage profile.
+
+    python -m benchmarks.bench_sqlite_profiles --profiles default tuned durable --duration 10
+
+Every profile runs in its own process (the engine is configured at import time) against a
+fresh temp database: concurrent writers POST /puzzles/, concurrent readers GET /puzzles/{id}/data.
+Prints requests/second and latency percentiles per profile as JSON.
+"""
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+
+def run_profile_in_subprocess(profile: str, args) -> dict:
+    env = dict(os.environ, DATABASE_PROFILE=profile)
+    env.pop("DATABASE_URL", None)  # each profile gets its own fresh temp database
+    command = [
+        sys.executable, "-m", "benchmarks.bench_sqlite_profiles", "--worker",
+        "--duration", str(args.duration), "--writers", str(args.writers),
+        "--readers", str(args.readers), "--nodes", str(args.nodes),
+    ]
+    output = subprocess.run(command, env=env, check=True, capture_output=True, text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+async def worker(args) -> dict:
+    from benchmarks._setup import use_temp_database, make_puzzle, latency_summary
+    use_temp_database("sqlite_profile")
+
+    import httpx
+    from app.main import app
+    from app.core.config import settings
+    from app.core.database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    payload = make_puzzle(node_count=args.nodes)
+    write_latencies, read_latencies = [], []
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/puzzles/", json=payload, headers={"X-From-Chat": "true"})
+        response.raise_for_status()
+        puzzle_id = response.json()["puzzle_id"]
+        stop_at = time.perf_counter() + args.duration
+
+        async def write_loop():
+            while time.perf_counter() < stop_at:
+                started = time.perf_counter()
+                r = await client.post("/puzzles/", json=payload, headers={"X-From-Chat": "true"})
+                r.raise_for_status()
+                write_latencies.append(time.perf_counter() - started)
+
+        async def read_loop():
+            while time.perf_counter() < stop_at:
+                started = time.perf_counter()
+                r = await client.get(f"/puzzles/{puzzle_id}/data")
+                r.raise_for_status()
+                read_latencies.append(time.perf_counter() - started)
+
+        await asyncio.gather(*[write_loop() for _ in range(args.writers)], *[read_loop() for _ in range(args.readers)])
+
+    return {
+        "profile": settings.DATABASE_PROFILE,
+        "writes_per_second": round(len(write_latencies) / args.duration, 2),
+        "reads_per_second": round(len(read_latencies) / args.duration, 2),
+        "writes": latency_summary(write_latencies),
+        "reads": latency_summary(read_latencies),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", nargs="*", default=["default", "tuned", "durable"])
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per profile")
+    parser.add_argument("--writers", type=int, default=2, help="concurrent POST /puzzles/ loops")
+    parser.add_argument("--readers", type=int, default=8, help="concurrent GET /puzzles/{id}/data loops")
+    parser.add_argument("--nodes", type=int, default=50, help="nodes per written puzzle")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parsed = parser.parse_args()
+
+    if parsed.worker:
+        print(json.dumps(asyncio.run(worker(parsed))))
+    else:
+        print(json.dumps([run_profile_in_subprocess(profile, parsed) for profile in parsed.profiles], indent=2))
@@ -1,8 +1,149 @@
+import atexit
+import json
 import logging.config
+import logging.handlers
+import queue
 import sys
+import threading
+from datetime import datetime, timezone
+
+# attributes every LogRecord has, everything else came in with extra={...}
+_RECORD_FIELDS = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+class JsonFormatter(logging.Formatter):
+    """ One JSON object per line: time, level, logger, message, trace id, extras and the traceback"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith("_"):
+                data[key] = value if isinstance(value, (str, int, float, bool, type(None))) else str(value)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exception"] = record.exc_text
+        if record.stack_info:
+            data["stack"] = record.stack_info
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class Payload:
+    """
+    Size-capped log argument, rendered only when the record is written:
+    logger.info("State: %s", payload(state)) costs nothing when the record is filtered or sampled out.
+    """
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value, limit: int):
+        self.value = value
+        self.limit = limit
+
+    def __str__(self):
+        return clip(self.value if isinstance(self.value, str) else repr(self.value), self.limit)
+
+
+def clip(text: str, limit: int) -> str:
+    if limit and len(text) > limit:
+        return f"{text[:limit]}… (+{len(text) - limit} chars)"
+    return text
+
+
+def payload(value, limit: int | None = None) -> Payload:
+    """ Wrap a big log argument (state, LLM response, puzzle), cut to LOG_PAYLOAD_CHARS"""
+    if limit is None:
+        from app.core.config import settings
+        limit = settings.LOG_PAYLOAD_CHARS
+    return Payload(value, limit)
+
+
+def sampled(key: str) -> dict:
+    """ extra= of a verbose hot-path log, only LOG_SAMPLE_RATE of them is written: logger.info(..., extra=sampled("agent_state"))"""
+    return {"sample": key}
+
+
+class SampleFilter(logging.Filter):
+    """ Keep every n-th record per sample key (1 / LOG_SAMPLE_RATE), records without a key always pass"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.every = 0 if rate <= 0 else max(1, round(1 / rate))
+        self._counts: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "sample", None)
+        if key is None:
+            return True
+        if not self.every:
+            return False
+        with self._lock:
+            count = self._counts.get(key, 0)
+            self._counts[key] = count + 1
+        return count % self.every == 0
+
+
+class ContextFilter(logging.Filter):
+    """ Add the id of the current request trace (x-trace-id header, /debug/traces) to the record"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        from app.core.tracing import current_trace
+        trace = current_trace.get()
+        if trace is not None:
+            record.trace_id = trace.id
+        return True
+
+
+class CappedQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that renders the message (cut to LOG_PAYLOAD_CHARS) in the calling thread and keeps
+    the traceback apart, so the listener's handlers can still format it as text or JSON.
+    """
+
+    def __init__(self, log_queue, max_chars: int):
+        super().__init__(log_queue)
+        self.max_chars = max_chars
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = logging.makeLogRecord(vars(record))
+        record.msg = clip(record.getMessage(), self.max_chars)
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class CapFilter(logging.Filter):
+    """ Cut the rendered message to max_chars (sync mode, the queue handler does it while preparing)"""
+
+    def __init__(self, max_chars: int):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        if self.max_chars and len(message) > self.max_chars:
+            record.msg, record.args = clip(message, self.max_chars), None
+        return True
 
 
 def configure_logging():
+    """
+    LOG_MODE "sync": console and file handlers write in the logging thread (the event loop for most logs).
+    LOG_MODE "queued": loggers only put records on a queue, a QueueListener thread does the writing.
+    LOG_FORMAT "json" switches both handlers to JSON lines.
+    """
+    from app.core.config import settings
+
+    formatter = "json" if settings.LOG_FORMAT == "json" else "standard"
     logging_config = {
         "version": 1,
         "disable_existing_loggers": False,
@@ -14,24 +155,31 @@ def configure_logging():
                 "datefmt": "%Y-%m-%d %H:%M:%S"
             },
             "json": {
-                # For production, you might want a JSON formatter class here
-                # But standard string formatting is often sufficient for simple apps
-                "format": "%(asctime)s %(levelname)s %(message)s"
+                "()": JsonFormatter,
             },
         },
 
+        # Filters: applied before a record is formatted
+        "filters": {
+            "sample": {"()": SampleFilter, "rate": settings.LOG_SAMPLE_RATE},
+            "cap": {"()": CapFilter, "max_chars": settings.LOG_PAYLOAD_CHARS},
+            "context": {"()": ContextFilter},
+        },
+
         # Handlers: Where the logs go
         "handlers": {
             "console": {
                 "level": "INFO",
                 "class": "logging.StreamHandler",
-                "formatter": "standard",
+                "formatter": formatter,
+                "filters": ["sample", "cap", "context"],
                 "stream": sys.stdout,
             },
             "file": {
                 "level": "ERROR",
                 "class": "logging.handlers.RotatingFileHandler",
-                "formatter": "standard",
+                "formatter": formatter,
+                "filters": ["cap", "context"],
                 "filename": "app_errors.log",
                 "maxBytes": 10485760,  # 10MB
                 "backupCount": 5,
@@ -53,4 +201,42 @@ def configure_logging():
         }
     }
 
-    logging.config.dictConfig(logging_config)
\ No newline at end of file
+    stop_logging()
+    logging.config.dictConfig(logging_config)
+
+    if settings.LOG_MODE == "queued":
+        _start_listener(settings)
+
+
+def _start_listener(settings):
+    """ Move the console and file handlers behind one queue, written by a QueueListener thread"""
+    global _listener
+    root = logging.getLogger()
+    handlers = list(root.handlers)
+    for handler in handlers:
+        # sampling and context run on the caller side (contextvars), capping in CappedQueueHandler.prepare
+        handler.filters = []
+
+    queue_handler = CappedQueueHandler(queue.SimpleQueue(), settings.LOG_PAYLOAD_CHARS)
+    queue_handler.addFilter(SampleFilter(settings.LOG_SAMPLE_RATE))
+    queue_handler.addFilter(ContextFilter())
+    root.handlers = [queue_handler]
+
+    # SQL warnings go through the same queue (and, from ERROR on, to the error file like everything else)
+    sql_logger = logging.getLogger("sqlalchemy.engine")
+    sql_logger.handlers = []
+    sql_logger.propagate = True
+
+    _listener = logging.handlers.QueueListener(queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging():
+    """ Write the queued records and stop the listener thread (no-op in sync mode)"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)